@@ -0,0 +1,235 @@
+"""
+Read-only JSON API, version 1.
+
+/api/v1/projects streams its output. Rows are read in keyset-paginated
+batches with .iterator() and serialized as they go, so exporting the whole
+catalog needs as much memory as a single batch. Pass ?limit= to get pages
+instead, each with the cursor of the next one.
+
+Every endpoint takes ?fields= with a comma-separated subset of its fields.
+Only the columns behind the selected fields are read, and the aggregates
+over pledges cost a query of their own and are skipped when not selected.
+"""
+import json
+
+from app import rollups
+from app.exceptions import BadRequestException, InvalidCursorException
+from app.models import Pledge, Project, RewardTier
+from app.pagination import after, decode_cursor, encode_cursor
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.urlresolvers import reverse
+from django.db.models import Avg, Count, Max, Min, Sum
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
+
+BATCH_SIZE = 500
+ORDERING = ['id']
+
+# Every status but drafts, by the name used in ?status=
+STATUSES = {name.lower(): value for value, name in Project.PROJECT_STATUS if value != Project.STATUS_DRAFT}
+
+# Field -> columns of Project it is computed from
+PROJECT_FIELDS = {
+    'id': ['id'],
+    'url': ['id'],
+    'title': ['title'],
+    'description': ['description'],
+    'status': ['status'],
+    'currency': ['currency'],
+    'goal': ['goal'],
+    'published_on': ['published_on'],
+    'finishes_on': ['finishes_on'],
+    'cover_image': ['cover_image'],
+    'pledged_total': ['pledged_total'],
+    'backer_count': ['backer_count'],
+    'percentage_funded': ['pledged_total', 'goal'],
+    'reward_tiers': ['id'],  # plus a query per batch
+}
+
+STATS_FIELDS = ['backer_count', 'pledged_total', 'average_pledge', 'largest_pledge', 'first_pledge_on',
+                'last_pledge_on', 'reward_tiers']
+# Aggregated over the project's pledges, the other stats are stored on the project
+PLEDGE_AGGREGATES = {
+    'average_pledge': Avg('amount'),
+    'largest_pledge': Max('amount'),
+    'first_pledge_on': Min('created_on'),
+    'last_pledge_on': Max('created_on'),
+}
+
+# Days of ?days= in a funding chart
+FUNDING_DAYS = 60
+MAX_FUNDING_DAYS = 366
+
+STATUS_NAMES = {value: name.lower() for value, name in Project.PROJECT_STATUS}
+CURRENCY_CODES = {Project.CURRENCY_USD: 'USD', Project.CURRENCY_EUR: 'EUR', Project.CURRENCY_CAD: 'CAD'}
+
+
+def error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def selected_fields(request, available):
+    """The fields chosen with ?fields=, in the order of `available`. All of them by default."""
+    requested = request.GET.get('fields')
+    if not requested:
+        return list(available)
+    requested = set(requested.split(','))
+    unknown = requested.difference(available)
+    if unknown:
+        raise BadRequestException('Unknown fields: {}'.format(', '.join(sorted(unknown))))
+    return [field for field in available if field in requested]
+
+
+def reward_tiers_by_project(project_ids):
+    tiers = {}
+    queryset = RewardTier.objects.filter(project__in=project_ids).order_by('minimum_amount', 'id')
+    for tier in queryset.values('id', 'project', 'description', 'minimum_amount', 'quantity', 'claimed'):
+        tier['backer_count'] = tier.pop('claimed')
+        tier['remaining'] = None if tier['quantity'] is None else max(tier['quantity'] - tier['backer_count'], 0)
+        tiers.setdefault(tier.pop('project'), []).append(tier)
+    return tiers
+
+
+def serialize_projects(request, rows, fields):
+    """Turn rows of Project.values() into API representations with `fields`."""
+    tiers = reward_tiers_by_project([row['id'] for row in rows]) if 'reward_tiers' in fields else {}
+    for row in rows:
+        data = {}
+        for field in fields:
+            if field == 'url':
+                data[field] = request.build_absolute_uri(reverse('view_project', args=[row['id']]))
+            elif field == 'status':
+                data[field] = STATUS_NAMES[row['status']]
+            elif field == 'currency':
+                data[field] = CURRENCY_CODES[row['currency']]
+            elif field == 'cover_image':
+                cover_image = row['cover_image']
+                data[field] = request.build_absolute_uri(default_storage.url(cover_image)) if cover_image else None
+            elif field == 'percentage_funded':
+                data[field] = row['pledged_total'] / row['goal'] * 100
+            elif field == 'reward_tiers':
+                data[field] = tiers.get(row['id'], [])
+            else:
+                data[field] = row[field]
+        yield data
+
+
+def project_columns(fields):
+    return sorted({column for field in fields for column in PROJECT_FIELDS[field]} | {'id'})
+
+
+def stream_projects(request, queryset, fields, start=None, limit=None):
+    """
+    Yield the JSON of {"results": [...], "next": cursor} piece by piece,
+    reading `queryset` in batches that start after the keyset `start`.
+    """
+    encoder = DjangoJSONEncoder()
+    columns = project_columns(fields)
+    yield '{"results": ['
+
+    separator = ''
+    remaining = limit
+    next_cursor = None
+    while remaining is None or remaining > 0:
+        batch = queryset.order_by(*ORDERING)
+        if start:
+            batch = batch.filter(after(ORDERING, start))
+        size = BATCH_SIZE if remaining is None else min(BATCH_SIZE, remaining)
+        # One extra row tells whether there's more after the last page
+        rows = list(batch.values(*columns)[:size + 1].iterator())
+        more = len(rows) > size
+        rows = rows[:size]
+
+        yield separator + ', '.join(encoder.encode(data) for data in serialize_projects(request, rows, fields))
+        separator = ', ' if rows else separator
+        if not more:
+            break
+        start = [rows[-1][name] for name in ORDERING]
+        if remaining is not None:
+            remaining -= len(rows)
+            if remaining == 0:
+                next_cursor = encode_cursor(start)
+
+    yield '], "next": {}}}'.format(json.dumps(next_cursor))
+
+
+@require_GET
+def projects(request):
+    """Every published project with the status in ?status= (active by default), oldest first."""
+    try:
+        fields = selected_fields(request, PROJECT_FIELDS)
+        statuses = request.GET.get('status', 'active').split(',')
+        if not set(statuses) <= set(STATUSES):
+            raise BadRequestException('Unknown status, use one of: {}'.format(', '.join(sorted(STATUSES))))
+        limit = request.GET.get('limit')
+        if limit is not None:
+            if not limit.isdigit() or int(limit) < 1:
+                raise BadRequestException('limit must be a positive number')
+            limit = int(limit)
+        cursor = request.GET.get('cursor')
+        start = decode_cursor(Project, ORDERING, cursor) if cursor else None
+    except (BadRequestException, InvalidCursorException) as e:
+        return error(str(e))
+
+    queryset = Project.objects.filter(status__in=[STATUSES[status] for status in statuses])
+    return StreamingHttpResponse(
+        stream_projects(request, queryset, fields, start, limit),
+        content_type='application/json',
+    )
+
+
+def published():
+    return Project.objects.exclude(status=Project.STATUS_DRAFT)
+
+
+@require_GET
+def project(request, id):
+    try:
+        fields = selected_fields(request, PROJECT_FIELDS)
+    except BadRequestException as e:
+        return error(str(e))
+    row = get_object_or_404(published().values(*project_columns(fields)), pk=id)
+    return JsonResponse(next(serialize_projects(request, [row], fields)))
+
+
+@require_GET
+def pledge_stats(request, id):
+    """Public statistics over the pledges of a project. Individual pledges stay private."""
+    try:
+        fields = selected_fields(request, STATS_FIELDS)
+    except BadRequestException as e:
+        return error(str(e))
+    project = get_object_or_404(published(), pk=id)
+
+    data = {'project': project.pk}
+    data.update({field: getattr(project, field) for field in ['backer_count', 'pledged_total'] if field in fields})
+    aggregates = {field: PLEDGE_AGGREGATES[field] for field in fields if field in PLEDGE_AGGREGATES}
+    if aggregates:
+        data.update(Pledge.objects.filter(project=project).aggregate(**aggregates))
+    if 'reward_tiers' in fields:
+        tiers = project.reward_tiers.annotate(backer_count=Count('pledges'), pledged_total=Sum('pledges__amount'))
+        tiers = tiers.order_by('minimum_amount', 'id').values('id', 'minimum_amount', 'backer_count', 'pledged_total')
+        data['reward_tiers'] = [dict(tier, pledged_total=tier['pledged_total'] or 0) for tier in tiers]
+    return JsonResponse(data)
+
+
+@require_GET
+def funding(request, id):
+    """
+    What the project raised on each of the last ?days= days, oldest first,
+    and its running total. Read from the daily rollups, one row per day.
+    """
+    days = request.GET.get('days', str(FUNDING_DAYS))
+    if not days.isdigit() or not 1 <= int(days) <= MAX_FUNDING_DAYS:
+        return error('days must be a number from 1 to {}'.format(MAX_FUNDING_DAYS))
+    project = get_object_or_404(published().only('id', 'pledged_total'), pk=id)
+
+    return JsonResponse({
+        'project': project.pk,
+        'days': [
+            {'day': day, 'amount': amount, 'count': count, 'cumulative': cumulative}
+            for day, amount, count, cumulative in rollups.chart(project, int(days))
+        ],
+    })
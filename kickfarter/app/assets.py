@@ -0,0 +1,114 @@
+"""
+Fingerprinted, precompressed static files.
+
+`manage.py collectstatic` stores every file under a name containing a hash
+of its content (bootstrap.min.css -> bootstrap.min.0123456789ab.css) and
+writes a gzipped sibling (.gz) of everything worth compressing.
+
+PrecompressedStaticFiles is WSGI middleware serving STATIC_ROOT in front
+of Django. It picks the .gz variant when the client accepts it, hands the
+open file to the server's wsgi.file_wrapper (sendfile() where supported)
+and lets browsers cache fingerprinted files forever.
+"""
+import gzip
+import io
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+from urllib.parse import unquote
+from wsgiref.util import FileWrapper
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.eot', '.ttf', '.html', '.txt', '.json', '.xml', '.map')
+
+# The suffix ManifestStaticFilesStorage gives fingerprinted names
+FINGERPRINT = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=60'
+
+BLOCK_SIZE = 64 * 1024
+
+mimetypes.add_type('image/svg+xml', '.svg')
+mimetypes.add_type('application/font-woff', '.woff')
+mimetypes.add_type('font/woff2', '.woff2')
+mimetypes.add_type('application/vnd.ms-fontobject', '.eot')
+
+
+def compress(path):
+    """Write `path`.gz if that is smaller than `path`. Returns whether it did."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    buffer = io.BytesIO()
+    # mtime=0 so the output only depends on the input
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9, mtime=0) as f:
+        f.write(data)
+    if buffer.tell() >= len(data):
+        return False
+    with open(path + '.gz', 'wb') as f:
+        f.write(buffer.getvalue())
+    return True
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if not dry_run and not isinstance(processed, Exception):
+                for stored in {name, hashed_name}:
+                    if stored and stored.endswith(COMPRESSIBLE_EXTENSIONS):
+                        compress(self.path(stored))
+            yield name, hashed_name, processed
+
+    def stored_name(self, name):
+        # Before the first collectstatic there's nothing to fingerprint, serve the original
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+
+class PrecompressedStaticFiles:
+    def __init__(self, application, root=None, prefix=None):
+        self.application = application
+        self.root = os.path.realpath(root or settings.STATIC_ROOT)
+        self.prefix = prefix or settings.STATIC_URL
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD') or not path.startswith(self.prefix):
+            return self.application(environ, start_response)
+
+        name = unquote(path[len(self.prefix):])
+        full_path = os.path.realpath(os.path.join(self.root, name))
+        if not full_path.startswith(self.root + os.sep) or not os.path.isfile(full_path):
+            return self.application(environ, start_response)
+        return self.serve(environ, start_response, full_path)
+
+    def serve(self, environ, start_response, path):
+        content_type, _ = mimetypes.guess_type(path)
+        headers = [
+            ('Content-Type', content_type or 'application/octet-stream'),
+            ('Cache-Control', IMMUTABLE_CACHE_CONTROL if FINGERPRINT.search(path) else DEFAULT_CACHE_CONTROL),
+        ]
+        if path.endswith(COMPRESSIBLE_EXTENSIONS):
+            headers.append(('Vary', 'Accept-Encoding'))
+            if 'gzip' in environ.get('HTTP_ACCEPT_ENCODING', '') and os.path.isfile(path + '.gz'):
+                path += '.gz'
+                headers.append(('Content-Encoding', 'gzip'))
+
+        stat = os.stat(path)
+        etag = '"{:x}-{:x}"'.format(int(stat.st_mtime), stat.st_size)
+        headers += [('ETag', etag), ('Last-Modified', formatdate(stat.st_mtime, usegmt=True))]
+
+        if environ.get('HTTP_IF_NONE_MATCH') == etag:
+            start_response('304 Not Modified', headers)
+            return []
+
+        headers.append(('Content-Length', str(stat.st_size)))
+        start_response('200 OK', headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        file_wrapper = environ.get('wsgi.file_wrapper', FileWrapper)
+        return file_wrapper(open(path, 'rb'), BLOCK_SIZE)
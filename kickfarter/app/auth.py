@@ -0,0 +1,35 @@
+"""
+Authentication backend that keeps logged in users in the cache.
+
+AuthenticationMiddleware looks up the user of every authenticated request
+by id. This backend answers that from the cache and only queries the
+database on a miss. A user's entry is deleted whenever the user is saved
+or deleted (see app/signals.py), which includes changing the password,
+so the cache never serves a user older than their last save. That only
+holds if USER_CACHE is shared by every process, otherwise the deletion
+never reaches the other workers.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+
+
+def user_key(user_id):
+    return 'user:{}'.format(user_id)
+
+
+def forget(user_id):
+    """Drop the cached user, the next request will read it from the database again."""
+    caches[settings.USER_CACHE].delete(user_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        cache = caches[settings.USER_CACHE]
+        key = user_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, settings.USER_CACHE_TIMEOUT)
+        return user
@@ -0,0 +1,194 @@
+"""
+Synthetic data and latency measurements for the benchmark_views command.
+
+The generated data is skewed the way real crowdfunding data is: a few
+creators run most of the projects, a few projects get most of the
+pledges and a few backers back a lot of projects.
+"""
+import contextlib
+import datetime
+import io
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from app import trending
+from app.models import Pledge, Project, RewardTier, User
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+WORDS = (
+    'solar toaster moon boots garden gnome army smart fork cat backpack retro console '
+    'vegan leather drone umbrella bluetooth sock board game comic book card deck'
+).split()
+
+
+@contextlib.contextmanager
+def throwaway_database(wal=False):
+    """
+    Point the default connection at a freshly migrated SQLite file for the
+    duration of the block and delete it afterwards. A file rather than the
+    usual in-memory test database, so other threads get their own connections.
+    """
+    handle, path = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(handle)
+    connection.settings_dict.setdefault('TEST', {})['NAME'] = path
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        if wal:
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=WAL')
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def _skewed_index(rng, n, skew=1.2):
+    """Index in range(n), drawn so low indexes are much more likely (Zipf-like)."""
+    return min(int(rng.paretovariate(skew)) - 1, n - 1)
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def generate(num_projects, users_per_project=5, pledges_per_project=20, tiers_per_project=3, seed=0):
+    """Fill the database with synthetic users, projects, reward tiers and pledges."""
+    rng = random.Random(seed)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    num_users = max(num_projects * users_per_project, 2)
+
+    User.objects.bulk_create(User(email='user{}@benchmark.invalid'.format(i)) for i in range(num_users))
+    user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+
+    statuses = [Project.STATUS_ACTIVE] * 8 + [Project.STATUS_DRAFT, Project.STATUS_SUCCESSFUL]
+    projects = []
+    for i in range(num_projects):
+        project = Project(
+            title=_text(rng, 3).capitalize(),
+            description=_text(rng, 40),
+            goal=rng.choice([500, 1000, 5000, 10000, 50000]),
+            status=rng.choice(statuses),
+            created_by_id=user_ids[_skewed_index(rng, num_users)],
+        )
+        if project.status != Project.STATUS_DRAFT:
+            project.published_on = now - datetime.timedelta(days=rng.uniform(0, Project.DEFAULT_DURATION))
+            project.finishes_on = project.finished_on
+        projects.append(project)
+    Project.objects.bulk_create(projects)
+    projects = list(Project.objects.order_by('pk').values_list('pk', 'created_by', 'status'))
+
+    RewardTier.objects.bulk_create(
+        RewardTier(project_id=pk, description=_text(rng, 10), minimum_amount=10 * (tier + 1) ** 2)
+        for pk, _, _ in projects for tier in range(tiers_per_project)
+    )
+
+    # Popular projects are spread over the id range so listings see them too
+    popularity = list(range(len(projects)))
+    rng.shuffle(popularity)
+    backed = set()
+    pledges = []
+    for _ in range(num_projects * pledges_per_project):
+        project_id, created_by, status = projects[popularity[_skewed_index(rng, len(projects))]]
+        user_id = user_ids[_skewed_index(rng, num_users, skew=0.8)]
+        if status == Project.STATUS_DRAFT or user_id == created_by or (user_id, project_id) in backed:
+            continue
+        backed.add((user_id, project_id))
+        pledges.append(Pledge(
+            project_id=project_id,
+            user_id=user_id,
+            amount=round(rng.lognormvariate(3.5, 1), 2),
+            created_on=now - datetime.timedelta(hours=rng.expovariate(1 / 48)),
+        ))
+    Pledge.objects.bulk_create(pledges, batch_size=500)
+
+    call_command('rebuild_funding_totals', stdout=io.StringIO())
+    call_command('rebuild_funding_rollup', stdout=io.StringIO())
+    trending.recompute()
+
+
+def scenarios():
+    """(name, user, url) of every page to measure. `user` is None for anonymous requests."""
+    active = Project.objects.active().order_by('-backer_count').first()
+    owner = Project.objects.exclude(status=Project.STATUS_DRAFT).order_by('-backer_count').first()
+    backer = User.objects.annotate(backed=Count('pledges')).order_by('-backed').first()
+    word = WORDS[0]
+
+    return [
+        ('index', None, reverse('index')),
+        ('discover', None, reverse('discover')),
+        ('discover_popular', None, reverse('discover') + '?sort=popular'),
+        ('discover_search', None, reverse('discover') + '?q=' + word),
+        ('view_project', None, reverse('view_project', args=[active.pk])),
+        ('profile', backer, reverse('profile')),
+        ('start_project', backer, reverse('start_project')),
+        ('edit_project', owner.created_by, reverse('edit_project', args=[owner.pk])),
+    ]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def measure(name, user, url, requests, warmup=2):
+    client = Client()
+    if user is not None:
+        client.force_login(user)
+
+    for _ in range(warmup):
+        client.get(url)
+
+    latencies = []
+    queries = []
+    for _ in itertools.repeat(None, requests):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = client.get(url)
+            latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            raise AssertionError('{} answered {}'.format(url, response.status_code))
+        queries.append(len(captured))
+
+    return {
+        'url': url,
+        'requests': requests,
+        'latency_ms': {
+            'mean': statistics.mean(latencies),
+            'p50': percentile(latencies, 0.5),
+            'p90': percentile(latencies, 0.9),
+            'p99': percentile(latencies, 0.99),
+            'max': max(latencies),
+        },
+        'queries': {
+            'mean': statistics.mean(queries),
+            'max': max(queries),
+        },
+    }
+
+
+def compare(baseline, results, threshold):
+    """Return a description of every view that got slower than `threshold` times the baseline or runs more queries."""
+    regressions = []
+    for size, views in results['sizes'].items():
+        for view, result in views.items():
+            before = baseline.get('sizes', {}).get(size, {}).get(view)
+            if not before:
+                continue
+            if result['latency_ms']['p90'] > before['latency_ms']['p90'] * threshold:
+                regressions.append('{} @ {}: p90 {:.1f}ms -> {:.1f}ms'.format(
+                    view, size, before['latency_ms']['p90'], result['latency_ms']['p90']))
+            if result['queries']['max'] > before['queries']['max']:
+                regressions.append('{} @ {}: {} -> {} queries'.format(
+                    view, size, before['queries']['max'], result['queries']['max']))
+    return regressions
@@ -0,0 +1,22 @@
+"""
+The cache backend of the 'shared' cache when there's no memcached.
+
+Django's FileBasedCache lists its whole directory on every set() to see
+if it has to cull entries. With a session and a user entry per visitor
+that's a hundred thousand files listed on every login. This one only
+checks every CULL_INTERVAL sets, so the directory may grow up to that
+many entries past MAX_ENTRIES before it's culled.
+"""
+import itertools
+
+from django.core.cache.backends import filebased
+
+CULL_INTERVAL = 1000
+
+_sets = itertools.count(1)
+
+
+class FileBasedCache(filebased.FileBasedCache):
+    def _cull(self):
+        if next(_sets) % CULL_INTERVAL == 0:
+            super()._cull()
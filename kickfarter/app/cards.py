@@ -0,0 +1,59 @@
+"""
+Fragment cache for rendered project cards.
+
+A card is cached under the project's id and version. Anything that changes
+what a card shows (a pledge, an edit, a status change, the creator's new
+name) bumps the version, so stale cards are never looked up again and
+simply expire.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+CARD_TEMPLATE = 'app/snippets/project_card.html'
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+stats = CacheStats()
+
+
+def card_key(project):
+    return 'project-card:{}:{}'.format(project.pk, project.version)
+
+
+def render_cards(projects):
+    """Return the rendered card of every project in `projects`, in order."""
+    cache = caches[settings.PROJECT_CARD_CACHE]
+    projects = list(projects)
+    keys = [card_key(project) for project in projects]
+    cards = cache.get_many(keys)
+
+    rendered = {}
+    for key, project in zip(keys, projects):
+        if key not in cards:
+            rendered[key] = render_to_string(CARD_TEMPLATE, {'project': project})
+    if rendered:
+        cache.set_many(rendered, settings.PROJECT_CARD_CACHE_TIMEOUT)
+
+    stats.record(hits=len(keys) - len(rendered), misses=len(rendered))
+    cards.update(rendered)
+    return [mark_safe(cards[key]) for key in keys]
@@ -0,0 +1,64 @@
+"""
+SQLite in production.
+
+Every new SQLite connection gets the SQLITE_PRAGMAS of the settings. In
+production that's WAL mode, in which readers don't block the writer and
+the writer doesn't block readers, plus relaxed syncing and memory-mapped
+reads. Together with CONN_MAX_AGE the pragmas are paid once per
+connection instead of once per request.
+
+ReplicaRouter sends the reads of the read-heavy views (REPLICA_VIEWS) to
+the READ_REPLICA alias. ReplicaMiddleware marks those requests. Writes,
+pledges included, and every other view always use the primary. The
+replica can be a second connection to the same file, whose reads go on
+concurrently with the primary's writes under WAL. It can also be a copy
+kept up to date by some other process, in which case those views may lag
+behind a little.
+"""
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+_local = threading.local()
+
+
+def apply_pragmas(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+
+
+class ReplicaMiddleware:
+    def process_request(self, request):
+        _local.use_replica = False
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _local.use_replica = bool(
+            settings.READ_REPLICA and request.method in ('GET', 'HEAD') and
+            request.resolver_match.url_name in settings.REPLICA_VIEWS
+        )
+
+    def process_response(self, request, response):
+        _local.use_replica = False
+        return response
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # A transaction on the primary has to read its own writes
+        if getattr(_local, 'use_replica', False) and not connections['default'].in_atomic_block:
+            return settings.READ_REPLICA
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
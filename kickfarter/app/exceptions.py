@@ -1,3 +1,23 @@
 class BackingException(Exception):
     """Exception that's raised when en error occurred while a user tries to back a project."""
     pass
+
+
+class InvalidCursorException(Exception):
+    """Exception that's raised when a pagination cursor can't be decoded."""
+    pass
+
+
+class BadRequestException(Exception):
+    """Exception that's raised when the parameters of an API request are invalid."""
+    pass
+
+
+class ImportException(Exception):
+    """Exception that's raised when a batch of an import conflicts with the database and has to be rolled back."""
+    pass
+
+
+class OutboxConflictException(Exception):
+    """Exception that's raised when another worker carried on with an outbox event first."""
+    pass
@@ -0,0 +1,67 @@
+"""
+CSV exports for project creators.
+
+Rows are read in keyset batches over the pledge id rather than with a
+single .iterator(): Django reads every result of an SQLite query into
+memory up front, so one query per batch is what keeps memory flat. Each
+batch is a single query joining Pledge, User and RewardTier. Its rows go
+straight from the cursor into the CSV writer, without the ORM turning
+every value into a Python object first.
+"""
+import csv
+import io
+
+from app.models import Pledge
+from django.db import connection
+
+BATCH_SIZE = 2000
+
+BACKER_COLUMNS = [
+    ('id', 'Pledge'),
+    ('user__email', 'Email'),
+    ('amount', 'Amount'),
+    ('chosen_reward_tier__minimum_amount', 'Reward tier minimum'),
+    ('chosen_reward_tier__description', 'Reward tier'),
+    ('created_on', 'Pledged on (UTC)'),
+]
+# Columns written by users, which spreadsheets must not mistake for formulas
+TEXT_COLUMNS = [1, 4]
+
+
+def escape(value):
+    if value and value.startswith(('=', '+', '-', '@')):
+        return "'" + value
+    return value
+
+
+def backer_batches(project_id, batch_size=BATCH_SIZE):
+    pledges = Pledge.objects.filter(project=project_id).order_by('id').values_list(*[c for c, _ in BACKER_COLUMNS])
+    last_id = 0
+    with connection.cursor() as cursor:
+        while True:
+            sql, params = pledges.filter(id__gt=last_id)[:batch_size].query.sql_with_params()
+            cursor.execute(sql, params)
+            batch = cursor.fetchall()
+            if batch:
+                yield batch
+            if len(batch) < batch_size:
+                break
+            last_id = batch[-1][0]
+
+
+def backers_csv(project_id, batch_size=BATCH_SIZE):
+    """Yield the backers of the project as CSV, header first, one chunk per batch."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([title for _, title in BACKER_COLUMNS])
+    yield buffer.getvalue()
+
+    for batch in backer_batches(project_id, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        for row in batch:
+            row = list(row)
+            for i in TEXT_COLUMNS:
+                row[i] = escape(row[i])
+            writer.writerow(row)
+        yield buffer.getvalue()
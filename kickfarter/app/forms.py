@@ -1,6 +1,10 @@
 from django import forms
+from django.conf import settings
+from django.db import transaction
+from django.template.defaultfilters import filesizeformat
 from django.utils.translation import ugettext_lazy as _
-from app.models import User, Project
+from app import thumbnails
+from app.models import Comment, Project, RewardTier, Update, User
 
 
 class UserCreationForm(forms.ModelForm):
@@ -56,11 +60,34 @@ class LoginForm(forms.Form):
     )
 
 
+class CoverImageField(forms.ImageField):
+    """An ImageField that checks the size and type of an upload before Pillow has to open it."""
+    default_error_messages = {
+        'too_large': _('The image must not be larger than %(limit)s.'),
+        'content_type': _('Upload a JPEG, PNG, GIF or WebP image.'),
+    }
+
+    def to_python(self, data):
+        if data and getattr(data, 'size', 0) > settings.MAX_UPLOAD_SIZE:
+            raise forms.ValidationError(
+                self.error_messages['too_large'],
+                code='too_large',
+                params={'limit': filesizeformat(settings.MAX_UPLOAD_SIZE)},
+            )
+        if data and getattr(data, 'content_type', None) not in settings.UPLOAD_CONTENT_TYPES:
+            raise forms.ValidationError(self.error_messages['content_type'], code='content_type')
+        return super().to_python(data)
+
+
 class ProjectForm(forms.ModelForm):
     class Meta:
         model = Project
         fields = ['title', 'description', 'currency', 'goal', 'cover_image']
 
+        field_classes = {
+            'cover_image': CoverImageField,
+        }
+
         labels = {
             'title': _('Project title'),
             'description': _('Project description'),
@@ -71,3 +98,57 @@ class ProjectForm(forms.ModelForm):
             'description': forms.Textarea(attrs={'placeholder': _('Describe your project')}),
             'goal': forms.NumberInput(attrs={'placeholder': _('10.00')}),
         }
+
+    def save(self, commit=True):
+        cover_image_changed = 'cover_image' in self.changed_data
+        if cover_image_changed:
+            self.instance.cover_thumbnails_ready = False
+        previous = getattr(self.initial.get('cover_image'), 'name', None)
+        project = super().save(commit=commit)
+
+        if cover_image_changed and commit:
+            # save() leaves the flag to the thumbnail worker, the version is already bumped
+            Project.objects.filter(pk=project.pk).update(cover_thumbnails_ready=False)
+            if project.cover_image:
+                name = project.cover_image.name
+                transaction.on_commit(lambda: thumbnails.schedule(name))
+            if previous:
+                transaction.on_commit(lambda: thumbnails.release(previous))
+        return project
+
+
+class RewardTierForm(forms.ModelForm):
+    class Meta:
+        model = RewardTier
+        fields = ['minimum_amount', 'description', 'quantity']
+
+    def clean_quantity(self):
+        quantity = self.cleaned_data.get('quantity')
+        if quantity is not None and quantity < self.instance.claimed:
+            raise forms.ValidationError(
+                _('%(claimed)s rewards of this tier have already been claimed.'),
+                code='below_claimed',
+                params={'claimed': self.instance.claimed},
+            )
+        return quantity
+
+
+class CommentForm(forms.ModelForm):
+    class Meta:
+        model = Comment
+        fields = ['text']
+
+        labels = {
+            'text': _('Comment'),
+        }
+
+
+class UpdateForm(forms.ModelForm):
+    class Meta:
+        model = Update
+        fields = ['text', 'backers_only']
+
+        labels = {
+            'text': _('Update'),
+            'backers_only': _('Only show this update to backers'),
+        }
@@ -0,0 +1,387 @@
+"""
+Bulk import of projects and pledges from other platforms.
+
+Rows are streamed from CSV or JSON Lines files and handled in fixed-size
+batches: every batch resolves its users and projects with a handful of
+IN queries, is validated with the same rules as User.pledge and written
+with bulk_create in its own transaction. Memory use only depends on the
+batch size, not on the size of the input.
+
+A malformed row, be it invalid JSON, a JSON value that isn't an object or
+a column holding a list, is rejected with its line number like any other
+invalid row and the import goes on. So is a row that conflicts with what
+was written on the site since its batch was checked, a pledge by the same
+backer or the last reward of a tier: the batch is rolled back and its rows
+are imported one at a time, rejecting only the ones that conflict.
+"""
+import abc
+import collections
+import csv
+import datetime
+import io
+import itertools
+import json
+import math
+import sys
+import time
+
+from app import rollups, trending
+from app.exceptions import ImportException
+from app.models import Pledge, Project, RewardTier, User
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+# Every batch looks up its users and projects with IN queries, so keep it
+# below the SQLite host parameter limit (32766 since SQLite 3.32).
+DEFAULT_BATCH_SIZE = 2000
+
+
+# What a column may hold, anything else can't be looked up or stored
+SCALARS = (str, int, float, type(None))
+
+
+class RowError(Exception):
+    pass
+
+
+def read_rows(path, format=None):
+    """
+    Yield (line number, row) for every row of a CSV or JSON Lines file.
+    `path` may be '-' for stdin. The format is guessed from the extension
+    unless given. JSON Lines are decoded one at a time, a line that isn't
+    valid UTF-8 or JSON is yielded as a RowError for the importer to reject.
+    """
+    if format is None:
+        format = 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+    if format == 'csv':
+        if path == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+        else:
+            stream = open(path, encoding='utf-8', newline='')
+        with stream:
+            reader = csv.DictReader(stream)
+            for row in reader:
+                yield reader.line_num, row
+    else:
+        stream = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        with stream:
+            for line_num, line in enumerate(stream, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    # UnicodeDecodeError and JSONDecodeError are both ValueErrors
+                    yield line_num, json.loads(line.decode('utf-8'))
+                except ValueError as e:
+                    yield line_num, RowError('invalid JSON: {}'.format(e))
+
+
+def check(row):
+    """Raise RowError unless `row` maps column names to scalar values."""
+    if isinstance(row, RowError):
+        raise row
+    if not isinstance(row, dict):
+        raise RowError('a row must be a JSON object, not {}'.format(type(row).__name__))
+    for name, value in row.items():
+        if not isinstance(value, SCALARS):
+            # csv.DictReader puts the fields past the header under None
+            raise RowError('too many columns' if name is None else '{} must be a string or a number'.format(name))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Importer(metaclass=abc.ABCMeta):
+    """Base class of the importers, which stream rows into the database batch by batch."""
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, on_error=None, on_progress=None):
+        self.batch_size = batch_size
+        self.on_error = on_error or (lambda line_num, message: None)
+        self.on_progress = on_progress or (lambda importer: None)
+        self.read = 0
+        self.written = 0
+        self.rejected = 0
+        self.elapsed = 0
+        # Rejections of the batch being imported, reported once it's committed
+        self.rejections = []
+
+    @property
+    def rows_per_second(self):
+        return self.read / self.elapsed if self.elapsed else 0
+
+    def run(self, rows):
+        started = time.perf_counter()
+        for batch in batched(rows, self.batch_size):
+            self.read += len(batch)
+            valid = []
+            for line_num, row in batch:
+                try:
+                    check(row)
+                except RowError as e:
+                    self.reject(line_num, str(e))
+                else:
+                    valid.append((line_num, row))
+            self.report()
+            if valid:
+                self.import_rows(valid)
+            self.elapsed = time.perf_counter() - started
+            self.on_progress(self)
+        self.elapsed = time.perf_counter() - started
+        return self
+
+    def import_rows(self, rows):
+        """import_batch() in a transaction, or row by row if the batch conflicts with the database."""
+        try:
+            with transaction.atomic():
+                written = self.import_batch(rows)
+        except (IntegrityError, ImportException) as e:
+            del self.rejections[:]
+            if len(rows) > 1:
+                for row in rows:
+                    self.import_rows([row])
+                return
+            self.reject(rows[0][0], str(e))
+            written = 0
+        self.written += written
+        self.report()
+
+    def reject(self, line_num, message):
+        self.rejections.append((line_num, message))
+
+    def report(self):
+        for line_num, message in self.rejections:
+            self.rejected += 1
+            self.on_error(line_num, message)
+        del self.rejections[:]
+
+    @abc.abstractmethod
+    def import_batch(self, batch):
+        """Write the valid rows of `batch`, a list of (line number, row dict), and return how many."""
+
+
+def _float(value, name):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise RowError('{} must be a number'.format(name))
+    if not math.isfinite(number):
+        raise RowError('{} must be a number'.format(name))
+    return number
+
+
+def _datetime(value, name):
+    """Parse an ISO 8601 datetime, assuming UTC if it has no offset."""
+    try:
+        parsed = parse_datetime(value)
+    except (TypeError, ValueError):
+        parsed = None
+    if parsed is None:
+        raise RowError('{} is not a valid datetime'.format(name))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+
+def _ids(batch, column):
+    ids = set()
+    for _, row in batch:
+        try:
+            ids.add(int(row.get(column)))
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return ids
+
+
+def _choice(value, choices, name):
+    """Accept either the stored value or the display name of a choice."""
+    for stored, display in choices:
+        if str(value) in (str(stored), display):
+            return stored
+    raise RowError('unknown {} {!r}'.format(name, value))
+
+
+class ProjectImporter(Importer):
+    """Columns: email (of the creator), title, description, goal, currency, status, published_on."""
+
+    def import_batch(self, batch):
+        emails = {row.get('email') for _, row in batch}
+        creators = dict(User.objects.filter(email__in=emails).values_list('email', 'pk'))
+
+        projects = []
+        for line_num, row in batch:
+            try:
+                projects.append(self.build(row, creators))
+            except RowError as e:
+                self.reject(line_num, str(e))
+
+        Project.objects.bulk_create(projects)
+        for user_id, count in collections.Counter(project.created_by_id for project in projects).items():
+            User.objects.update_totals(user_id, created_count=F('created_count') + count)
+        return len(projects)
+
+    def build(self, row, creators):
+        if row.get('email') not in creators:
+            raise RowError('unknown creator {!r}'.format(row.get('email')))
+        if not row.get('title'):
+            raise RowError('title is required')
+        goal = _float(row.get('goal'), 'goal')
+        if goal < 1:
+            raise RowError('goal must be at least 1')
+
+        project = Project(
+            title=row['title'],
+            description=row.get('description') or '',
+            goal=goal,
+            currency=_choice(row.get('currency') or Project.CURRENCY_USD, Project.CURRENCIES, 'currency'),
+            status=_choice(row.get('status') or Project.STATUS_DRAFT, Project.PROJECT_STATUS, 'status'),
+            created_by_id=creators[row['email']],
+        )
+        if row.get('published_on'):
+            project.published_on = _datetime(row['published_on'], 'published_on')
+        elif project.status != Project.STATUS_DRAFT:
+            raise RowError('published_on is required for published projects')
+
+        # bulk_create() skips save(), which usually keeps this column up to date
+        project.finishes_on = project.finished_on if project.published_on else None
+        return project
+
+
+class PledgeImporter(Importer):
+    """Columns: email (of the backer), project (id), amount, reward_tier (id, optional), created_on (optional)."""
+
+    def __init__(self, create_users=False, **kwargs):
+        super().__init__(**kwargs)
+        self.create_users = create_users
+
+    def import_batch(self, batch):
+        emails = {row.get('email') for _, row in batch if row.get('email')}
+        users = dict(User.objects.filter(email__in=emails).values_list('email', 'pk'))
+        if self.create_users and len(users) < len(emails):
+            User.objects.bulk_create(User(email=email) for email in emails if email not in users)
+            users = dict(User.objects.filter(email__in=emails).values_list('email', 'pk'))
+
+        now = timezone.now()
+        projects = {
+            pk: (created_by, status == Project.STATUS_ACTIVE and finishes_on is not None and finishes_on > now)
+            for pk, created_by, status, finishes_on in Project.objects.filter(pk__in=_ids(batch, 'project'))
+            .values_list('pk', 'created_by', 'status', 'finishes_on')
+        }
+        tiers = {
+            pk: [project_id, minimum_amount, None if quantity is None else quantity - claimed]
+            for pk, project_id, minimum_amount, quantity, claimed in RewardTier.objects
+            .filter(pk__in=_ids(batch, 'reward_tier'))
+            .values_list('pk', 'project', 'minimum_amount', 'quantity', 'claimed')
+        }
+        backed = set(
+            Pledge.objects.filter(user__in=users.values(), project__in=projects.keys())
+            .values_list('user', 'project')
+        )
+
+        pledges = []
+        for line_num, row in batch:
+            try:
+                pledge = self.build(row, users, projects, tiers, backed)
+            except RowError as e:
+                self.reject(line_num, str(e))
+            else:
+                backed.add((pledge.user_id, pledge.project_id))
+                pledges.append(pledge)
+
+        Pledge.objects.bulk_create(pledges)
+
+        totals = {}
+        backers = {}
+        days = {}
+        for pledge in pledges:
+            amount, count, weight = totals.get(pledge.project_id, (0, 0, 0))
+            totals[pledge.project_id] = (amount + pledge.amount, count + 1,
+                                         weight + trending.current_weight(pledge.amount, pledge.created_on, now))
+            amount, count = backers.get(pledge.user_id, (0, 0))
+            backers[pledge.user_id] = (amount + pledge.amount, count + 1)
+            key = (pledge.project_id, rollups.day_of(pledge.created_on))
+            amount, count = days.get(key, (0, 0))
+            days[key] = (amount + pledge.amount, count + 1)
+        for project_id, (amount, count, weight) in totals.items():
+            if not Project.objects.filter(pk=project_id).running().bump_version(
+                pledged_total=F('pledged_total') + amount,
+                backer_count=F('backer_count') + count,
+                trending_score=F('trending_score') + weight,
+            ):
+                raise ImportException('Project {} stopped taking pledges during the import'.format(project_id))
+        for user_id, (amount, count) in backers.items():
+            User.objects.update_totals(
+                user_id,
+                backed_total=F('backed_total') + amount,
+                backed_count=F('backed_count') + count,
+            )
+
+        for (project_id, day), (amount, count) in days.items():
+            rollups.record(project_id, day, amount, count)
+
+        claimed = collections.Counter(pledge.chosen_reward_tier_id for pledge in pledges)
+        claimed.pop(None, None)
+        for tier_id, count in claimed.items():
+            # Pledges made on the site since the lookup may have claimed the last rewards
+            if not RewardTier.objects.filter(pk=tier_id).claim(count):
+                raise ImportException('Reward tier {} sold out during the import'.format(tier_id))
+
+        return len(pledges)
+
+    def build(self, row, users, projects, tiers, backed):
+        """Same rules as app.pledging.pledge, checked against the batch lookups."""
+        user_id = users.get(row.get('email'))
+        if user_id is None:
+            raise RowError('unknown backer {!r}'.format(row.get('email')))
+        try:
+            project_id = int(row.get('project'))
+        except (TypeError, ValueError, OverflowError):
+            raise RowError('project must be an id')
+        if project_id not in projects:
+            raise RowError('unknown project {}'.format(project_id))
+        created_by, running = projects[project_id]
+
+        if created_by == user_id:
+            raise RowError('You can\'t back your own projects')
+        if (user_id, project_id) in backed:
+            raise RowError('You have already backed this project')
+        if not running:
+            raise RowError('You can only back active projects')
+
+        tier_id = None
+        if row.get('reward_tier'):
+            try:
+                tier_id = int(row['reward_tier'])
+            except (TypeError, ValueError, OverflowError):
+                raise RowError('reward_tier must be an id')
+            if tier_id not in tiers or tiers[tier_id][0] != project_id:
+                raise RowError('reward tier {} doesn\'t belong to project {}'.format(tier_id, project_id))
+
+        amount = _float(row.get('amount'), 'amount')
+        created_on = _datetime(row['created_on'], 'created_on') if row.get('created_on') else None
+        # Last, so only accepted rows count against the tier's remaining rewards
+        if tier_id is not None:
+            _, minimum_amount, remaining = tiers[tier_id]
+            if amount < minimum_amount:
+                raise RowError('This reward tier requires a pledge of at least {}'.format(minimum_amount))
+            if remaining is not None:
+                if remaining <= 0:
+                    raise RowError('This reward tier is sold out')
+                tiers[tier_id][2] -= 1
+
+        pledge = Pledge(
+            user_id=user_id,
+            project_id=project_id,
+            amount=amount,
+            chosen_reward_tier_id=tier_id,
+        )
+        if created_on:
+            pledge.created_on = created_on
+        return pledge
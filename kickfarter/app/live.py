@@ -0,0 +1,236 @@
+"""
+Live funding progress of project pages over Server-Sent Events.
+
+An asyncio server on its own port (LIVE_PORT) runs in a thread of the
+WSGI process, see kickfarter/wsgi.py. GET /live/projects/<id> keeps the
+connection open and sends the project's progress (pledged total,
+backers, time remaining) whenever it changes. An idle watcher is a
+socket and a parked coroutine, so one process holds thousands of them
+for the price of a few full page renders.
+
+Changes reach watchers through the in-process Hub. Pledges publish to it
+once they are committed. Pledges made by other processes, imports and
+the expiry sweeper are picked up by polling the watched projects with one
+query every LIVE_POLL_INTERVAL seconds. Every state carries the project's
+version, so watchers never go back to an older one.
+
+Each worker process of a pre-forking server starts its own live server.
+They share the port through SO_REUSEPORT, so don't preload the app.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import re
+import socket
+import threading
+
+from app.models import Project
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+PATH = re.compile(r'^/live/projects/(\d+)$')
+FIELDS = ['pk', 'version', 'status', 'goal', 'pledged_total', 'backer_count', 'finishes_on']
+# SQLite allows 999 parameters per statement
+POLL_CHUNK_SIZE = 500
+KEEPALIVE = 15
+REQUEST_TIMEOUT = 10
+
+_server = None
+
+
+def load(project_ids):
+    """Rows of FIELDS of the published projects among `project_ids`. Runs in an executor thread."""
+    close_old_connections()
+    rows = []
+    published = Project.objects.exclude(status=Project.STATUS_DRAFT)
+    for i in range(0, len(project_ids), POLL_CHUNK_SIZE):
+        rows.extend(published.filter(pk__in=project_ids[i:i + POLL_CHUNK_SIZE]).values(*FIELDS))
+    return rows
+
+
+def progress(row, now=None):
+    """What watchers get to see of a row of FIELDS."""
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+    remaining = None
+    if row['status'] == Project.STATUS_ACTIVE and row['finishes_on']:
+        remaining = max(int((row['finishes_on'] - now).total_seconds()), 0)
+    # The sweeper may not have finished the campaign yet
+    active = bool(remaining)
+    return {
+        'project': row['pk'],
+        'pledged_total': row['pledged_total'],
+        'backer_count': row['backer_count'],
+        'percentage_funded': row['pledged_total'] / row['goal'] * 100,
+        'finishes_on': row['finishes_on'],
+        'seconds_remaining': remaining,
+        'active': active,
+    }
+
+
+def event(row):
+    data = json.dumps(progress(row), cls=DjangoJSONEncoder)
+    return 'id: {}\nevent: progress\ndata: {}\n\n'.format(row['version'], data).encode('utf-8')
+
+
+def response_head(status, content_type, extra=''):
+    return (
+        'HTTP/1.1 {}\r\nContent-Type: {}\r\nCache-Control: no-cache\r\n'
+        'Access-Control-Allow-Origin: *\r\n{}\r\n'.format(status, content_type, extra)
+    ).encode('latin-1')
+
+
+class Hub:
+    """Which connections watch which project, and the newest state of each watched project."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.watchers = {}  # project id -> set of asyncio.Event, one per connection
+        self.latest = {}  # project id -> row of FIELDS
+
+    def watch(self, project_id):
+        changed = asyncio.Event(loop=self.loop)
+        self.watchers.setdefault(project_id, set()).add(changed)
+        return changed
+
+    def unwatch(self, project_id, changed):
+        watchers = self.watchers.get(project_id)
+        if watchers is None:
+            return
+        watchers.discard(changed)
+        if not watchers:
+            del self.watchers[project_id]
+            self.latest.pop(project_id, None)
+
+    def update(self, row):
+        """Wake the watchers of the row's project if it's newer than what they have. Loop thread only."""
+        project_id = row['pk']
+        if project_id not in self.watchers:
+            return
+        current = self.latest.get(project_id)
+        if current is not None and current['version'] >= row['version']:
+            return
+        self.latest[project_id] = row
+        for changed in self.watchers[project_id]:
+            changed.set()
+
+    def publish(self, row):
+        """update() from any thread."""
+        self.loop.call_soon_threadsafe(self.update, row)
+
+    async def poll(self, interval):
+        while True:
+            await asyncio.sleep(interval, loop=self.loop)
+            if not self.watchers:
+                continue
+            try:
+                rows = await self.loop.run_in_executor(None, load, list(self.watchers))
+            except Exception:
+                logger.exception('Polling the watched projects failed')
+                continue
+            for row in rows:
+                self.update(row)
+
+    async def handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), REQUEST_TIMEOUT, loop=self.loop)
+            method, target = head.split(b'\r\n', 1)[0].decode('latin-1').split(' ')[:2]
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError,
+                ConnectionError, ValueError):
+            writer.close()
+            return
+
+        match = PATH.match(target.split('?', 1)[0])
+        rows = []
+        if method == 'GET' and match:
+            project_id = int(match.group(1))
+            rows = await self.loop.run_in_executor(None, load, [project_id])
+        if not rows:
+            writer.write(response_head('404 Not Found', 'text/plain', 'Connection: close\r\n') + b'Not found\n')
+            writer.close()
+            return
+
+        changed = self.watch(project_id)
+        self.update(rows[0])
+        try:
+            writer.write(response_head('200 OK', 'text/event-stream') + b'retry: 5000\n\n')
+            sent = None
+            while True:
+                changed.clear()
+                row = self.latest[project_id]
+                writer.write(event(row) if row is not sent else b': keepalive\n\n')
+                sent = row
+                await writer.drain()
+                try:
+                    await asyncio.wait_for(changed.wait(), KEEPALIVE, loop=self.loop)
+                except asyncio.TimeoutError:
+                    pass
+        except ConnectionError:
+            pass
+        finally:
+            self.unwatch(project_id, changed)
+            writer.close()
+
+
+class LiveServer(threading.Thread):
+    def __init__(self, host, port, poll_interval):
+        super().__init__(name='kickfarter-live', daemon=True)
+        self.host = host
+        self.port = port
+        self.poll_interval = poll_interval
+        self.loop = asyncio.new_event_loop()
+        self.hub = Hub(self.loop)
+        self.ready = threading.Event()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        server = self.loop.run_until_complete(asyncio.start_server(
+            self.hub.handle, self.host, self.port, loop=self.loop, reuse_port=hasattr(socket, 'SO_REUSEPORT')))
+        # The bound port, in case port 0 picked one
+        self.port = server.sockets[0].getsockname()[1]
+        self.loop.create_task(self.hub.poll(self.poll_interval))
+        self.ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            server.close()
+            tasks = asyncio.Task.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, loop=self.loop, return_exceptions=True))
+            self.loop.run_until_complete(server.wait_closed())
+            self.loop.close()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.join()
+
+
+def start(host=None, port=None, poll_interval=None):
+    """Start the live server of this process in a background thread and return it."""
+    global _server
+    _server = LiveServer(
+        settings.LIVE_HOST if host is None else host,
+        settings.LIVE_PORT if port is None else port,
+        poll_interval or settings.LIVE_POLL_INTERVAL,
+    )
+    _server.start()
+    _server.ready.wait()
+    return _server
+
+
+def stop():
+    global _server
+    if _server is not None:
+        _server.stop()
+        _server = None
+
+
+def publish(project):
+    """Tell the watchers of `project` about its current state. A no-op unless this process serves watchers."""
+    if _server is not None:
+        _server.hub.publish({field: getattr(project, field) for field in FIELDS})
@@ -0,0 +1,40 @@
+import abc
+
+from app.importers import DEFAULT_BATCH_SIZE, read_rows
+from django.core.management.base import BaseCommand
+
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportCommand(BaseCommand, metaclass=abc.ABCMeta):
+    """Shared plumbing of import_projects and import_pledges."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSON Lines file, or - for stdin.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to guessing from the file extension.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    @abc.abstractmethod
+    def get_importer(self, options, **kwargs):
+        """The app.importers.Importer to run, created with `kwargs`."""
+
+    def handle(self, *args, **options):
+        importer = self.get_importer(
+            options,
+            batch_size=options['batch_size'],
+            on_error=self.report_error,
+            on_progress=self.report_progress if options['verbosity'] > 1 else None,
+        )
+        importer.run(read_rows(options['path'], options['format']))
+        self.stdout.write('Read {} rows in {:.1f}s ({:.0f} rows/s): {} imported, {} rejected'.format(
+            importer.read, importer.elapsed, importer.rows_per_second, importer.written, importer.rejected))
+
+    def report_error(self, line_num, message):
+        self.errors = getattr(self, 'errors', 0) + 1
+        if self.errors <= MAX_REPORTED_ERRORS:
+            self.stderr.write('Line {}: {}'.format(line_num, message))
+        elif self.errors == MAX_REPORTED_ERRORS + 1:
+            self.stderr.write('Too many errors, only counting from now on')
+
+    def report_progress(self, importer):
+        self.stdout.write('{} rows ({:.0f} rows/s)'.format(importer.read, importer.rows_per_second))
@@ -0,0 +1,116 @@
+import queue
+import random
+import threading
+import time
+
+from app.benchmark import throwaway_database
+from app.exceptions import BackingException
+from app.models import Pledge, Project, RewardTier, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire concurrent pledges at a single project on a throwaway SQLite database in WAL mode, '
+        'report the throughput and check that nothing was double counted or oversold.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backers', type=int, default=2000, help='Number of distinct backers.')
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument(
+            '--submits', type=int, default=2,
+            help='How many times every backer submits their pledge (double-submits must be rejected).',
+        )
+        parser.add_argument(
+            '--tier-quantity', type=int,
+            help='Make every backer choose an "early bird" reward tier limited to this many rewards.',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('This benchmark only runs against SQLite')
+
+        with throwaway_database(wal=True):
+            self.run_benchmark(options['backers'], options['threads'], options['submits'], options['tier_quantity'])
+
+    def run_benchmark(self, num_backers, num_threads, submits, tier_quantity=None):
+        creator = User.objects.create(email='creator@benchmark.invalid')
+        project = Project(title='Benchmark', description='Benchmark', goal=1000000, created_by=creator)
+        project.publish()
+        project.save()
+        tier = None
+        expected_backers = num_backers
+        if tier_quantity is not None:
+            tier = RewardTier.objects.create(
+                project=project, description='Early bird', minimum_amount=1, quantity=tier_quantity)
+            expected_backers = min(num_backers, tier_quantity)
+
+        User.objects.bulk_create(
+            User(email='backer{}@benchmark.invalid'.format(i)) for i in range(num_backers)
+        )
+        backers = list(User.objects.exclude(pk=creator.pk))
+        amounts = {backer.pk: random.randint(1, 500) for backer in backers}
+
+        # Shuffled so the double-submits of a backer race each other on different threads
+        submissions = backers * submits
+        random.shuffle(submissions)
+        work = queue.Queue()
+        for backer in submissions:
+            work.put(backer)
+        accepted = []
+        rejected = []
+
+        def worker():
+            try:
+                while True:
+                    try:
+                        backer = work.get_nowait()
+                    except queue.Empty:
+                        return
+                    try:
+                        backer.pledge(amounts[backer.pk], project, reward_tier=tier)
+                        accepted.append(backer.pk)
+                    except BackingException:
+                        rejected.append(backer.pk)
+                    except DatabaseError as e:
+                        self.stderr.write('Pledge of backer {} failed: {}'.format(backer.pk, e))
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(num_threads)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        attempts = len(accepted) + len(rejected)
+        self.stdout.write('{} pledge attempts from {} threads in {:.2f}s: {:.0f} attempts/s, {:.0f} pledges/s'.format(
+            attempts, num_threads, elapsed, attempts / elapsed, len(accepted) / elapsed))
+        self.stdout.write('{} accepted, {} rejected as duplicates or sold out'.format(len(accepted), len(rejected)))
+
+        project.refresh_from_db()
+        errors = []
+        if attempts != num_backers * submits:
+            errors.append('{} of {} attempts failed with an unexpected error'.format(
+                num_backers * submits - attempts, num_backers * submits))
+        if len(accepted) != expected_backers or len(set(accepted)) != expected_backers:
+            errors.append('expected exactly one accepted pledge for each of {} backers'.format(expected_backers))
+        if Pledge.objects.filter(project=project).count() != expected_backers:
+            errors.append('pledge table has duplicates or missing rows')
+        if project.backer_count != expected_backers:
+            errors.append('backer_count is {}, expected {}'.format(project.backer_count, expected_backers))
+        expected_total = sum(amounts[pk] for pk in set(accepted))
+        if abs(project.pledged_total - expected_total) > 1e-6:
+            errors.append('pledged_total is {}, expected {}'.format(project.pledged_total, expected_total))
+        if tier is not None:
+            tier.refresh_from_db()
+            if tier.claimed != expected_backers:
+                errors.append('{} rewards claimed of a tier limited to {}'.format(tier.claimed, tier_quantity))
+
+        if errors:
+            raise CommandError('; '.join(errors))
+        self.stdout.write('No pledge was lost, double counted or oversold')
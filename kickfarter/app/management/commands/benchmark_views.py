@@ -0,0 +1,72 @@
+import datetime
+import json
+import platform
+
+import django
+from app import benchmark
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate synthetic data at several sizes in a throwaway database, drive every view through the '
+        'test client and record latency percentiles and SQL query counts as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000', help='Comma separated numbers of projects to generate.')
+        parser.add_argument('--requests', type=int, default=50, help='Measured requests per view and size.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--compare', help='Baseline JSON file of an earlier run to check for regressions.')
+        parser.add_argument(
+            '--threshold', type=float, default=1.25,
+            help='Report a regression when the p90 latency grows by more than this factor.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes must be a comma separated list of numbers')
+
+        results = {
+            'created_on': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'seed': options['seed'],
+            'sizes': {},
+        }
+        for size in sizes:
+            results['sizes'][str(size)] = self.run_size(size, options['requests'], options['seed'])
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write('Wrote results to {}'.format(options['output']))
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            regressions = benchmark.compare(baseline, results, options['threshold'])
+            if regressions:
+                raise CommandError('Regressions against {}:\n{}'.format(options['compare'], '\n'.join(regressions)))
+            self.stdout.write('No regressions against {}'.format(options['compare']))
+
+    def run_size(self, size, requests, seed):
+        with benchmark.throwaway_database():
+            for cache in caches.all():
+                cache.clear()
+            benchmark.generate(size, seed=seed)
+
+            results = {}
+            self.stdout.write('{} projects'.format(size))
+            for name, user, url in benchmark.scenarios():
+                results[name] = result = benchmark.measure(name, user, url, requests)
+                self.stdout.write('  {:<18} p50 {:7.1f}ms  p90 {:7.1f}ms  p99 {:7.1f}ms  {:4.0f} queries'.format(
+                    name, result['latency_ms']['p50'], result['latency_ms']['p90'],
+                    result['latency_ms']['p99'], result['queries']['max']))
+            return results
@@ -0,0 +1,13 @@
+from app.sweeper import DEFAULT_BATCH_SIZE, expire_projects
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Finish every active project whose campaign is over.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        successful, not_funded = expire_projects(batch_size=options['batch_size'])
+        self.stdout.write('Finished {} successful and {} not funded project(s)'.format(successful, not_funded))
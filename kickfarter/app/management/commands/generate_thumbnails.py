@@ -0,0 +1,20 @@
+from app import thumbnails
+from app.models import Project
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Generate the resized cover images of every project that is still missing them.'
+
+    def handle(self, *args, **options):
+        pending = (Project.objects.filter(cover_thumbnails_ready=False).exclude(cover_image='')
+                   .exclude(cover_image__isnull=True).values_list('cover_image', flat=True).distinct())
+        generated = failed = 0
+        for name in pending.iterator():
+            try:
+                thumbnails.generate(name)
+                generated += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write('{}: {}'.format(name, e))
+        self.stdout.write('Generated thumbnails of {} image(s), {} failed'.format(generated, failed))
@@ -0,0 +1,16 @@
+from app.importers import PledgeImporter
+from app.management.commands._import import ImportCommand
+
+
+class Command(ImportCommand):
+    help = 'Stream pledges from a CSV or JSON Lines file into the database.'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--create-users', action='store_true', default=False,
+            help='Create backers that don\'t have an account yet instead of rejecting their pledges.',
+        )
+
+    def get_importer(self, options, **kwargs):
+        return PledgeImporter(create_users=options['create_users'], **kwargs)
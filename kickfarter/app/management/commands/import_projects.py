@@ -0,0 +1,9 @@
+from app.importers import ProjectImporter
+from app.management.commands._import import ImportCommand
+
+
+class Command(ImportCommand):
+    help = 'Stream projects from a CSV or JSON Lines file into the database.'
+
+    def get_importer(self, options, **kwargs):
+        return ProjectImporter(**kwargs)
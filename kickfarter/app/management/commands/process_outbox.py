@@ -0,0 +1,49 @@
+import time
+
+from app import outbox
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+
+class Command(BaseCommand):
+    help = 'Do the work recorded in the outbox, like notifying the backers of a project about an update.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=outbox.DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            '--interval', type=int,
+            help='Keep running and look for new events every this many seconds. Runs once by default.',
+        )
+        parser.add_argument('--status', action='store_true', default=False, help='Only report the backlog.')
+
+    def handle(self, *args, **options):
+        if options['status']:
+            self.report_backlog()
+            return
+
+        while True:
+            started = time.monotonic()
+            events, delivered = outbox.process(
+                batch_size=options['batch_size'],
+                on_progress=self.report_progress if options['verbosity'] > 1 else None,
+            )
+            elapsed = time.monotonic() - started
+            if events or not options['interval']:
+                self.stdout.write('Processed {} event(s), delivered {} in {:.1f}s ({:.0f}/s)'.format(
+                    events, delivered, elapsed, delivered / elapsed if elapsed else 0))
+                self.report_backlog()
+            if not options['interval']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
+
+    def report_backlog(self):
+        backlog = outbox.backlog()
+        self.stdout.write('Backlog: {} event(s) pending{}, {} failed'.format(
+            backlog['pending'],
+            ' since {:%Y-%m-%d %H:%M:%S}'.format(backlog['oldest']) if backlog['oldest'] else '',
+            backlog['failed'],
+        ))
+
+    def report_progress(self, event, count):
+        self.stdout.write('Event {}: {} delivered'.format(event.pk, event.delivered))
@@ -0,0 +1,14 @@
+from app import rollups
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily funding rollups behind the funding charts from the pledges.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('projects', nargs='*', type=int, help='Ids of the projects to rebuild, all by default.')
+        parser.add_argument('--batch-size', type=int, default=rollups.DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        rows = rollups.rebuild(options['projects'] or None, batch_size=options['batch_size'])
+        self.stdout.write('Rebuilt {} daily funding row(s)'.format(rows))
@@ -0,0 +1,93 @@
+from app.models import Pledge, Project, RewardTier, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Sum
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the stored pledged_total and backer_count of every project, the claimed rewards '
+        'of every reward tier and the backing and project totals of every user.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true', default=False,
+            help='Only report what has drifted and exit non-zero if anything did.',
+        )
+
+    def handle(self, *args, **options):
+        actual = {
+            row['project']: (row['total'] or 0, row['count'])
+            for row in Pledge.objects.order_by().values('project').annotate(total=Sum('amount'), count=Count('id'))
+        }
+
+        drifted = []
+        stored = Project.objects.order_by('pk').values_list('pk', 'pledged_total', 'backer_count')
+        for pk, pledged_total, backer_count in stored.iterator():
+            total, count = actual.get(pk, (0, 0))
+            if abs(pledged_total - total) > 1e-6 or backer_count != count:
+                drifted.append((pk, total, count))
+
+        claimed = dict(
+            Pledge.objects.filter(chosen_reward_tier__isnull=False).order_by()
+            .values_list('chosen_reward_tier').annotate(count=Count('id'))
+        )
+        drifted_tiers = [
+            (pk, project_id) for pk, project_id, stored_claimed
+            in RewardTier.objects.order_by('pk').values_list('pk', 'project', 'claimed').iterator()
+            if stored_claimed != claimed.get(pk, 0)
+        ]
+
+        backed = {
+            row['user']: (row['total'] or 0, row['count'])
+            for row in Pledge.objects.order_by().values('user').annotate(total=Sum('amount'), count=Count('id'))
+        }
+        created = dict(Project.objects.order_by().values_list('created_by').annotate(count=Count('id')))
+        drifted_users = []
+        stored = User.objects.order_by('pk').values_list('pk', 'backed_total', 'backed_count', 'created_count')
+        for pk, backed_total, backed_count, created_count in stored.iterator():
+            total, count = backed.get(pk, (0, 0))
+            if abs(backed_total - total) > 1e-6 or backed_count != count or created_count != created.get(pk, 0):
+                drifted_users.append(pk)
+
+        for pk, total, count in drifted:
+            self.stdout.write('Project {}: stored aggregates differ (actual total {}, {} backers)'.format(pk, total, count))
+        for pk, _ in drifted_tiers:
+            self.stdout.write('Reward tier {}: stored claimed rewards differ ({} pledges)'.format(pk, claimed.get(pk, 0)))
+        for pk in drifted_users:
+            self.stdout.write('User {}: stored totals differ'.format(pk))
+
+        if options['check']:
+            if drifted or drifted_tiers or drifted_users:
+                raise CommandError('{} project(s), {} reward tier(s) and {} user(s) have drifted aggregates'.format(
+                    len(drifted), len(drifted_tiers), len(drifted_users)))
+            self.stdout.write('All funding aggregates are consistent')
+            return
+
+        for pk, _, _ in drifted:
+            # Recount inside the transaction so pledges that landed since the scan aren't lost
+            with transaction.atomic():
+                totals = Pledge.objects.filter(project=pk).aggregate(total=Sum('amount'), count=Count('id'))
+                # Through bump_version() so cached cards and ETags don't keep showing the drifted numbers
+                Project.objects.filter(pk=pk).bump_version(
+                    pledged_total=totals['total'] or 0, backer_count=totals['count'])
+
+        for pk, project_id in drifted_tiers:
+            with transaction.atomic():
+                RewardTier.objects.filter(pk=pk).update(claimed=Pledge.objects.filter(chosen_reward_tier=pk).count())
+                # The tier's remaining rewards are shown on the project's page
+                Project.objects.filter(pk=project_id).bump_version()
+
+        for pk in drifted_users:
+            with transaction.atomic():
+                totals = Pledge.objects.filter(user=pk).aggregate(total=Sum('amount'), count=Count('id'))
+                User.objects.update_totals(
+                    pk,
+                    backed_total=totals['total'] or 0,
+                    backed_count=totals['count'],
+                    created_count=Project.objects.filter(created_by=pk).count(),
+                )
+
+        self.stdout.write('Rebuilt the aggregates of {} project(s), {} reward tier(s) and {} user(s)'.format(
+            len(drifted), len(drifted_tiers), len(drifted_users)))
@@ -0,0 +1,12 @@
+from app import search
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of projects.'
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('Full-text search needs SQLite with FTS5')
+        search.rebuild()
+        self.stdout.write('Rebuilt the project search index')
@@ -0,0 +1,13 @@
+from app.trending import DEFAULT_BATCH_SIZE, recompute
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Recompute the trending score of every project from its recent pledges.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        trending = recompute(batch_size=options['batch_size'])
+        self.stdout.write('{} project(s) are trending'.format(trending))
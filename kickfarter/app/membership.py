@@ -0,0 +1,116 @@
+"""
+Who backed a project, for showing backers-only updates.
+
+The backers of a project are kept in the cache as a Bloom filter of their
+user ids, under the project's id. Viewers who aren't in the filter, most
+visitors of a busy campaign, are answered without touching the database.
+A user in the filter is confirmed with a lookup on the unique (user,
+project) index, since a Bloom filter can have false positives.
+
+A filter holds every pledge up to its last_id and knows the project's
+version at that point. Every pledge bumps the version, so a filter older
+than the project may miss a backer. It then catches up on the pledges
+after last_id with a seek on the (project, id) index, instead of reading
+every backer again. Pledges of this process are added right away (see
+app.pledging), which keeps the filter current without any query. Deleting
+a pledge only leaves a false positive behind, the filter is rebuilt the
+next time it's needed.
+"""
+import hashlib
+import math
+
+from app.models import Pledge
+from django.conf import settings
+from django.core.cache import caches
+
+ERROR_RATE = 0.01
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=ERROR_RATE):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.count = 0
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # Double hashing: k positions out of two 64 bit halves of one digest
+        digest = hashlib.sha256(str(item).encode('utf-8')).digest()
+        first = int.from_bytes(digest[:8], 'big')
+        second = int.from_bytes(digest[8:16], 'big') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        self.count += 1
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+def backers_key(project_id):
+    return 'backers:{}'.format(project_id)
+
+
+def build(project):
+    # Room for the campaign to grow before the error rate goes up and it's rebuilt
+    bloom = BloomFilter(2 * project.backer_count + 100)
+    bloom.last_id = 0
+    bloom.version = -1
+    return bloom
+
+
+def catch_up(bloom, project):
+    """Add the pledges after bloom.last_id. False if the filter ran out of capacity."""
+    pledges = Pledge.objects.filter(project=project.pk, id__gt=bloom.last_id).order_by('id')
+    for pledge_id, user_id in pledges.values_list('id', 'user').iterator():
+        bloom.add(user_id)
+        bloom.last_id = pledge_id
+    # The project was loaded before the pledges, so every pledge up to its version is in
+    bloom.version = project.version
+    return bloom.count <= bloom.capacity
+
+
+def backers(project):
+    """The Bloom filter of the ids of the project's backers."""
+    cache = caches[settings.BACKER_CACHE]
+    key = backers_key(project.pk)
+    bloom = cache.get(key)
+    if bloom is not None and bloom.version >= project.version:
+        return bloom
+    if bloom is None or not catch_up(bloom, project):
+        bloom = build(project)
+        catch_up(bloom, project)
+    cache.set(key, bloom, settings.BACKER_CACHE_TIMEOUT)
+    return bloom
+
+
+def add_backer(project, pledge):
+    """
+    Add a committed pledge to the project's filter. `project` has the
+    version of the pledge's own bump, if the filter had the one before it
+    then no other pledge came in between.
+    """
+    cache = caches[settings.BACKER_CACHE]
+    key = backers_key(project.pk)
+    bloom = cache.get(key)
+    if bloom is None:
+        return
+    bloom.add(pledge.user_id)
+    if bloom.version == project.version - 1 and bloom.last_id < pledge.pk:
+        bloom.version = project.version
+        bloom.last_id = pledge.pk
+    cache.set(key, bloom, settings.BACKER_CACHE_TIMEOUT)
+
+
+def forget(project_id):
+    caches[settings.BACKER_CACHE].delete(backers_key(project_id))
+
+
+def is_backer(user, project):
+    if not user.is_authenticated() or user.pk not in backers(project):
+        return False
+    return Pledge.objects.filter(user=user.pk, project=project.pk).exists()
@@ -0,0 +1,229 @@
+"""
+Per-request SQL and timing instrumentation.
+
+RequestMetricsMiddleware samples a fraction of requests (METRICS_SAMPLE_RATE).
+For every sampled request it records, per URL name, the response time,
+the number of queries, the time spent in SQL and in template rendering,
+and how many queries were repeats of a statement already run by the same
+request (the signature of an N+1). Requests that aren't sampled only cost
+a call to random().
+
+The aggregates are exposed in the Prometheus text format by the `metrics`
+view, the slowest and most repeated statements by `slow_queries`. They are
+kept in memory by each worker process, so every scrape only sees the worker
+that answered it. Their samples carry a pid label to tell them apart, sum
+over it to get the totals.
+"""
+import collections
+import os
+import random
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.template import Context
+from django.template.backends.django import DjangoTemplates, Template
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SLOWEST_QUERIES = 20
+
+_local = threading.local()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def samples(self, name, labels):
+        for bound, count in zip(self.buckets, self.counts):
+            yield '{}_bucket{{{},le="{}"}} {}'.format(name, labels, bound, count)
+        yield '{}_bucket{{{},le="+Inf"}} {}'.format(name, labels, self.count)
+        yield '{}_sum{{{}}} {}'.format(name, labels, self.sum)
+        yield '{}_count{{{}}} {}'.format(name, labels, self.count)
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.sql_duration = Histogram(DURATION_BUCKETS)
+        self.template_duration = Histogram(DURATION_BUCKETS)
+        self.duplicate_queries = 0
+        # Normalized statement -> (highest number of runs in one request, example SQL)
+        self.repeated = {}
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.views = collections.defaultdict(ViewMetrics)
+        self.slowest = []  # (seconds, view, sql), slowest first
+
+    def record(self, view, duration, queries, template_duration):
+        sql_duration = sum(seconds for seconds, _ in queries)
+        runs = collections.Counter(normalize(sql) for _, sql in queries)
+        examples = {normalize(sql): sql for _, sql in queries}
+
+        with self._lock:
+            metrics = self.views[view]
+            metrics.duration.observe(duration)
+            metrics.queries.observe(len(queries))
+            metrics.sql_duration.observe(sql_duration)
+            metrics.template_duration.observe(template_duration)
+            for statement, count in runs.items():
+                if count > 1:
+                    metrics.duplicate_queries += count - 1
+                    if count > metrics.repeated.get(statement, (0, None))[0]:
+                        metrics.repeated[statement] = (count, examples[statement])
+
+            self.slowest.extend((seconds, view, sql) for seconds, sql in queries)
+            self.slowest.sort(key=lambda query: query[0], reverse=True)
+            del self.slowest[SLOWEST_QUERIES:]
+
+    def reset(self):
+        with self._lock:
+            self.views.clear()
+            del self.slowest[:]
+
+    def prometheus(self):
+        lines = []
+        pid = os.getpid()
+        with self._lock:
+            views = sorted(self.views.items())
+            for name, attribute, kind, help_text in [
+                ('kickfarter_request_duration_seconds', 'duration', 'histogram', 'Response time of sampled requests.'),
+                ('kickfarter_request_queries', 'queries', 'histogram', 'SQL queries per sampled request.'),
+                ('kickfarter_request_sql_seconds', 'sql_duration', 'histogram', 'Time spent in SQL per sampled request.'),
+                ('kickfarter_request_template_seconds', 'template_duration', 'histogram',
+                 'Time spent rendering templates per sampled request.'),
+            ]:
+                lines.append('# HELP {} {}'.format(name, help_text))
+                lines.append('# TYPE {} {}'.format(name, kind))
+                for view, metrics in views:
+                    lines.extend(getattr(metrics, attribute).samples(
+                        name, 'view="{}",pid="{}"'.format(escape(view), pid)))
+
+            lines.append('# HELP kickfarter_duplicate_queries_total Queries repeating a statement of the same request.')
+            lines.append('# TYPE kickfarter_duplicate_queries_total counter')
+            for view, metrics in views:
+                lines.append('kickfarter_duplicate_queries_total{{view="{}",pid="{}"}} {}'.format(
+                    escape(view), pid, metrics.duplicate_queries))
+
+        from app.cards import stats
+        lines.append('# HELP kickfarter_card_cache_requests_total Project card cache lookups.')
+        lines.append('# TYPE kickfarter_card_cache_requests_total counter')
+        lines.append('kickfarter_card_cache_requests_total{{result="hit",pid="{}"}} {}'.format(pid, stats.hits))
+        lines.append('kickfarter_card_cache_requests_total{{result="miss",pid="{}"}} {}'.format(pid, stats.misses))
+
+        from app.outbox import backlog
+        backlog = backlog()
+        lines.append('# HELP kickfarter_outbox_events Unprocessed outbox events, see `manage.py process_outbox`.')
+        lines.append('# TYPE kickfarter_outbox_events gauge')
+        lines.append('kickfarter_outbox_events{{state="pending"}} {}'.format(backlog['pending']))
+        lines.append('kickfarter_outbox_events{{state="failed"}} {}'.format(backlog['failed']))
+        return '\n'.join(lines) + '\n'
+
+    def queries_report(self):
+        with self._lock:
+            return {
+                'slowest': [
+                    {'seconds': seconds, 'view': view, 'sql': sql} for seconds, view, sql in self.slowest
+                ],
+                'repeated': {
+                    view: sorted(
+                        ({'runs': count, 'sql': sql} for count, sql in metrics.repeated.values()),
+                        key=lambda query: query['runs'], reverse=True,
+                    )
+                    for view, metrics in self.views.items() if metrics.repeated
+                },
+            }
+
+
+registry = Registry()
+
+
+def normalize(sql):
+    """Replace literals so the same statement with different parameters compares equal."""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    return re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+
+
+def escape(label):
+    return label.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RequestMetricsMiddleware:
+    def process_request(self, request):
+        _local.sampled = random.random() < settings.METRICS_SAMPLE_RATE
+        if not _local.sampled:
+            return
+        _local.template_duration = 0
+        _local.template_depth = 0
+        _local.debug_cursors = {}
+        for connection in connections.all():
+            _local.debug_cursors[connection.alias] = (connection.force_debug_cursor, len(connection.queries_log))
+            connection.force_debug_cursor = True
+        _local.started = time.perf_counter()
+
+    def process_response(self, request, response):
+        if not getattr(_local, 'sampled', False):
+            return response
+        _local.sampled = False
+        duration = time.perf_counter() - _local.started
+
+        queries = []
+        for connection in connections.all():
+            if connection.alias not in _local.debug_cursors:
+                continue
+            force_debug_cursor, start = _local.debug_cursors[connection.alias]
+            connection.force_debug_cursor = force_debug_cursor
+            queries.extend((float(query['time']), query['sql']) for query in list(connection.queries_log)[start:])
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match else 'unresolved'
+        registry.record(view, duration, queries, _local.template_duration)
+        return response
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        # Some template tags (django-bootstrap3) still pass a Context, which Django 1.10 won't take
+        if isinstance(context, Context):
+            context = context.flatten()
+        if not getattr(_local, 'sampled', False):
+            return super().render(context, request)
+
+        # Only time the outermost render so nested renders aren't counted twice
+        _local.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            _local.template_depth -= 1
+            if _local.template_depth == 0:
+                _local.template_duration += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """The regular Django template backend, timing every render of sampled requests."""
+
+    def from_string(self, template_code):
+        template = super().from_string(template_code)
+        return InstrumentedTemplate(template.template, self)
+
+    def get_template(self, *args, **kwargs):
+        template = super().get_template(*args, **kwargs)
+        return InstrumentedTemplate(template.template, self)
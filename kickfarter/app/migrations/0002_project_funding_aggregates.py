@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 12:29
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_funding_aggregates(apps, schema_editor):
+    Pledge = apps.get_model('app', 'Pledge')
+    Project = apps.get_model('app', 'Project')
+    totals = Pledge.objects.order_by().values('project').annotate(total=Sum('amount'), count=Count('id'))
+    for row in totals:
+        Project.objects.filter(pk=row['project']).update(pledged_total=row['total'] or 0, backer_count=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='backer_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='pledged_total',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_funding_aggregates, migrations.RunPython.noop),
+    ]
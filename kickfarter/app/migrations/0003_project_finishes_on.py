@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 12:30
+from __future__ import unicode_literals
+
+import datetime
+
+from django.db import migrations, models
+
+DEFAULT_DURATION = 60  # Project.DEFAULT_DURATION at the time of this migration
+
+
+def backfill_finishes_on(apps, schema_editor):
+    Project = apps.get_model('app', 'Project')
+    published = Project.objects.filter(published_on__isnull=False).values_list('pk', 'published_on')
+    for pk, published_on in published.iterator():
+        finishes_on = published_on + datetime.timedelta(days=DEFAULT_DURATION)
+        Project.objects.filter(pk=pk).update(finishes_on=finishes_on)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_project_funding_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='finishes_on',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='project',
+            index_together=set([('status', 'finishes_on')]),
+        ),
+        migrations.RunPython(backfill_finishes_on, migrations.RunPython.noop),
+    ]
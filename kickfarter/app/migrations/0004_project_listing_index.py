@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 12:31
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_project_finishes_on'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='project',
+            index_together=set([('status', 'finishes_on'), ('status', 'published_on')]),
+        ),
+    ]
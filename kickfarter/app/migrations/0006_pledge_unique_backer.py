@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 12:32
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+
+
+def remove_duplicate_pledges(apps, schema_editor):
+    """Keep the first pledge of every (user, project) pair so the unique index can be built."""
+    Pledge = apps.get_model('app', 'Pledge')
+    Project = apps.get_model('app', 'Project')
+    duplicates = (Pledge.objects.order_by().values('user', 'project')
+                  .annotate(first=Min('id'), count=Count('id')).filter(count__gt=1))
+    for row in duplicates:
+        Pledge.objects.filter(user=row['user'], project=row['project']).exclude(pk=row['first']).delete()
+        totals = Pledge.objects.filter(project=row['project']).aggregate(total=Sum('amount'), count=Count('id'))
+        Project.objects.filter(pk=row['project']).update(pledged_total=totals['total'] or 0, backer_count=totals['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_project_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_pledges, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='pledge',
+            unique_together=set([('user', 'project')]),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from app import search
+    search.rebuild(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    from app import search
+    if search.is_available(schema_editor.connection):
+        for suffix in ('_insert', '_delete', '_update'):
+            schema_editor.execute('DROP TRIGGER IF EXISTS {}{}'.format(search.FTS_TABLE, suffix))
+        schema_editor.execute('DROP TABLE IF EXISTS {}'.format(search.FTS_TABLE))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_pledge_unique_backer'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
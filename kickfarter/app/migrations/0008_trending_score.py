@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 12:36
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_project_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pledge',
+            name='created_on',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AlterIndexTogether(
+            name='project',
+            index_together=set([('status', 'finishes_on'), ('status', 'trending_score'), ('status', 'published_on')]),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 12:39
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_trending_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='cover_thumbnails_ready',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 12:42
+from __future__ import unicode_literals
+
+import os
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.utils.timezone
+
+
+def count_existing_files(apps, schema_editor):
+    """Existing cover images keep their names but get reference counts like every new blob."""
+    Project = apps.get_model('app', 'Project')
+    Blob = apps.get_model('app', 'Blob')
+    covers = Project.objects.exclude(cover_image='').exclude(cover_image__isnull=True)
+    for row in covers.order_by().values('cover_image').annotate(references=Count('id')).iterator():
+        path = os.path.join(settings.MEDIA_ROOT, row['cover_image'])
+        Blob.objects.create(
+            name=row['cover_image'],
+            size=os.path.getsize(path) if os.path.exists(path) else 0,
+            references=row['references'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_project_cover_thumbnails_ready'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('references', models.PositiveIntegerField(default=0)),
+                ('created_on', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(count_existing_files, migrations.RunPython.noop),
+    ]
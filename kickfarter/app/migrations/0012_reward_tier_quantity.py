@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 12:55
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_claimed(apps, schema_editor):
+    RewardTier = apps.get_model('app', 'RewardTier')
+    Pledge = apps.get_model('app', 'Pledge')
+    claimed = Pledge.objects.filter(chosen_reward_tier__isnull=False).order_by().values('chosen_reward_tier')
+    for row in claimed.annotate(count=Count('id')).iterator():
+        RewardTier.objects.filter(pk=row['chosen_reward_tier']).update(claimed=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_project_modified_on'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rewardtier',
+            name='claimed',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='rewardtier',
+            name='quantity',
+            field=models.PositiveIntegerField(blank=True, help_text='Leave empty for unlimited rewards', null=True),
+        ),
+        migrations.RunPython(count_claimed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 12:57
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+
+
+def backfill_daily_funding(apps, schema_editor):
+    Pledge = apps.get_model('app', 'Pledge')
+    DailyFunding = apps.get_model('app', 'DailyFunding')
+    days = (
+        Pledge.objects.order_by().extra(select={'day': 'date(app_pledge.created_on)'})
+        .values('project', 'day').annotate(amount=Sum('amount'), count=Count('id'))
+    )
+    DailyFunding.objects.bulk_create((
+        DailyFunding(project_id=row['project'], day=row['day'], amount=row['amount'], count=row['count'])
+        for row in days
+    ), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_reward_tier_quantity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyFunding',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('amount', models.FloatField(default=0)),
+                ('count', models.IntegerField(default=0)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_funding', to='app.Project')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyfunding',
+            unique_together=set([('project', 'day')]),
+        ),
+        migrations.RunPython(backfill_daily_funding, migrations.RunPython.noop),
+    ]
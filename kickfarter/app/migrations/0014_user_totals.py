@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 13:01
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def count_totals(apps, schema_editor):
+    User = apps.get_model('app', 'User')
+    Pledge = apps.get_model('app', 'Pledge')
+    Project = apps.get_model('app', 'Project')
+    backed = Pledge.objects.order_by().values('user').annotate(total=Sum('amount'), count=Count('id'))
+    for row in backed.iterator():
+        User.objects.filter(pk=row['user']).update(backed_total=row['total'], backed_count=row['count'])
+    created = Project.objects.order_by().values('created_by').annotate(count=Count('id'))
+    for row in created.iterator():
+        User.objects.filter(pk=row['created_by']).update(created_count=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_daily_funding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='backed_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='backed_total',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='created_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterIndexTogether(
+            name='pledge',
+            index_together=set([('user', 'created_on')]),
+        ),
+        migrations.RunPython(count_totals, migrations.RunPython.noop),
+    ]
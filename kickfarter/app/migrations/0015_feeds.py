@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 13:03
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_user_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='created_on',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='update',
+            name='created_on',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterIndexTogether(
+            name='comment',
+            index_together=set([('project', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='update',
+            index_together=set([('project', 'id')]),
+        ),
+    ]
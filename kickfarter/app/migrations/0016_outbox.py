@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 13:05
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_feeds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_on', models.DateTimeField(default=django.utils.timezone.now)),
+                ('read_on', models.DateTimeField(blank=True, null=True)),
+                ('update', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='app.Update')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(choices=[('update_posted', 'Update posted')], max_length=50)),
+                ('object_id', models.PositiveIntegerField()),
+                ('created_on', models.DateTimeField(default=django.utils.timezone.now)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('delivered', models.PositiveIntegerField(default=0)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('processed_on', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='pledge',
+            index_together=set([('user', 'created_on'), ('project', 'user')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='outboxevent',
+            index_together=set([('processed_on', 'id')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='notification',
+            unique_together=set([('update', 'user')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='notification',
+            index_together=set([('user', 'id')]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 13:14
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_outbox'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='project',
+            index_together=set([('currency', 'status'), ('status', 'finishes_on'), ('status', 'trending_score'), ('status', 'published_on')]),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 13:27
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_currency_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Stamp',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('changed_on', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 13:34
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0018_stamp'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='pledge',
+            index_together=set([('user', 'created_on'), ('project', 'user'), ('project', 'id')]),
+        ),
+    ]
@@ -1,10 +1,11 @@
 import datetime
 
-from app.exceptions import BackingException
 from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
 from django.contrib.auth.models import PermissionsMixin
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
 
 
 class UserManager(BaseUserManager):
@@ -23,6 +24,18 @@ class UserManager(BaseUserManager):
         user.save(using=self._db)
         return user
 
+    def update_totals(self, user_id, **changes):
+        """
+        UPDATE the stored totals of a user with `changes`, F() expressions
+        that is. app.auth caches logged in users, so the cached copy is
+        dropped now and again once the change is committed, in case a
+        request cached the old row in between.
+        """
+        from app import auth
+        self.filter(pk=user_id).update(**changes)
+        auth.forget(user_id)
+        transaction.on_commit(lambda: auth.forget(user_id))
+
 
 class User(AbstractBaseUser, PermissionsMixin):
     """Basic user because we don't want Django's user class."""
@@ -33,8 +46,41 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     is_admin = models.BooleanField(default=False)
 
+    # Denormalized aggregates over the user's pledges and projects, for the profile.
+    # Only ever changed with UserManager.update_totals(), a regular save() must never write them back.
+    COUNTER_FIELDS = ['backed_total', 'backed_count', 'created_count']
+    backed_total = models.FloatField(default=0, editable=False)
+    backed_count = models.PositiveIntegerField(default=0, editable=False)
+    created_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # What __str__() shows on the user's projects, see app.signals.user_renamed
+    DISPLAY_FIELDS = ['name', 'email']
+
     USERNAME_FIELD = 'email'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        user._saved_display = user._display()
+        return user
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+        self._saved_display = self._display()
+
+    def _display(self):
+        # Deferred fields stay unloaded
+        return tuple(self.__dict__.get(field) for field in self.DISPLAY_FIELDS)
+
+    def display_changed(self):
+        """Whether the name or email differ from the row this user was loaded from, or last saved to."""
+        return getattr(self, '_saved_display', None) != self._display()
+
     def get_short_name(self):
         return self.email
 
@@ -46,21 +92,41 @@ class User(AbstractBaseUser, PermissionsMixin):
         return self.is_admin
 
     def pledge(self, amount, project, reward_tier=None):
-        if project.created_by == self:
-            raise BackingException('You can\'t back your own projects')
-        if project in self.pledged_to.all():
-            raise BackingException('You have already backed this project')
-        if project.status != Project.STATUS_ACTIVE:
-            raise BackingException('You can only back active projects')
-
-        pledge = Pledge(project=project, user=self, amount=amount, chosen_reward_tier=reward_tier)
-        pledge.save()
-        return pledge
+        from app.pledging import pledge
+        return pledge(self, project, amount, reward_tier=reward_tier)
 
     def __str__(self):
         return self.name if self.name else self.email
 
 
+class ProjectQuerySet(models.QuerySet):
+    def active(self):
+        """
+        Projects whose campaign is running. Finished campaigns stay ACTIVE until
+        app.sweeper gets to them, so they are left out here as well.
+        """
+        # Active projects always have finishes_on. The OR keeps SQLite from using the
+        # (status, finishes_on) index for the range and sorting every active project,
+        # instead of walking the index of the listing's ordering.
+        running = Q(finishes_on__gt=timezone.now()) | Q(finishes_on__isnull=True)
+        return self.filter(running, status=Project.STATUS_ACTIVE)
+
+    def running(self):
+        """The projects that take pledges right now, see Project.is_running. For writes, not listings."""
+        return self.filter(status=Project.STATUS_ACTIVE, finishes_on__gt=timezone.now())
+
+    def for_listing(self):
+        """
+        Everything a project card needs in a single query. The funding numbers
+        are stored on the row itself so there's nothing left to aggregate.
+        """
+        return self.select_related('created_by')
+
+    def bump_version(self, **changes):
+        """UPDATE the projects with `changes` and mark everything rendered from them as stale."""
+        return self.update(version=F('version') + 1, modified_on=timezone.now(), **changes)
+
+
 class Project(models.Model):
     STATUS_ACTIVE = 0
     STATUS_SUCCESSFUL = 1
@@ -88,40 +154,84 @@ class Project(models.Model):
 
     DEFAULT_DURATION = 60  # in days
 
+    # Denormalized aggregates over Pledge and the version of the project's
+    # rendered fragments. They are only ever changed with F() expressions
+    # or bulk UPDATEs so a regular save() must never write them back.
+    COUNTER_FIELDS = ['pledged_total', 'backer_count', 'version', 'trending_score']
+    # Set by the thumbnail worker with bump_version(), a save() racing it must not reset them
+    WORKER_FIELDS = ['cover_thumbnails_ready']
+
     title = models.CharField(max_length=255)
     description = models.TextField()
     goal = models.FloatField(validators=[MinValueValidator(1)])
     cover_image = models.ImageField(null=True, blank=True)
+    cover_thumbnails_ready = models.BooleanField(default=False, editable=False)
     published_on = models.DateTimeField(null=True, blank=True)
+    finishes_on = models.DateTimeField(null=True, blank=True, editable=False)
     status = models.IntegerField(choices=PROJECT_STATUS, default=STATUS_DRAFT)
     currency = models.IntegerField(choices=CURRENCIES, default=CURRENCY_USD)
     created_by = models.ForeignKey('User', related_name='projects_created', on_delete=models.CASCADE)
     pledges = models.ManyToManyField('User', through='Pledge', related_name='pledged_to')
-
-    @classmethod
-    def from_db(cls, db, field_names, values):
-        """
-        Every time a project object is loaded from database, update its status.
-        This is an expensive way of doing the status updates but considering
-        this is a hobby project it shouldn't matter too much. I just wanted to avoid cron jobs and
-        other convoluted asynchronous systems.
-        """
-        instance = super().from_db(db, field_names, values)
-        instance.update_status()
-        return instance
+    objects = ProjectQuerySet.as_manager()
+    pledged_total = models.FloatField(default=0, editable=False)
+    backer_count = models.PositiveIntegerField(default=0, editable=False)
+    version = models.PositiveIntegerField(default=0, editable=False)
+    trending_score = models.FloatField(default=0, editable=False)  # see app.trending
+    # Bumped together with version, for Last-Modified
+    modified_on = models.DateTimeField(default=timezone.now, editable=False, db_index=True)
+
+    class Meta:
+        index_together = [
+            ('status', 'finishes_on'),
+            ('status', 'published_on'),
+            ('status', 'trending_score'),
+            # The currency filter of the admin
+            ('currency', 'status'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Stored copy of finished_on so expired campaigns can be found with an index range scan
+        self.finishes_on = self.finished_on if self.published_on else None
+        self.modified_on = timezone.now()
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS + self.WORKER_FIELDS
+            ]
+        # Computed above, whatever the caller asked to save. Otherwise Last-Modified would go stale.
+        kwargs['update_fields'] = set(update_fields) | {'version', 'modified_on', 'finishes_on'}
+        self.version = F('version') + 1
+        super().save(*args, **kwargs)
+        self.version = Project.objects.values_list('version', flat=True).get(pk=self.pk)
 
     @property
     def total_pledged_amount(self):
-        return sum([pledge.amount for pledge in self.pledge_set.all()])
+        return self.pledged_total
 
     @property
     def percentage_funded(self):
         return (self.total_pledged_amount / self.goal) * 100
 
+    @property
+    def cover_thumbnails(self):
+        """URLs of the resized cover images by size. Only valid if cover_thumbnails_ready."""
+        from app import thumbnails
+        return thumbnails.urls(self.cover_image.name)
+
     @property
     def is_draft(self):
         return self.status == Project.STATUS_DRAFT
 
+    @property
+    def is_running(self):
+        """Whether the project takes pledges, even if app.sweeper hasn't finished it yet."""
+        return (self.status == Project.STATUS_ACTIVE and self.published_on is not None and
+                self.finished_on > timezone.now())
+
     @property
     def finished_on(self):
         return self.published_on + datetime.timedelta(days=self.DEFAULT_DURATION)
@@ -144,6 +254,10 @@ class Project(models.Model):
         return self.finished_on - relative_to
 
     def update_status(self):
+        """
+        Finish this single project if its campaign is over. Doesn't save.
+        Use app.sweeper.expire_projects() to finish projects in bulk.
+        """
         # If the project is active and there's no time remaining
         if self.status == self.STATUS_ACTIVE and self.timedelta_remaining().total_seconds() <= 0:
             if self.total_pledged_amount >= self.goal:
@@ -160,21 +274,191 @@ class Pledge(models.Model):
     project = models.ForeignKey('Project', on_delete=models.CASCADE)
     user = models.ForeignKey('User', related_name='pledges', on_delete=models.CASCADE)
     chosen_reward_tier = models.ForeignKey('RewardTier', related_name='pledges', on_delete=models.CASCADE, null=True, blank=True)
+    created_on = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        # A user can back a project only once. Also the index behind "has this user backed this project?"
+        unique_together = [
+            ('user', 'project'),
+        ]
+        # A user's backing history, newest first, a project's backers by user id and
+        # a project's pledges after a given one (see app.membership)
+        index_together = [
+            ('user', 'created_on'),
+            ('project', 'user'),
+            ('project', 'id'),
+        ]
+
+
+class RewardTierQuerySet(models.QuerySet):
+    def available(self):
+        return self.filter(models.Q(quantity__isnull=True) | models.Q(claimed__lt=F('quantity')))
+
+    def claim(self, count=1):
+        """
+        Claim `count` rewards of the tiers that have that many left with a
+        single conditional UPDATE. Returns the number of tiers claimed from.
+        """
+        queryset = self.filter(models.Q(quantity__isnull=True) | models.Q(claimed__lte=F('quantity') - count))
+        return queryset.update(claimed=F('claimed') + count)
 
 
 class RewardTier(models.Model):
+    # Only ever changed with F() expressions, a regular save() must never write it back
+    COUNTER_FIELDS = ['claimed']
+
     description = models.TextField()
     minimum_amount = models.FloatField()
     project = models.ForeignKey('Project', related_name='reward_tiers', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(null=True, blank=True, help_text='Leave empty for unlimited rewards')
+    claimed = models.PositiveIntegerField(default=0, editable=False)
+    objects = RewardTierQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    @property
+    def remaining(self):
+        """Rewards left, None if unlimited."""
+        if self.quantity is None:
+            return None
+        return max(self.quantity - self.claimed, 0)
+
+    @property
+    def is_sold_out(self):
+        return self.remaining == 0
 
 
 class Comment(models.Model):
     text = models.TextField()
     project = models.ForeignKey('Project', related_name='comments', on_delete=models.CASCADE)
     user = models.ForeignKey('User', related_name='comments')  # Don't delete comments on user deletion
+    created_on = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # A project's comments, newest first, paginated by id
+        index_together = [
+            ('project', 'id'),
+        ]
 
 
 class Update(models.Model):
     text = models.TextField()
     project = models.ForeignKey('Project', related_name='updates', on_delete=models.CASCADE)
     backers_only = models.BooleanField(default=False)
+    created_on = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # A project's updates, newest first, paginated by id
+        index_together = [
+            ('project', 'id'),
+        ]
+
+
+class Notification(models.Model):
+    """Tells a backer about an update of a project they backed. Written by app.outbox."""
+    user = models.ForeignKey('User', related_name='notifications', on_delete=models.CASCADE)
+    update = models.ForeignKey('Update', related_name='notifications', on_delete=models.CASCADE)
+    created_on = models.DateTimeField(default=timezone.now)
+    read_on = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # Never twice for the same update, whatever happens to the worker fanning it out
+        unique_together = [
+            ('update', 'user'),
+        ]
+        # A user's notifications, newest first
+        index_together = [
+            ('user', 'id'),
+        ]
+
+
+class OutboxEvent(models.Model):
+    """
+    Work that follows a write, recorded in the same transaction as the
+    write and done later by app.outbox (`manage.py process_outbox`).
+    """
+    TOPIC_UPDATE_POSTED = 'update_posted'
+
+    TOPICS = [
+        (TOPIC_UPDATE_POSTED, 'Update posted'),
+    ]
+
+    topic = models.CharField(max_length=50, choices=TOPICS)
+    object_id = models.PositiveIntegerField()
+    created_on = models.DateTimeField(default=timezone.now)
+    # How far the work got, saved with every batch so a retry carries on from there
+    position = models.PositiveIntegerField(default=0)
+    delivered = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    processed_on = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # The backlog, oldest first
+        index_together = [
+            ('processed_on', 'id'),
+        ]
+
+    def __str__(self):
+        return '{} {}'.format(self.topic, self.object_id)
+
+
+class DailyFunding(models.Model):
+    """What a project raised on a day (UTC). Kept up to date by app.rollups."""
+    project = models.ForeignKey('Project', related_name='daily_funding', on_delete=models.CASCADE)
+    day = models.DateField()
+    amount = models.FloatField(default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        # Also the index behind a project's chart, which is a range scan over its days
+        unique_together = [
+            ('project', 'day'),
+        ]
+
+
+class StampManager(models.Manager):
+    def last(self, name):
+        """When `name` last happened, None if never."""
+        return self.filter(name=name).values_list('changed_on', flat=True).first()
+
+    def touch(self, name, now=None):
+        now = now or timezone.now()
+        if self.filter(name=name).update(changed_on=now):
+            return
+        try:
+            with transaction.atomic():
+                self.create(name=name, changed_on=now)
+        except IntegrityError:
+            # Created concurrently
+            self.filter(name=name).update(changed_on=now)
+
+
+class Stamp(models.Model):
+    """
+    When changes that leave no row behind to look at last happened, like
+    deleting a project (see app.views.listing_stamp).
+    """
+    PROJECT_DELETED = 'project_deleted'
+    TRENDING_RECOMPUTED = 'trending_recomputed'
+
+    name = models.CharField(max_length=64, primary_key=True)
+    changed_on = models.DateTimeField(default=timezone.now)
+    objects = StampManager()
+
+
+class Blob(models.Model):
+    """A file of app.storage.ContentAddressedStorage and how many file fields refer to it."""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    references = models.PositiveIntegerField(default=0)
+    created_on = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,117 @@
+"""
+Transactional outbox.
+
+Work that follows a write but is too big for the request, like notifying
+every backer of a project about an update, is recorded as an OutboxEvent
+in the same transaction as the write. It can't get lost once the write is
+committed and never happens for a write that was rolled back.
+
+process() does the work later, `manage.py process_outbox` runs it. An
+update is fanned out by streaming the project's backers in user id order
+over the (project, user) index, one batch per transaction: the batch's
+notifications are bulk inserted and the event's position moves past the
+batch's last user in the same commit. A worker that dies mid-way leaves
+the event at the last committed batch and the next run carries on from
+there, and the unique (update, user) index makes double deliveries
+impossible either way. Events that keep failing are retried up to
+MAX_ATTEMPTS times.
+"""
+import logging
+
+from app.exceptions import OutboxConflictException
+from app.models import Notification, OutboxEvent, Pledge, Update
+from django.db import transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_ATTEMPTS = 5
+
+
+def enqueue(topic, object_id):
+    """Record work for process(). Call it inside the transaction of the write it follows."""
+    return OutboxEvent.objects.create(topic=topic, object_id=object_id)
+
+
+def advance(event, position, delivered):
+    """
+    Move the event past a batch, in the batch's transaction. The UPDATE only
+    matches if no other worker moved the event in the meantime.
+    """
+    moved = OutboxEvent.objects.filter(pk=event.pk, position=event.position).update(
+        position=position, delivered=F('delivered') + delivered)
+    if not moved:
+        raise OutboxConflictException('Event {} was processed by another worker'.format(event.pk))
+
+
+def notify_backers(event, batch_size):
+    """Notify every backer of the project of a posted update. Yields the number of notifications of each batch."""
+    try:
+        project_id = Update.objects.values_list('project', flat=True).get(pk=event.object_id)
+    except Update.DoesNotExist:
+        return  # Deleted before it was fanned out
+
+    backers = Pledge.objects.filter(project=project_id).order_by('user').values_list('user', flat=True)
+    while True:
+        user_ids = list(backers.filter(user__gt=event.position)[:batch_size])
+        if not user_ids:
+            return
+        with transaction.atomic():
+            # Write first, see app.pledging
+            advance(event, user_ids[-1], len(user_ids))
+            Notification.objects.bulk_create(
+                Notification(user_id=user_id, update_id=event.object_id) for user_id in user_ids)
+        event.position = user_ids[-1]
+        event.delivered += len(user_ids)
+        yield len(user_ids)
+
+
+HANDLERS = {
+    OutboxEvent.TOPIC_UPDATE_POSTED: notify_backers,
+}
+
+
+def pending():
+    return OutboxEvent.objects.filter(processed_on__isnull=True, attempts__lt=MAX_ATTEMPTS)
+
+
+def process(batch_size=DEFAULT_BATCH_SIZE, on_progress=None):
+    """
+    Work through the backlog, oldest event first. `on_progress` is called
+    with the event and the size of every batch. Returns a tuple of (events
+    processed, items delivered).
+    """
+    events = delivered = 0
+    last_id = 0
+    while True:
+        chunk = list(pending().filter(id__gt=last_id).order_by('id')[:100])
+        if not chunk:
+            break
+        for event in chunk:
+            last_id = event.pk
+            try:
+                for count in HANDLERS[event.topic](event, batch_size):
+                    delivered += count
+                    if on_progress:
+                        on_progress(event, count)
+            except OutboxConflictException:
+                continue
+            except Exception as e:
+                logger.exception('Outbox event %s failed', event.pk)
+                OutboxEvent.objects.filter(pk=event.pk).update(attempts=F('attempts') + 1, last_error=repr(e))
+                continue
+            OutboxEvent.objects.filter(pk=event.pk).update(processed_on=timezone.now())
+            events += 1
+    return events, delivered
+
+
+def backlog():
+    """How many events are waiting and since when, and how many gave up after MAX_ATTEMPTS."""
+    waiting = pending().aggregate(pending=Count('id'), oldest=Min('created_on'))
+    return {
+        'pending': waiting['pending'],
+        'oldest': waiting['oldest'],
+        'failed': OutboxEvent.objects.filter(processed_on__isnull=True, attempts__gte=MAX_ATTEMPTS).count(),
+    }
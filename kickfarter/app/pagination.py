@@ -0,0 +1,92 @@
+"""
+Keyset (a.k.a. cursor) pagination.
+
+Instead of OFFSET, every page after the first filters on the ordering values
+of the last row of the previous page. With an index on the ordering columns
+page 1000 costs the same as page 1.
+"""
+import base64
+import binascii
+import json
+
+from app.exceptions import InvalidCursorException
+from django.db.models import Q
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _field(model, name):
+    return model._meta.pk if name == 'pk' else model._meta.get_field(name)
+
+
+def encode_cursor(values):
+    data = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value for value in values])
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_values(cursor, converters):
+    """Decode `cursor` and convert each of its values with the matching callable in `converters`."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (ValueError, binascii.Error) as e:
+        raise InvalidCursorException(str(e))
+    if not isinstance(values, list) or len(values) != len(converters):
+        raise InvalidCursorException('Cursor doesn\'t match the ordering')
+
+    try:
+        return [convert(value) for convert, value in zip(converters, values)]
+    except Exception as e:
+        raise InvalidCursorException(str(e))
+
+
+def decode_cursor(model, ordering, cursor):
+    return decode_values(cursor, [_field(model, name.lstrip('-')).to_python for name in ordering])
+
+
+def after(ordering, values):
+    """
+    Q object that matches rows coming after `values` in `ordering`, i.e.
+    (a, b) > (x, y) expands to a > x OR (a = x AND b > y).
+    """
+    condition = Q()
+    for i, name in enumerate(ordering):
+        field = name.lstrip('-')
+        lookup = '{}__{}'.format(field, 'lt' if name.startswith('-') else 'gt')
+        equal = {ordering[j].lstrip('-'): values[j] for j in range(i)}
+        condition |= Q(**dict(equal, **{lookup: values[i]}))
+    return condition
+
+
+def paginate(queryset, ordering, cursor=None, page_size=24):
+    """
+    Return a KeysetPage of `queryset` ordered by `ordering`, starting after `cursor`.
+
+    The last entry of `ordering` must be unique (usually the primary key) so
+    that ties are broken deterministically.
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = queryset.filter(after(ordering, decode_cursor(queryset.model, ordering, cursor)))
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, name.lstrip('-')) for name in ordering])
+
+    return KeysetPage(rows, next_cursor)
@@ -0,0 +1,65 @@
+"""
+The write path of backing a project.
+
+Duplicate pledges are rejected by the unique (user, project) index instead
+of loading the user's backing history, and the pledge and the project's
+aggregates are written in one transaction. So is the claim on a limited
+reward tier: a conditional UPDATE that only matches while the tier has
+rewards left, so no lock is held while Python code runs and a sold out
+tier can't be oversold by concurrent pledges. The same goes for the
+project: its aggregates are only updated while the campaign is running
+(ProjectQuerySet.running()),
+so a project canceled or finished after the caller loaded it takes no
+pledge.
+"""
+from app import live, membership, rollups
+from app.exceptions import BackingException
+from app.models import Pledge, Project, RewardTier, User
+from app.trending import pledge_weight
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+
+def pledge(user, project, amount, reward_tier=None):
+    if project.created_by_id == user.pk:
+        raise BackingException('You can\'t back your own projects')
+    if not project.is_running:
+        raise BackingException('You can only back active projects')
+    if reward_tier is not None:
+        if reward_tier.project_id != project.pk:
+            raise BackingException('This reward tier belongs to another project')
+        if amount < reward_tier.minimum_amount:
+            raise BackingException(
+                'This reward tier requires a pledge of at least {}'.format(reward_tier.minimum_amount))
+        # Only spares the write lock once a tier is gone, the claim below is what guarantees no overselling
+        if not RewardTier.objects.filter(pk=reward_tier.pk).available().exists():
+            raise BackingException('This reward tier is sold out')
+
+    try:
+        with transaction.atomic():
+            # Write first: on SQLite this takes the write lock up front instead of
+            # upgrading a read lock later, which is what deadlocks concurrent writers.
+            pledge = Pledge.objects.create(project=project, user=user, amount=amount, chosen_reward_tier=reward_tier)
+            if reward_tier is not None and not RewardTier.objects.filter(pk=reward_tier.pk).claim():
+                raise BackingException('This reward tier is sold out')
+            # The caller's instance may be stale, the campaign has to be running as of this transaction
+            if not Project.objects.filter(pk=project.pk).running().bump_version(
+                pledged_total=F('pledged_total') + amount,
+                backer_count=F('backer_count') + 1,
+                trending_score=F('trending_score') + pledge_weight(amount),
+            ):
+                raise BackingException('You can only back active projects')
+            rollups.record(project.pk, rollups.day_of(pledge.created_on), amount)
+            User.objects.update_totals(
+                user.pk,
+                backed_total=F('backed_total') + amount,
+                backed_count=F('backed_count') + 1,
+            )
+            (project.pledged_total, project.backer_count, project.version,
+             project.trending_score) = Project.objects.values_list(*Project.COUNTER_FIELDS).get(pk=project.pk)
+    except IntegrityError:
+        raise BackingException('You have already backed this project')
+
+    transaction.on_commit(lambda: membership.add_backer(project, pledge))
+    transaction.on_commit(lambda: live.publish(project))
+    return pledge
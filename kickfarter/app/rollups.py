@@ -0,0 +1,81 @@
+"""
+Daily funding rollups behind the funding charts.
+
+Every pledge adds its amount to the DailyFunding row of its project and
+day (UTC) in the same transaction, and a deleted pledge takes it off
+again. A chart over N days therefore reads at most N rows, however many
+pledges there are. rebuild() recomputes the rows from the pledges, for
+the initial backfill or after a bulk change that bypassed record().
+"""
+import datetime
+
+from app.models import DailyFunding, Pledge
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def day_of(moment):
+    return moment.astimezone(datetime.timezone.utc).date()
+
+
+def record(project_id, day, amount, count=1):
+    """Add `amount` and `count` pledges to the project's row of `day`. Pass negative values to take them off."""
+    rows = DailyFunding.objects.filter(project=project_id, day=day)
+    if rows.update(amount=F('amount') + amount, count=F('count') + count):
+        return
+    try:
+        with transaction.atomic():
+            DailyFunding.objects.create(project_id=project_id, day=day, amount=amount, count=count)
+    except IntegrityError:
+        # Someone else created the row in the meantime
+        rows.update(amount=F('amount') + amount, count=F('count') + count)
+
+
+def rebuild(project_ids=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Recompute the rollups of the given projects (all by default) from their pledges. Returns the number of rows."""
+    pledges = Pledge.objects.all()
+    rollups = DailyFunding.objects.all()
+    if project_ids is not None:
+        pledges = pledges.filter(project__in=project_ids)
+        rollups = rollups.filter(project__in=project_ids)
+
+    # date() exists in SQLite and PostgreSQL. Datetimes are stored in UTC, so are the days.
+    days = (
+        pledges.order_by().extra(select={'day': 'date(app_pledge.created_on)'})
+        .values('project', 'day').annotate(amount=Sum('amount'), count=Count('id'))
+    )
+    with transaction.atomic():
+        rollups.delete()
+        rows = [
+            DailyFunding(project_id=row['project'], day=row['day'], amount=row['amount'], count=row['count'])
+            for row in days
+        ]
+        DailyFunding.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def chart(project, days, today=None):
+    """
+    (day, amount, count, cumulative amount) for each of the last `days` days
+    up to `today`, oldest first. Reads only the rollup rows of those days.
+    """
+    if today is None:
+        today = day_of(datetime.datetime.now(datetime.timezone.utc))
+    start = today - datetime.timedelta(days=days - 1)
+    rows = {
+        day: (amount, count)
+        for day, amount, count in DailyFunding.objects.filter(project=project, day__gte=start, day__lte=today)
+        .values_list('day', 'amount', 'count')
+    }
+
+    # Whatever the project raised before the window is the stored total minus the window
+    cumulative = project.pledged_total - sum(amount for amount, _ in rows.values())
+    points = []
+    for offset in range(days):
+        day = start + datetime.timedelta(days=offset)
+        amount, count = rows.get(day, (0, 0))
+        cumulative += amount
+        points.append((day, amount, count, cumulative))
+    return points
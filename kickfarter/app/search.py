@@ -0,0 +1,130 @@
+"""
+Full-text search over projects.
+
+On SQLite, titles and descriptions are indexed by an FTS5 table that uses
+app_project as its external content. Triggers on app_project keep the
+index in sync with every insert, update and delete, including bulk ones.
+Results are ranked by BM25 and paginated with keyset cursors on
+(rank, id).
+
+Django's SQLite schema editor rebuilds app_project for many migrations,
+and that drops the triggers along with the old table. install() is
+idempotent and runs again after every migrate.
+"""
+import re
+
+from app.models import Project
+from app.pagination import KeysetPage, decode_values, encode_cursor, paginate
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+FTS_TABLE = 'app_project_fts'
+
+# Matches in the title weigh more than matches in the description
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+INSTALL_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+        title, description, content='app_project', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON app_project BEGIN
+        INSERT INTO {fts}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON app_project BEGIN
+        INSERT INTO {fts}({fts}, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF title, description ON app_project BEGIN
+        INSERT INTO {fts}({fts}, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {fts}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+
+SEARCH_SQL = """
+    SELECT id, rank FROM (
+        SELECT app_project.id AS id, bm25({fts}, %s, %s) AS rank
+        FROM {fts} JOIN app_project ON app_project.id = {fts}.rowid
+        WHERE {fts} MATCH %s AND app_project.status = %s AND app_project.finishes_on > %s
+    )
+    {after}
+    ORDER BY rank, id
+    LIMIT %s
+"""
+
+
+def is_available(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def install(using=connection):
+    if not is_available(using):
+        return
+    with using.cursor() as cursor:
+        for statement in INSTALL_SQL:
+            cursor.execute(statement.format(fts=FTS_TABLE))
+
+
+def rebuild(using=connection):
+    """Reindex every project from app_project."""
+    install(using)
+    with using.cursor() as cursor:
+        cursor.execute("INSERT INTO {fts}({fts}) VALUES ('rebuild')".format(fts=FTS_TABLE))
+
+
+def to_match_expression(query):
+    """
+    Turn free text into an FTS5 query that matches projects containing every
+    word, with the last word as a prefix. Quoting the words keeps FTS5's
+    query syntax out of the user's hands.
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    terms = ['"{}"'.format(word) for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search(query, cursor=None, page_size=24):
+    """Return a KeysetPage of active projects matching `query`, best match first."""
+    if not is_available():
+        matches = Project.objects.active().for_listing().filter(
+            Q(title__icontains=query) | Q(description__icontains=query))
+        return paginate(matches, ['-published_on', '-id'], cursor=cursor, page_size=page_size)
+
+    expression = to_match_expression(query)
+    if expression is None:
+        return KeysetPage([], None)
+
+    params = [
+        TITLE_WEIGHT, DESCRIPTION_WEIGHT, expression, Project.STATUS_ACTIVE,
+        connection.ops.adapt_datetimefield_value(timezone.now()),
+    ]
+    after = ''
+    if cursor:
+        rank, pk = decode_values(cursor, [float, int])
+        after = 'WHERE rank > %s OR (rank = %s AND id > %s)'
+        params += [rank, rank, pk]
+    params.append(page_size + 1)
+
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(SEARCH_SQL.format(fts=FTS_TABLE, after=after), params)
+        rows = db_cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        pk, rank = rows[-1]
+        next_cursor = encode_cursor([rank, pk])
+
+    projects = Project.objects.for_listing().in_bulk([pk for pk, _ in rows])
+    return KeysetPage([projects[pk] for pk, _ in rows if pk in projects], next_cursor)
@@ -0,0 +1,110 @@
+"""
+Session engine that reads sessions from the cache and writes them back to
+the database behind the request.
+
+Sessions are read from the cache, and only read from the database when the
+cache lost them. The cache (SESSION_CACHE_ALIAS) has to be one every
+process shares, or a logout in one worker wouldn't reach the others.
+
+With write-behind on, saving a session updates the cache right away, but
+the database copy only every SESSION_WRITE_BEHIND_INTERVAL seconds, when
+write_pending() writes the sessions changed in this process in one go.
+A new session, a login, a logout or a changed password is still written
+to the database at once, so losing the cache can't undo a logout or
+resurrect a session. Write-behind is only turned on by start_writer(), in
+the WSGI process, and never with a cache local to the process.
+
+Requests without a session cookie never load a session. So anonymous
+visitors cost no session queries at all.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends import cached_db
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'app.sessions'
+AUTH_KEYS = [SESSION_KEY, BACKEND_SESSION_KEY, HASH_SESSION_KEY]
+
+# Set by start_writer()
+write_behind = False
+
+_pending = {}  # session key -> data, in case the cache evicts the session before it's written
+_pending_lock = threading.Lock()
+
+
+def auth_part(data):
+    return tuple(data.get(key) for key in AUTH_KEYS)
+
+
+class SessionStore(cached_db.SessionStore):
+    cache_key_prefix = KEY_PREFIX
+
+    def load(self):
+        data = super().load()
+        # The cache never holds login state the database doesn't, see save()
+        self._stored_auth = auth_part(data)
+        return data
+
+    def save(self, must_create=False):
+        if (must_create or self.session_key is None or not write_behind or
+                auth_part(self._get_session(no_load=must_create)) != getattr(self, '_stored_auth', None)):
+            super().save(must_create)
+            self._stored_auth = auth_part(self._session)
+            with _pending_lock:
+                _pending.pop(self.session_key, None)
+            return
+
+        self._cache.set(self.cache_key, self._session, self.get_expiry_age())
+        with _pending_lock:
+            _pending[self.session_key] = dict(self._session)
+
+    def delete(self, session_key=None):
+        super().delete(session_key)
+        with _pending_lock:
+            _pending.pop(session_key or self.session_key, None)
+
+
+def write_pending():
+    """Write the sessions saved only to the cache so far to the database. Returns how many were written."""
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+
+    written = 0
+    for key, saved in pending.items():
+        store = SessionStore(key)
+        # Another process may have changed the session since, the cache has the latest copy
+        data = store._cache.get(store.cache_key)
+        if data is None:
+            if not DBStore.exists(store, key):
+                continue  # Logged out in another process
+            logger.warning('Session %s was evicted from the cache before it was written', key)
+            data = saved
+        store._session_cache = data
+        DBStore.save(store)
+        written += 1
+    return written
+
+
+def start_writer():
+    """Turn on write-behind and start the thread running write_pending(). Returns the thread or None."""
+    global write_behind
+    interval = settings.SESSION_WRITE_BEHIND_INTERVAL
+    if not interval:
+        return None
+    if isinstance(caches[settings.SESSION_CACHE_ALIAS], LocMemCache):
+        logger.warning('Session write-behind needs a cache shared by every process, writing sessions through')
+        return None
+
+    from app.sweeper import PeriodicRunner
+    writer = PeriodicRunner(interval, [write_pending])
+    writer.start()
+    write_behind = True
+    return writer
@@ -0,0 +1,90 @@
+from app import auth, db, membership, outbox, rollups, search, thumbnails, trending
+from app.models import OutboxEvent, Pledge, Project, RewardTier, Stamp, Update, User
+from django.db import connections, transaction
+from django.db.models import F
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+
+@receiver(post_delete, sender=Pledge)
+def pledge_deleted(sender, instance, **kwargs):
+    """Keep the denormalized aggregates of the project, reward tier and backer in sync when a pledge goes away."""
+    Project.objects.filter(pk=instance.project_id).bump_version(
+        pledged_total=F('pledged_total') - instance.amount,
+        backer_count=F('backer_count') - 1,
+        trending_score=trending.without_pledge(instance),
+    )
+    membership.forget(instance.project_id)
+    if instance.chosen_reward_tier_id:
+        RewardTier.objects.filter(pk=instance.chosen_reward_tier_id).update(claimed=F('claimed') - 1)
+    rollups.record(instance.project_id, rollups.day_of(instance.created_on), -instance.amount, count=-1)
+    User.objects.update_totals(
+        instance.user_id,
+        backed_total=F('backed_total') - instance.amount,
+        backed_count=F('backed_count') - 1,
+    )
+
+
+@receiver(post_save, sender=RewardTier)
+@receiver(post_delete, sender=RewardTier)
+def reward_tier_changed(sender, instance, **kwargs):
+    """Reward tiers are part of the project page."""
+    Project.objects.filter(pk=instance.project_id).bump_version()
+
+
+@receiver(post_save, sender=Project)
+def project_saved(sender, instance, created, **kwargs):
+    """Count new projects towards their creator's stored totals."""
+    if created:
+        User.objects.update_totals(instance.created_by_id, created_count=F('created_count') + 1)
+
+
+@receiver(post_delete, sender=Project)
+def project_deleted(sender, instance, **kwargs):
+    """
+    Release the cover image once the deletion is committed, other projects
+    may still use the same file. Also keep the creator's count of projects
+    and tell the listings that a project is gone.
+    """
+    User.objects.update_totals(instance.created_by_id, created_count=F('created_count') - 1)
+    Stamp.objects.touch(Stamp.PROJECT_DELETED)
+    if instance.cover_image:
+        name = instance.cover_image.name
+        transaction.on_commit(lambda: thumbnails.release(name))
+
+
+@receiver(post_save, sender=Update)
+def update_posted(sender, instance, created, **kwargs):
+    """Backers are notified by app.outbox, the event is committed together with the update."""
+    if created:
+        outbox.enqueue(OutboxEvent.TOPIC_UPDATE_POSTED, instance.pk)
+
+
+@receiver(post_save, sender=User)
+def user_renamed(sender, instance, created, **kwargs):
+    """Cards and project pages show their creator, they have to be rendered again with the new name."""
+    if not created and instance.display_changed():
+        Project.objects.filter(created_by=instance.pk).bump_version()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    """Logged in users are cached by app.auth.CachedModelBackend, password changes included."""
+    auth.forget(instance.pk)
+
+
+@receiver(post_migrate)
+def install_search_index(sender, using, **kwargs):
+    """Migrations that rebuild app_project drop the search triggers, so put them back."""
+    connection = connections[using]
+    if sender.name == 'app' and Project._meta.db_table in connection.introspection.table_names():
+        search.install(connection)
+
+
+@receiver(connection_created)
+def configure_connection(sender, connection, **kwargs):
+    """Production pragmas and the SQL function of app.trending, once per connection. See app/db.py."""
+    db.apply_pragmas(connection)
+    trending.install(connection)
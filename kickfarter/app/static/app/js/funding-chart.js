@@ -0,0 +1,30 @@
+/*
+ * Draws the funding chart of a project: the running total over the days
+ * of the chart, read from the element's data-url.
+ */
+$(function () {
+    $('.funding-chart').each(function () {
+        var chart = $(this);
+        $.getJSON(chart.data('url'), function (data) {
+            var days = data.days;
+            var width = chart.width() || 360;
+            var height = 120;
+            var top = Math.max.apply(null, days.map(function (day) { return day.cumulative; })) || 1;
+            var step = days.length > 1 ? width / (days.length - 1) : width;
+            var points = days.map(function (day, i) {
+                return (i * step).toFixed(1) + ',' + (height - day.cumulative / top * height).toFixed(1);
+            });
+
+            var svg = document.createElementNS('http://www.w3.org/2000/svg', 'svg');
+            svg.setAttribute('viewBox', '0 0 ' + width + ' ' + height);
+            svg.setAttribute('width', width);
+            svg.setAttribute('height', height);
+            var line = document.createElementNS('http://www.w3.org/2000/svg', 'polyline');
+            line.setAttribute('points', points.join(' '));
+            line.setAttribute('class', 'funding-chart__line');
+            svg.appendChild(line);
+            chart.append(svg);
+            chart.attr('title', days[0].day + ' to ' + days[days.length - 1].day);
+        });
+    });
+});
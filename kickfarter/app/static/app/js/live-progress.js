@@ -0,0 +1,32 @@
+/*
+ * Keeps the funding progress of a project page up to date with the
+ * Server-Sent Events of app/live.py, if the page has a live URL.
+ */
+$(function () {
+    var progress = $('.project-progress[data-live-url]');
+    if (!progress.length || !window.EventSource) {
+        return;
+    }
+
+    function remaining(seconds) {
+        if (seconds >= 2 * 86400) {
+            return Math.floor(seconds / 86400) + ' days to go';
+        }
+        if (seconds >= 2 * 3600) {
+            return Math.floor(seconds / 3600) + ' hours to go';
+        }
+        return Math.ceil(seconds / 60) + ' minutes to go';
+    }
+
+    var source = new EventSource(progress.data('live-url'));
+    source.addEventListener('progress', function (event) {
+        var data = JSON.parse(event.data);
+        progress.find('.project-progress__backers').text(data.backer_count);
+        progress.find('.project-progress__pledged').text(data.pledged_total.toLocaleString());
+        progress.find('.project-progress__remaining').text(
+            data.active ? remaining(data.seconds_remaining) : 'Funding has ended');
+        if (!data.active) {
+            source.close();
+        }
+    });
+});
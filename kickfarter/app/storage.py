@@ -0,0 +1,99 @@
+"""
+Content-addressed media storage.
+
+Every file is stored once, under the SHA-256 of its bytes, no matter how
+often or under which name it is uploaded. app.models.Blob counts the
+file fields referring to each file: saving adds a reference, delete()
+drops one and the file only goes away with the last reference.
+
+Uploads arriving through app.uploads.HashingUploadHandler are already
+on disk and hashed, so saving them is a rename. Anything else is
+streamed to a temporary file in chunks while it is hashed.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+
+def blob_name(directory, digest, extension):
+    return os.path.join(directory, digest[:2], digest[2:] + extension.lower())
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # Identical content is supposed to end up under the same name
+        return name
+
+    def _save(self, name, content):
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1]
+
+        digest = getattr(content, 'sha256', None)
+        if digest and hasattr(content, 'temporary_file_path'):
+            temporary, size = content.temporary_file_path(), content.size
+        else:
+            temporary, digest, size = self._spool(content)
+
+        name = blob_name(directory, digest, extension)
+        path = self.path(name)
+        try:
+            with transaction.atomic():
+                self._add_reference(name, size)
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    file_move_safe(temporary, path)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(path, self.file_permissions_mode)
+        finally:
+            # Upload handlers clean up their own temporary files
+            if not hasattr(content, 'temporary_file_path') and os.path.exists(temporary):
+                os.remove(temporary)
+        return name
+
+    def _spool(self, content):
+        """Copy `content` to a temporary file next to the blobs. Returns its path, SHA-256 and size."""
+        os.makedirs(self.location, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=self.location, suffix='.upload')
+        digest = hashlib.sha256()
+        size = 0
+        with os.fdopen(handle, 'wb') as f:
+            if hasattr(content, 'seek'):
+                content.seek(0)
+            for chunk in content.chunks():
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        return temporary, digest.hexdigest(), size
+
+    def _add_reference(self, name, size):
+        from app.models import Blob
+        if Blob.objects.filter(name=name).update(references=F('references') + 1):
+            return
+        try:
+            with transaction.atomic():
+                Blob.objects.create(name=name, size=size, references=1)
+        except IntegrityError:
+            # Someone else stored the same content in the meantime
+            Blob.objects.filter(name=name).update(references=F('references') + 1)
+
+    def delete(self, name):
+        """Drop a reference to `name` and delete the file if it was the last one."""
+        from app.models import Blob
+        with transaction.atomic():
+            if not Blob.objects.filter(name=name).update(references=F('references') - 1):
+                # Stored before this backend was in use, nothing else refers to it
+                super().delete(name)
+                return
+            if Blob.objects.filter(name=name, references=0).delete()[0]:
+                super().delete(name)
+                try:
+                    os.rmdir(os.path.dirname(self.path(name)))
+                except OSError:
+                    pass  # Other blobs share the directory
@@ -0,0 +1,89 @@
+"""
+Finishing campaigns whose time is up.
+
+Expired projects are moved out of ACTIVE with set-based UPDATEs instead of
+being checked one by one whenever they are loaded.
+"""
+import datetime
+import logging
+import threading
+
+from app.models import Project
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 10000
+
+
+def expire_projects(now=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Move every ACTIVE project whose campaign has finished to SUCCESSFUL or NOT_FUNDED.
+
+    Works through the (status, finishes_on) index in batches so a large backlog
+    doesn't hold the write lock for long. Returns a tuple of
+    (number of successful projects, number of not funded projects).
+    """
+    if not now:
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+    expired = Project.objects.filter(status=Project.STATUS_ACTIVE, finishes_on__lte=now)
+    successful = not_funded = 0
+
+    while True:
+        with transaction.atomic():
+            batch = list(expired.order_by('finishes_on').values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                break
+            in_batch = Project.objects.filter(pk__in=batch, status=Project.STATUS_ACTIVE)
+            successful += in_batch.filter(pledged_total__gte=F('goal')).bump_version(
+                status=Project.STATUS_SUCCESSFUL)
+            not_funded += in_batch.bump_version(status=Project.STATUS_NOT_FUNDED)
+
+    return successful, not_funded
+
+
+class PeriodicRunner(threading.Thread):
+    """Daemon thread that calls each of `tasks` every `interval` seconds."""
+
+    def __init__(self, interval, tasks):
+        super().__init__(name='kickfarter-periodic', daemon=True)
+        self.interval = interval
+        self.tasks = tasks
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            for task in self.tasks:
+                try:
+                    task()
+                except Exception:
+                    logger.exception('Periodic task %r failed', task)
+                finally:
+                    close_old_connections()
+
+    def stop(self):
+        self._stopped.set()
+
+
+def start_periodic_tasks():
+    """
+    Start the background threads the settings ask for. Only the WSGI process
+    runs them (see kickfarter/wsgi.py), not migrate, the tests or the shell.
+    """
+    from app import sessions
+    from app.trending import recompute
+
+    runners = []
+    if settings.EXPIRY_SWEEP_INTERVAL:
+        runners.append(PeriodicRunner(settings.EXPIRY_SWEEP_INTERVAL, [expire_projects]))
+    if settings.TRENDING_INTERVAL:
+        runners.append(PeriodicRunner(settings.TRENDING_INTERVAL, [recompute]))
+    for runner in runners:
+        runner.start()
+    writer = sessions.start_writer()
+    if writer is not None:
+        runners.append(writer)
+    return runners
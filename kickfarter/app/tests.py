@@ -2,9 +2,34 @@
 Ignore Django's features and assume that the relations
 between classes basically are fine. Only check custom methods.
 """
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 import os
 
+# Every cache local to the test run, the 'shared' one is on disk and holds the sessions of the dev server
+isolated_caches = override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+})
+
+
+def setUpModule():
+    isolated_caches.enable()
+
+
+def tearDownModule():
+    isolated_caches.disable()
+
+
+def use_temporary_media_root(test):
+    """Point MEDIA_ROOT at a new directory for `test`, removed with everything in it afterwards."""
+    import shutil
+    import tempfile
+    root = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, root)
+    override = override_settings(MEDIA_ROOT=root)
+    override.enable()
+    test.addCleanup(override.disable)
+
 
 class UserTest(TestCase):
     def setUp(self):
@@ -12,6 +37,7 @@ class UserTest(TestCase):
         from django.core.files.uploadedfile import SimpleUploadedFile
         from app.models import Project
 
+        use_temporary_media_root(self)
         self.user = User(email='test@example.com')
         self.user_two = User(email='test2@example.com')
         self.user.save()
@@ -27,8 +53,7 @@ class UserTest(TestCase):
         self.project.save()
 
     def tearDown(self):
-        from kickfarter import settings
-        os.remove(os.path.join(settings.MEDIA_ROOT, self.file.name))
+        self.project.cover_image.delete(save=False)
 
     def test_pledging(self):
         from app.exceptions import BackingException
@@ -39,7 +64,8 @@ class UserTest(TestCase):
             self.user.pledge(100, self.project)
             self.assertContains(e.msg, 'active projects')
 
-        self.project.status = Project.STATUS_ACTIVE
+        self.project.publish()
+        self.project.save()
 
         with self.assertRaises(BackingException) as e:
             # Pledging to their own project
@@ -59,6 +85,39 @@ class UserTest(TestCase):
             self.user.pledge(100, self.project)
             self.assertContains(e.msg, 'already backed')
 
+    def test_double_pledge(self):
+        from app.exceptions import BackingException
+        from app.models import Pledge
+
+        self.project.publish()
+        self.project.save()
+        self.user_two.pledge(100, self.project)
+
+        with self.assertRaisesRegex(BackingException, 'already backed'):
+            self.user_two.pledge(50, self.project)
+
+        self.assertEqual(1, Pledge.objects.filter(project=self.project).count())
+        self.project.refresh_from_db()
+        self.assertEqual(100, self.project.pledged_total)
+        self.assertEqual(1, self.project.backer_count)
+
+    def test_stale_project(self):
+        from app.exceptions import BackingException
+        from app.models import Pledge, Project
+
+        self.project.publish()
+        self.project.save()
+        Project.objects.filter(pk=self.project.pk).update(status=Project.STATUS_CANCELED)
+
+        with self.assertRaisesRegex(BackingException, 'active projects'):
+            self.user_two.pledge(100, self.project)
+
+        self.assertFalse(Pledge.objects.filter(project=self.project).exists())
+        self.project.refresh_from_db()
+        self.assertEqual((0, 0), (self.project.pledged_total, self.project.backer_count))
+        self.user_two.refresh_from_db()
+        self.assertEqual(0, self.user_two.backed_count)
+
 
 class ProjectTest(TestCase):
     def setUp(self):
@@ -79,12 +138,46 @@ class ProjectTest(TestCase):
         project.publish()
         self.assertEqual(Project.STATUS_ACTIVE, project.status)
         self.assertFalse(project.is_draft)
+        project.save()
 
         self.user_two.pledge(1, project)
 
         self.assertEqual(1, project.total_pledged_amount)
         self.assertEqual(1, project.percentage_funded)
 
+    def test_funding_aggregates(self):
+        from app.models import Project, User
+        from django.core.management import call_command
+        project = Project(title='Test Project', description='Test Project', goal=100, created_by=self.user)
+        project.publish()
+        project.save()
+        user_three = User(email='test3@example.com')
+        user_three.save()
+
+        pledge = self.user_two.pledge(10, project)
+        user_three.pledge(5, project)
+        self.assertEqual(15, project.pledged_total)
+        self.assertEqual(2, project.backer_count)
+
+        # Saving a stale instance must not clobber the counters
+        stale = Project.objects.get(pk=project.pk)
+        pledge.delete()
+        stale.title = 'Renamed'
+        stale.save()
+        project.refresh_from_db()
+        self.assertEqual('Renamed', project.title)
+        self.assertEqual(5, project.pledged_total)
+        self.assertEqual(1, project.backer_count)
+
+        Project.objects.filter(pk=project.pk).update(pledged_total=0, backer_count=0)
+        version = project.version
+        call_command('rebuild_funding_totals', stdout=open(os.devnull, 'w'))
+        project.refresh_from_db()
+        self.assertEqual(5, project.pledged_total)
+        self.assertEqual(1, project.backer_count)
+        # Repairs invalidate what was rendered from the drifted numbers
+        self.assertEqual(version + 1, project.version)
+
     def test_duration(self):
         import datetime
         from app.models import Project
@@ -112,12 +205,1418 @@ class ProjectTest(TestCase):
         self.assertGreaterEqual(0, project.timedelta_remaining(relative_to=after).total_seconds())
 
     def test_status_update(self):
+        from app.exceptions import BackingException
         from app.models import Project
+        from app.sweeper import expire_projects
         project = Project(title='Test Status Project', description='Test Project', goal=100, created_by=self.user)
         import datetime
         project.publish()
         project.published_on = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=Project.DEFAULT_DURATION+1)
         project.save()
+        funded = Project(title='Funded Project', description='Test Project', goal=1, created_by=self.user)
+        funded.publish()
+        funded.save()
+        self.user_two.pledge(1, funded)
+        funded.published_on = project.published_on
+        funded.save()
+
+        # Loading a project has no side effects anymore
+        self.assertEqual(Project.STATUS_ACTIVE, Project.objects.get(pk=project.pk).status)
+        # But until the sweeper gets to it, the finished campaign isn't listed and takes no pledges
+        self.assertFalse(Project.objects.active().filter(pk=project.pk).exists())
+        with self.assertRaises(BackingException):
+            self.user_two.pledge(1, project)
+
+        self.assertEqual((1, 1), expire_projects())
+        self.assertEqual(Project.STATUS_NOT_FUNDED, Project.objects.get(pk=project.pk).status)
+        self.assertEqual(Project.STATUS_SUCCESSFUL, Project.objects.get(pk=funded.pk).status)
+        self.assertEqual((0, 0), expire_projects())
+
+
+class ListingTest(TestCase):
+    def setUp(self):
+        from app.models import Project, User
+        from django.core.cache import cache
+        cache.clear()
+
+        self.user = User(email='test@example.com')
+        self.user.save()
+        for i in range(30):
+            project = Project(title='Project {}'.format(i), description='Test Project', goal=100, created_by=self.user)
+            project.publish()
+            project.save()
+
+    def test_discover_pages(self):
+        from app.models import Project
+        from app.views import PAGE_SIZE
+        from django.core.urlresolvers import reverse
+
+        # The three lookups of the stamp for the ETag and the page itself
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('discover'))
+        first_page = response.context['projects']
+        self.assertEqual(PAGE_SIZE, len(first_page))
+        self.assertTrue(first_page.has_next)
+
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('discover'), {'cursor': first_page.next_cursor})
+        second_page = response.context['projects']
+        self.assertEqual(30 - PAGE_SIZE, len(second_page))
+        self.assertFalse(second_page.has_next)
+
+        seen = [project.pk for project in first_page] + [project.pk for project in second_page]
+        expected = list(Project.objects.active().order_by('-published_on', '-id').values_list('pk', flat=True))
+        self.assertEqual(expected, seen)
+
+        self.assertEqual(404, self.client.get(reverse('discover'), {'cursor': 'garbage'}).status_code)
+
+
+class CardCacheTest(TestCase):
+    def setUp(self):
+        from app.cards import stats
+        from app.models import Project, User
+        from django.core.cache import cache
+        cache.clear()
+        stats.reset()
+
+        self.user = User(email='test@example.com')
+        self.user_two = User(email='test2@example.com')
+        self.user.save()
+        self.user_two.save()
+        self.project = Project(title='Cached Project', description='Test Project', goal=100, created_by=self.user)
+        self.project.publish()
+        self.project.save()
+
+    def test_cards_are_versioned(self):
+        from app.cards import render_cards, stats
+        from app.models import Project
+
+        first, = render_cards(Project.objects.for_listing())
+        render_cards(Project.objects.for_listing())
+        self.assertEqual((1, 1), (stats.hits, stats.misses))
+
+        self.user_two.pledge(50, self.project)
+        second, = render_cards(Project.objects.for_listing())
+        self.assertEqual(2, stats.misses)
+        self.assertNotEqual(first, second)
+        self.assertIn('50%', second)
+
+        self.project.title = 'Renamed Project'
+        self.project.save()
+        third, = render_cards(Project.objects.for_listing())
+        self.assertEqual(3, stats.misses)
+        self.assertIn('Renamed Project', third)
+
+    def test_creator_renamed(self):
+        from app.cards import render_cards
+        from app.models import Project, User
+
+        render_cards(Project.objects.for_listing())
+        # Logging in saves the user without changing what cards show
+        user = User.objects.get(pk=self.user.pk)
+        user.save(update_fields=['last_login'])
+        self.assertEqual(self.project.version, Project.objects.get(pk=self.project.pk).version)
+
+        user.name = 'Cardholder'
+        user.save()
+        card, = render_cards(Project.objects.for_listing())
+        self.assertIn('Cardholder', card)
+
+
+class ImportTest(TestCase):
+    def setUp(self):
+        from app.models import Project, User
+
+        self.user = User(email='creator@example.com')
+        self.user.save()
+        User(email='backer@example.com').save()
+        self.project = Project(title='Imported Project', description='Test Project', goal=100, created_by=self.user)
+        self.project.publish()
+        self.project.save()
+
+    def write(self, suffix, content):
+        import tempfile
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w', encoding='utf-8') as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_import_projects(self):
+        from app.models import Project
+        from django.core.management import call_command
+
+        path = self.write('.csv', (
+            'email,title,description,goal,currency,status,published_on\n'
+            'creator@example.com,Imported,Desc,500,€,ACTIVE,2016-02-01T10:00:00\n'
+            'nobody@example.com,Orphan,Desc,500,$,DRAFT,\n'
+            'creator@example.com,Draft,Desc,0,$,DRAFT,\n'
+        ))
+        call_command('import_projects', path, stdout=open(os.devnull, 'w'), stderr=open(os.devnull, 'w'))
+
+        imported = Project.objects.get(title='Imported')
+        self.assertEqual(Project.CURRENCY_EUR, imported.currency)
+        self.assertEqual(Project.STATUS_ACTIVE, imported.status)
+        self.assertEqual(imported.finished_on, imported.finishes_on)
+        self.assertFalse(Project.objects.filter(title__in=['Orphan', 'Draft']).exists())
+
+    def test_import_pledges(self):
+        import json
+        import math
+        from app.models import Pledge
+        from django.core.management import call_command
+
+        rows = [
+            {'email': 'backer@example.com', 'project': self.project.pk, 'amount': 20},
+            {'email': 'backer@example.com', 'project': self.project.pk, 'amount': 20},  # already backed
+            {'email': 'creator@example.com', 'project': self.project.pk, 'amount': 20},  # own project
+            {'email': 'new@example.com', 'project': self.project.pk, 'amount': 5},
+        ]
+        path = self.write('.jsonl', '\n'.join(json.dumps(row) for row in rows))
+        call_command('import_pledges', path, create_users=True, batch_size=3,
+                     stdout=open(os.devnull, 'w'), stderr=open(os.devnull, 'w'))
+
+        self.assertEqual(2, Pledge.objects.filter(project=self.project).count())
+        self.project.refresh_from_db()
+        self.assertEqual(25, self.project.pledged_total)
+        self.assertEqual(2, self.project.backer_count)
+        self.assertAlmostEqual(2 + math.log1p(20) + math.log1p(5), self.project.trending_score, places=3)
+
+    def test_conflicts(self):
+        import datetime
+        from app.importers import PledgeImporter
+        from app.models import Pledge, Project, User
+        from unittest import mock
+        backer = User.objects.get(email='backer@example.com')
+        User.objects.create(email='other@example.com')
+        rows = [(1, {'email': 'backer@example.com', 'project': self.project.pk, 'amount': 10}),
+                (2, {'email': 'other@example.com', 'project': self.project.pk, 'amount': 10})]
+
+        # The backer pledges on the site after the batch was checked
+        build = PledgeImporter.build
+
+        def build_racing_the_site(importer, row, *args):
+            if row['email'] == backer.email:
+                Pledge.objects.create(user=backer, project=self.project, amount=5)
+            return build(importer, row, *args)
+
+        errors = []
+        with mock.patch.object(PledgeImporter, 'build', build_racing_the_site):
+            importer = PledgeImporter(on_error=lambda line_num, message: errors.append(line_num)).run(rows)
+        self.assertEqual((1, 1), (importer.written, importer.rejected))
+        self.assertEqual([1], errors)
+
+        # Campaigns past their end take no pledges, even before the sweeper finishes them
+        Project.objects.filter(pk=self.project.pk).update(
+            finishes_on=datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=1))
+        User.objects.create(email='late@example.com')
+        errors = []
+        importer = PledgeImporter(on_error=lambda line_num, message: errors.append(message)).run(
+            [(1, {'email': 'late@example.com', 'project': self.project.pk, 'amount': 10})])
+        self.assertEqual(['You can only back active projects'], errors)
+
+    def test_malformed_rows(self):
+        from app.importers import PledgeImporter, read_rows
+        path = self.write('.jsonl', '\n'.join([
+            '{"email": "backer@example.com", "project": ',
+            '["backer@example.com"]',
+            '{"email": ["backer@example.com"], "project": 1}',
+            '{"email": "backer@example.com", "project": 1e400, "amount": 10}',
+            '{"email": "backer@example.com", "project": %d, "amount": 10, "reward_tier": [1]}' % self.project.pk,
+            '{"email": "backer@example.com", "project": %d, "amount": 10}' % self.project.pk,
+        ]))
+        errors = []
+        importer = PledgeImporter(on_error=lambda line_num, message: errors.append(line_num)).run(read_rows(path))
+        self.assertEqual((6, 1, 5), (importer.read, importer.written, importer.rejected))
+        self.assertEqual([1, 2, 3, 4, 5], sorted(errors))
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        from app.models import Project, User
+        from django.core.cache import cache
+        cache.clear()
+
+        self.user = User(email='test@example.com')
+        self.user.save()
+        for title, description in [
+            ('Solar powered toaster', 'Toast with the power of the sun'),
+            ('Moon boots', 'Walk like on the moon, toaster not included'),
+            ('Garden gnome army', 'A very large amount of garden gnomes'),
+        ]:
+            project = Project(title=title, description=description, goal=100, created_by=self.user)
+            project.publish()
+            project.save()
+
+    def test_search(self):
+        from app.models import Project
+        from app.search import search
+
+        results = search('toaster')
+        self.assertEqual(['Solar powered toaster', 'Moon boots'], [project.title for project in results])
+        self.assertEqual(['Garden gnome army'], [project.title for project in search('gnom')])
+        self.assertEqual([], list(search('"AND OR (')))
+
+        # The index follows updates and deletes
+        gnomes = Project.objects.get(title='Garden gnome army')
+        gnomes.title = 'Garden dwarf army'
+        gnomes.save()
+        self.assertEqual(['Garden dwarf army'], [project.title for project in search('dwarf')])
+        gnomes.delete()
+        self.assertEqual([], list(search('dwarf')))
+
+    def test_search_pages(self):
+        from app.search import search
+
+        first = search('toaster', page_size=1)
+        self.assertTrue(first.has_next)
+        second = search('toaster', cursor=first.next_cursor, page_size=1)
+        self.assertFalse(second.has_next)
+        self.assertEqual(['Solar powered toaster', 'Moon boots'], [project.title for project in list(first) + list(second)])
+
+    def test_discover_search(self):
+        from django.core.urlresolvers import reverse
+
+        response = self.client.get(reverse('discover'), {'q': 'moon'})
+        self.assertContains(response, 'Moon boots')
+        self.assertNotContains(response, 'Garden gnome army')
+
+
+class TrendingTest(TestCase):
+    def setUp(self):
+        from app.models import Project, User
+
+        self.creator = User(email='creator@example.com')
+        self.creator.save()
+        self.backers = [User(email='backer{}@example.com'.format(i)) for i in range(3)]
+        for backer in self.backers:
+            backer.save()
+
+        self.projects = []
+        for title in ['Old news', 'Hot stuff']:
+            project = Project(title=title, description='Test Project', goal=100, created_by=self.creator)
+            project.publish()
+            project.save()
+            self.projects.append(project)
+
+    def test_popular_feed(self):
+        import datetime
+        from app.models import Pledge, Project
+        from app.trending import recompute
+        from django.core.cache import cache
+        from django.core.urlresolvers import reverse
+        old, hot = self.projects
+
+        # A big pledge two weeks ago against a couple of small ones today
+        pledge = self.backers[0].pledge(1000, old)
+        Pledge.objects.filter(pk=pledge.pk).update(
+            created_on=datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=14))
+        self.backers[1].pledge(10, hot)
+        self.backers[2].pledge(10, hot)
+
+        # Before the periodic job runs, pledges count with their full weight
+        self.assertGreater(old.trending_score, 0)
+
+        recompute()
+        old.refresh_from_db()
+        hot.refresh_from_db()
+        self.assertEqual(0, old.trending_score)
+        self.assertGreater(hot.trending_score, 0)
+
+        cache.clear()
+        response = self.client.get(reverse('discover'), {'sort': 'popular'})
+        self.assertEqual([hot, old], list(response.context['projects']))
+        self.assertEqual(
+            list(Project.objects.order_by('-published_on', '-id')),
+            list(self.client.get(reverse('discover')).context['projects']),
+        )
+
+    def test_scores(self):
+        import datetime
+        from app.models import Pledge, Project
+        from app.trending import decayed_weight, recompute
+        old, hot = self.projects
+
+        pledges = [self.backers[0].pledge(100, hot), self.backers[1].pledge(10, hot)]
+        now = datetime.datetime.now(datetime.timezone.utc)
+        Pledge.objects.filter(pk=pledges[0].pk).update(created_on=now - datetime.timedelta(hours=36))
+        # Counted by the next run, not overwritten by this one
+        late = self.backers[2].pledge(20, hot)
+        Pledge.objects.filter(pk=late.pk).update(created_on=now + datetime.timedelta(seconds=1))
+
+        self.assertEqual(1, recompute(now=now, batch_size=1))
+        hot.refresh_from_db()
+        expected = sum(decayed_weight(pledge.amount, now - pledge.created_on) for pledge in Pledge.objects.filter(
+            project=hot, created_on__lte=now))
+        self.assertAlmostEqual(expected + decayed_weight(20, datetime.timedelta(0)), hot.trending_score)
+
+        # An hour later every score has decayed alike, so the order and the listing ETags stay
+        Pledge.objects.filter(pk=late.pk).update(created_on=now)
+        recompute(now=now)
+        hot.refresh_from_db()
+        recompute(now=now + datetime.timedelta(hours=1))
+        self.assertEqual(hot.modified_on, Project.objects.get(pk=hot.pk).modified_on)
+        self.assertAlmostEqual(hot.trending_score * 0.5 ** (1 / 24), Project.objects.get(pk=hot.pk).trending_score)
+        # Unlike a pledge dropping out of the window
+        recompute(now=now + datetime.timedelta(days=7))
+        self.assertLess(hot.modified_on, Project.objects.get(pk=hot.pk).modified_on)
+
+        # Deleting pledges takes their weight off again
+        old_pledge = self.backers[0].pledge(50, old)
+        old.refresh_from_db()
+        self.assertGreater(old.trending_score, 0)
+        old_pledge.delete()
+        old.refresh_from_db()
+        self.assertEqual(0, old.backer_count)
+        self.assertAlmostEqual(0, old.trending_score, places=3)
+
+
+class BenchmarkTest(TestCase):
+    def test_generate_and_measure(self):
+        from app import benchmark
+        from app.models import Project
+        from django.core.cache import cache
+        cache.clear()
+
+        benchmark.generate(20, seed=1)
+        self.assertEqual(20, Project.objects.count())
+        for name, user, url in benchmark.scenarios():
+            result = benchmark.measure(name, user, url, requests=1, warmup=0)
+            self.assertGreater(result['queries']['max'], 0)
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        from app.metrics import registry
+        from app.models import User
+        registry.reset()
+
+        self.admin = User.objects.create_superuser('admin@example.com', 'password')
+
+    def test_metrics(self):
+        from app.metrics import registry
+        from django.core.urlresolvers import reverse
+        from django.test import override_settings
+
+        with override_settings(METRICS_SAMPLE_RATE=0):
+            self.client.get(reverse('index'))
+        self.assertNotIn('index', registry.views)
+
+        with override_settings(METRICS_SAMPLE_RATE=1):
+            self.client.get(reverse('discover'))
+            self.client.get(reverse('discover'))
+
+        discover = registry.views['discover']
+        self.assertEqual(2, discover.duration.count)
+        self.assertGreater(discover.queries.sum, 0)
+        self.assertGreater(discover.template_duration.sum, 0)
+
+        self.assertEqual(403, self.client.get(reverse('metrics')).status_code)
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('metrics'))
+        self.assertContains(response, 'kickfarter_request_duration_seconds_count{{view="discover",pid="{}"}} 2'.format(
+            os.getpid()))
+        self.assertEqual(200, self.client.get(reverse('slow_queries')).status_code)
+
+    def test_duplicate_queries(self):
+        from app.metrics import registry
+
+        registry.record('profile', 0.1, [
+            (0.001, 'SELECT * FROM app_user WHERE id = 1'),
+            (0.002, 'SELECT * FROM app_user WHERE id = 2'),
+            (0.001, 'SELECT * FROM app_user WHERE id = 3'),
+            (0.004, "SELECT * FROM app_project WHERE title = 'x'"),
+        ], 0.05)
+        self.assertEqual(2, registry.views['profile'].duplicate_queries)
+        self.assertEqual(0.004, registry.queries_report()['slowest'][0]['seconds'])
+        self.assertEqual(3, registry.queries_report()['repeated']['profile'][0]['runs'])
+
+
+class ThumbnailTest(TestCase):
+    def setUp(self):
+        import io
+        from app.models import Project, User
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+
+        use_temporary_media_root(self)
+        self.user = User(email='test@example.com')
+        self.user.save()
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (1600, 900), (200, 40, 40)).save(buffer, 'PNG')
+        self.project = Project(
+            title='Pretty Project',
+            description='Test Project',
+            goal=100,
+            created_by=self.user,
+            cover_image=SimpleUploadedFile('cover.png', buffer.getvalue(), content_type='image/png'),
+        )
+        self.project.publish()
+        self.project.save()
+
+    def tearDown(self):
+        from app import thumbnails
+        thumbnails.release(self.project.cover_image.name)
+
+    def test_generate(self):
+        from app import thumbnails
+        from app.cards import render_cards
+        from app.models import Project
+        from django.core.cache import cache
+        from PIL import Image
+        cache.clear()
+
+        self.assertIn(self.project.cover_image.url, render_cards([self.project])[0])
+
+        thumbnails.generate(self.project.cover_image.name)
+        for size, dimensions in thumbnails.SIZES.items():
+            path = thumbnails.storage.path(thumbnails.thumbnail_name(self.project.cover_image.name, size))
+            with Image.open(path) as image:
+                self.assertEqual(dimensions, image.size)
+
+        project = Project.objects.get(pk=self.project.pk)
+        self.assertTrue(project.cover_thumbnails_ready)
+        card = render_cards([project])[0]
+        self.assertIn(project.cover_thumbnails['card_2x'] + ' 2x', card)
+        self.assertNotIn(project.cover_image.url, card)
+
+        # An edit that loaded the project before the thumbnails were done keeps them
+        self.project.title = 'Prettier Project'
+        self.project.save()
+        self.assertTrue(Project.objects.get(pk=self.project.pk).cover_thumbnails_ready)
+
+
+class StorageTest(TestCase):
+    def setUp(self):
+        from app.models import User
+        use_temporary_media_root(self)
+        self.user = User(email='test@example.com')
+        self.user.set_password('password')
+        self.user.save()
+
+    def image(self, name='cover.png', size=(64, 48)):
+        import io
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (40, 200, 40)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_deduplication(self):
+        from app.models import Blob, Project
+        from django.core.files.storage import default_storage
+
+        projects = []
+        for name in ['cover.png', 'same-cover.png']:
+            project = Project(title=name, description='Test Project', goal=100, created_by=self.user)
+            project.cover_image = self.image(name)
+            project.save()
+            projects.append(project)
+
+        name = projects[0].cover_image.name
+        self.assertEqual(name, projects[1].cover_image.name)
+        self.assertEqual(2, Blob.objects.get(name=name).references)
+
+        projects[0].cover_image.delete(save=False)
+        self.assertTrue(default_storage.exists(name))
+        projects[1].cover_image.delete(save=False)
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(Blob.objects.filter(name=name).exists())
+
+    def test_upload_limits(self):
+        from app.models import Blob, Project
+        from django.core.urlresolvers import reverse
+        from django.test import override_settings
+
+        self.client.login(email='test@example.com', password='password')
+        data = {'title': 'Test', 'description': 'Test Project', 'currency': Project.CURRENCY_USD, 'goal': 100,
+                'reward_tiers-TOTAL_FORMS': 0, 'reward_tiers-INITIAL_FORMS': 0}
+
+        with override_settings(MAX_UPLOAD_SIZE=100):
+            response = self.client.post(reverse('start_project'), dict(data, cover_image=self.image()))
+        self.assertIn('must not be larger', response.context['form'].errors['cover_image'][0])
+
+        with override_settings(UPLOAD_CONTENT_TYPES=['image/jpeg']):
+            response = self.client.post(reverse('start_project'), dict(data, cover_image=self.image()))
+        self.assertIn('Upload a JPEG', response.context['form'].errors['cover_image'][0])
+        self.assertFalse(Blob.objects.exists())
+
+        response = self.client.post(reverse('start_project'), dict(data, cover_image=self.image()))
+        self.assertEqual(302, response.status_code)
+        project = Project.objects.get()
+        self.addCleanup(project.cover_image.delete, save=False)
+        self.assertEqual(1, Blob.objects.get(name=project.cover_image.name).references)
+
+
+class StaticFilesTest(TestCase):
+    def test_precompressed(self):
+        import shutil
+        import tempfile
+        from app.assets import IMMUTABLE_CACHE_CONTROL, PrecompressedStaticFiles
+        from django.contrib.staticfiles.storage import staticfiles_storage
+        from django.core.management import call_command
+        from django.test import override_settings
+
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        with override_settings(STATIC_ROOT=root):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            url = staticfiles_storage.url('app/css/main.css')
+            html = self.client.get('/').content.decode('utf-8')
+        self.assertRegex(url, r'^/static/app/css/main\.[0-9a-f]{12}\.css$')
+        self.assertIn(url, html)
+
+        def application(environ, start_response):
+            start_response('404 Not Found', [])
+            return [b'django']
+
+        handler = PrecompressedStaticFiles(application, root=root, prefix='/static/')
+        responses = []
+
+        def get(path, **environ):
+            environ.update(REQUEST_METHOD='GET', PATH_INFO=path)
+            body = b''.join(handler(environ, lambda status, headers: responses.append((status, dict(headers)))))
+            return responses[-1] + (body,)
+
+        status, headers, body = get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual('200 OK', status)
+        self.assertEqual('gzip', headers['Content-Encoding'])
+        self.assertEqual(IMMUTABLE_CACHE_CONTROL, headers['Cache-Control'])
+        with open(os.path.join(root, url[len('/static/'):]) + '.gz', 'rb') as f:
+            self.assertEqual(f.read(), body)
+
+        status, headers, body = get(url)
+        self.assertNotIn('Content-Encoding', headers)
+        self.assertEqual(int(headers['Content-Length']), len(body))
+
+        self.assertEqual('304 Not Modified', get(url, HTTP_IF_NONE_MATCH=headers['ETag'])[0])
+        self.assertEqual(b'django', get('/static/../../etc/passwd')[2])
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        from app.models import Project, User
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User(email='test@example.com')
+        self.user.set_password('password')
+        self.user.save()
+        self.backer = User(email='test2@example.com')
+        self.backer.save()
+
+        self.project = Project(title='Test', description='Test Project', goal=100, created_by=self.user)
+        self.project.publish()
+        self.project.save()
+
+    def test_view_project(self):
+        from app.models import RewardTier
+        from django.core.urlresolvers import reverse
+        url = reverse('view_project', args=[self.project.pk])
+
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(304, self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code)
+
+        self.backer.pledge(10, self.project)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        etag = response['ETag']
+
+        RewardTier.objects.create(project=self.project, description='Sticker', minimum_amount=5)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Sticker')
+
+        # Pages of logged in users differ, and Last-Modified can't tell users apart
+        etag = response['ETag']
+        self.client.login(email='test@example.com', password='password')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertEqual(304, self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code)
+
+    def test_creator_renamed(self):
+        from django.core.urlresolvers import reverse
+        urls = [reverse('view_project', args=[self.project.pk]), reverse('discover')]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+
+        self.user.name = 'Renamed Creator'
+        self.user.save()
+        for url, etag in zip(urls, etags):
+            self.assertContains(self.client.get(url, HTTP_IF_NONE_MATCH=etag), 'Renamed Creator')
+
+    def test_partial_save(self):
+        from app.models import Project
+        import datetime
+        modified_on = self.project.modified_on
+
+        self.project.title = 'Renamed'
+        self.project.save(update_fields=['title'])
+        stored = Project.objects.get(pk=self.project.pk)
+        self.assertGreater(stored.modified_on, modified_on)
+        self.assertEqual(stored.modified_on, self.project.modified_on)
+
+        self.project.published_on -= datetime.timedelta(days=1)
+        self.project.save(update_fields=['published_on'])
+        self.assertEqual(self.project.finished_on, Project.objects.get(pk=self.project.pk).finishes_on)
+
+    def test_draft(self):
+        from app.models import Project
+        from django.core.urlresolvers import reverse
+        draft = Project.objects.create(title='Draft', description='Test Project', goal=100, created_by=self.user)
+        url = reverse('view_project', args=[draft.pk])
+
+        # Guessing the ETag doesn't tell anyone else that the draft exists
+        etag = '"project-{}-{}-0"'.format(draft.pk, draft.version)
+        self.assertEqual(403, self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+        self.client.force_login(self.backer)
+        etag = '"project-{}-{}-{}"'.format(draft.pk, draft.version, self.backer.pk)
+        self.assertEqual(403, self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+        self.client.force_login(self.user)
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(304, self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+    def test_listings(self):
+        from app import sweeper
+        from django.core.urlresolvers import reverse
+        import datetime
+
+        for url in [reverse('index'), reverse('discover') + '?sort=popular']:
+            etag = self.client.get(url)['ETag']
+            self.assertEqual(304, self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+        url = reverse('index')
+        etag = self.client.get(url)['ETag']
+        sweeper.expire_projects(now=self.project.finished_on + datetime.timedelta(days=1))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertNotContains(response, 'Test Project')
+
+    def test_listings_without_changed_rows(self):
+        from app.models import Project
+        from django.core.urlresolvers import reverse
+        from unittest import mock
+        import datetime
+        url = reverse('index')
+        other = Project(title='Other', description='Other Project', goal=100, created_by=self.user)
+        other.publish()
+        other.save()
+
+        # Deleting a project leaves no row behind to change
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        Project.objects.filter(pk=other.pk).delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(200, response.status_code)
+        self.assertNotContains(response, 'Other Project')
+
+        # A campaign that ended isn't listed anymore, even before the sweeper gets to it
+        etag = response['ETag']
+        later = self.project.finished_on + datetime.timedelta(seconds=1)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertNotContains(response, 'Test Project')
+
+
+class ApiTest(TestCase):
+    def setUp(self):
+        from app.models import Project, RewardTier, User
+        self.user = User(email='test@example.com')
+        self.user.save()
+        self.backers = [User.objects.create(email='backer{}@example.com'.format(i)) for i in range(3)]
+
+        self.projects = []
+        for i in range(5):
+            project = Project(title='Project {}'.format(i), description='Test Project', goal=100, created_by=self.user)
+            project.publish()
+            project.save()
+            self.projects.append(project)
+        Project(title='Draft', description='Test Project', goal=100, created_by=self.user).save()
+
+        self.tier = RewardTier.objects.create(project=self.projects[0], description='Sticker', minimum_amount=5)
+        for i, backer in enumerate(self.backers):
+            backer.pledge(10 * (i + 1), self.projects[0], reward_tier=self.tier if i else None)
+
+    def get_json(self, url, **params):
+        import json
+        response = self.client.get(url, params)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response.status_code, json.loads(content.decode('utf-8'))
+
+    def test_projects(self):
+        from app import api
+        from django.core.urlresolvers import reverse
+        from unittest import mock
+        url = reverse('api_projects')
+
+        # Batches smaller than the catalog, so the export spans several of them
+        with mock.patch.object(api, 'BATCH_SIZE', 2):
+            status, data = self.get_json(url)
+        self.assertEqual(200, status)
+        self.assertEqual([project.pk for project in self.projects], [project['id'] for project in data['results']])
+        self.assertIsNone(data['next'])
+        first = data['results'][0]
+        self.assertEqual(60, first['pledged_total'])
+        self.assertEqual(3, first['backer_count'])
+        self.assertEqual('active', first['status'])
+        self.assertEqual([{'id': self.tier.pk, 'description': 'Sticker', 'minimum_amount': 5, 'quantity': None,
+                           'backer_count': 2, 'remaining': None}], first['reward_tiers'])
+
+        status, page = self.get_json(url, limit=3, fields='id,title')
+        self.assertEqual([{'id': project.pk, 'title': project.title} for project in self.projects[:3]], page['results'])
+        status, page = self.get_json(url, limit=3, fields='id', cursor=page['next'])
+        self.assertEqual([project.pk for project in self.projects[3:]], [project['id'] for project in page['results']])
+        self.assertIsNone(page['next'])
+
+        # Leaving out reward_tiers saves a query
+        with self.assertNumQueries(1):
+            self.get_json(url, fields='id,pledged_total')
+
+        self.assertEqual(400, self.get_json(url, fields='id,password')[0])
+        self.assertEqual(400, self.get_json(url, status='draft')[0])
+        self.assertEqual(400, self.get_json(url, cursor='nope')[0])
+
+    def test_project(self):
+        from django.core.urlresolvers import reverse
+        from app.models import Project
+        draft = Project.objects.get(title='Draft')
+
+        status, data = self.get_json(reverse('api_project', args=[self.projects[1].pk]), fields='title,percentage_funded')
+        self.assertEqual({'title': 'Project 1', 'percentage_funded': 0}, data)
+        self.assertEqual(404, self.client.get(reverse('api_project', args=[draft.pk])).status_code)
+
+        status, data = self.get_json(reverse('api_pledge_stats', args=[self.projects[0].pk]))
+        self.assertEqual(3, data['backer_count'])
+        self.assertEqual(20, data['average_pledge'])
+        self.assertEqual(30, data['largest_pledge'])
+        self.assertEqual([{'id': self.tier.pk, 'minimum_amount': 5, 'backer_count': 2, 'pledged_total': 50}],
+                         data['reward_tiers'])
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        from app.models import Project, RewardTier, User
+        self.user = User(email='test@example.com')
+        self.user.set_password('password')
+        self.user.save()
+
+        self.project = Project(title='Test', description='Test Project', goal=100, created_by=self.user)
+        self.project.publish()
+        self.project.save()
+        tier = RewardTier.objects.create(project=self.project, description='=Sticker', minimum_amount=5)
+        for i in range(5):
+            backer = User.objects.create(email='backer{}@example.com'.format(i))
+            backer.pledge(5 + i, self.project, reward_tier=tier if i % 2 else None)
+
+    def test_export_backers(self):
+        import csv
+        import io
+        from app import exports
+        from app.models import User
+        from django.core.urlresolvers import reverse
+        url = reverse('export_backers', args=[self.project.pk])
+
+        self.assertEqual(302, self.client.get(url).status_code)
+        User.objects.create_user(email='test2@example.com', password='password')
+        self.client.login(email='test2@example.com', password='password')
+        self.assertEqual(403, self.client.get(url).status_code)
+
+        self.client.login(email='test@example.com', password='password')
+        response = self.client.get(url)
+        # One joined query per batch
+        with self.assertNumQueries(3):
+            chunks = list(exports.backers_csv(self.project.pk, batch_size=2))
+        self.assertEqual(b''.join(response.streaming_content).decode('utf-8'), ''.join(chunks))
+        self.assertEqual(4, len(chunks))
+
+        rows = list(csv.reader(io.StringIO(''.join(chunks))))
+        self.assertEqual('Email', rows[0][1])
+        self.assertEqual(['backer{}@example.com'.format(i) for i in range(5)], [row[1] for row in rows[1:]])
+        self.assertEqual(['', "'=Sticker", '', "'=Sticker", ''], [row[4] for row in rows[1:]])
+
+
+class RewardTierTest(TestCase):
+    def setUp(self):
+        from app.models import Project, RewardTier, User
+        self.user = User(email='test@example.com')
+        self.user.save()
+        self.backers = [User.objects.create(email='backer{}@example.com'.format(i)) for i in range(4)]
+
+        self.project = Project(title='Test', description='Test Project', goal=100, created_by=self.user)
+        self.project.publish()
+        self.project.save()
+        self.tier = RewardTier.objects.create(
+            project=self.project, description='Early bird', minimum_amount=10, quantity=2)
+
+    def test_quantity(self):
+        from app.exceptions import BackingException
+        from app.models import Pledge
+        from django.core.urlresolvers import reverse
+
+        with self.assertRaisesRegex(BackingException, 'at least'):
+            self.backers[0].pledge(5, self.project, reward_tier=self.tier)
+        self.backers[0].pledge(10, self.project, reward_tier=self.tier)
+        self.backers[1].pledge(20, self.project, reward_tier=self.tier)
+        with self.assertRaisesRegex(BackingException, 'sold out'):
+            self.backers[2].pledge(10, self.project, reward_tier=self.tier)
+        self.assertContains(self.client.get(reverse('view_project', args=[self.project.pk])), 'Sold out')
+
+        # The failed pledge left no trace, and a cancelled one frees its reward again
+        self.project.refresh_from_db()
+        self.assertEqual(2, self.project.backer_count)
+        Pledge.objects.get(user=self.backers[0]).delete()
+        self.tier.refresh_from_db()
+        self.assertEqual(1, self.tier.remaining)
+        self.backers[2].pledge(10, self.project, reward_tier=self.tier)
+
+        # Editing the tier mustn't overwrite what was claimed in the meantime
+        stale = type(self.tier).objects.get(pk=self.tier.pk)
+        stale.claimed = 0
+        stale.description = 'Early bird special'
+        stale.save()
+        self.tier.refresh_from_db()
+        self.assertEqual((0, 'Early bird special'), (self.tier.remaining, self.tier.description))
+
+    def test_form(self):
+        from app.forms import RewardTierForm
+        self.backers[0].pledge(10, self.project, reward_tier=self.tier)
+        self.tier.refresh_from_db()
+        data = {'description': 'Early bird', 'minimum_amount': 10}
+        self.assertFalse(RewardTierForm(dict(data, quantity=0), instance=self.tier).is_valid())
+        self.assertTrue(RewardTierForm(dict(data, quantity=1), instance=self.tier).is_valid())
+        self.assertTrue(RewardTierForm(data, instance=self.tier).is_valid())
+
+    def test_import(self):
+        from app.importers import PledgeImporter
+        rows = [(i + 1, {'email': backer.email, 'project': self.project.pk, 'amount': 10, 'reward_tier': self.tier.pk})
+                for i, backer in enumerate(self.backers)]
+        errors = []
+        importer = PledgeImporter(on_error=lambda line_num, message: errors.append(message)).run(rows)
+        self.assertEqual(2, importer.written)
+        self.assertEqual(['This reward tier is sold out'] * 2, errors)
+        self.tier.refresh_from_db()
+        self.assertEqual(2, self.tier.claimed)
+
+
+class RollupTest(TestCase):
+    def setUp(self):
+        from app.models import Project, User
+        self.user = User.objects.create(email='test@example.com')
+        self.backers = [User.objects.create(email='backer{}@example.com'.format(i)) for i in range(3)]
+        self.project = Project(title='Test', description='Test Project', goal=100, created_by=self.user)
+        self.project.publish()
+        self.project.save()
+
+    def test_record(self):
+        import datetime
+        from app import rollups
+        from app.importers import PledgeImporter
+        from app.models import DailyFunding, Pledge
+
+        today = rollups.day_of(datetime.datetime.now(datetime.timezone.utc))
+        self.backers[0].pledge(10, self.project)
+        self.backers[1].pledge(20, self.project)
+        self.assertEqual([(today, 30, 2)], list(self.project.daily_funding.values_list('day', 'amount', 'count')))
+
+        Pledge.objects.get(user=self.backers[0]).delete()
+        rows = [(1, {'email': self.backers[2].email, 'project': self.project.pk, 'amount': 5,
+                     'created_on': '2016-03-01T12:00:00+00:00'})]
+        PledgeImporter().run(rows)
+        expected = [(datetime.date(2016, 3, 1), 5, 1), (today, 20, 1)]
+        self.assertEqual(expected, list(self.project.daily_funding.order_by('day').values_list('day', 'amount', 'count')))
+
+        # A rebuild from the pledges comes to the same rows
+        DailyFunding.objects.all().delete()
+        self.assertEqual(2, rollups.rebuild())
+        self.assertEqual(expected, list(self.project.daily_funding.order_by('day').values_list('day', 'amount', 'count')))
+
+    def test_chart(self):
+        import datetime
+        from app import rollups
+        from app.models import DailyFunding
+        from django.core.urlresolvers import reverse
+
+        today = datetime.date(2016, 3, 1)
+        for days_ago, amount in [(100, 40), (3, 10), (0, 5)]:
+            DailyFunding.objects.create(project=self.project, day=today - datetime.timedelta(days=days_ago),
+                                        amount=amount, count=1)
+        self.project.pledged_total = 55
+        with self.assertNumQueries(1):
+            points = rollups.chart(self.project, 60, today=today)
+        self.assertEqual(60, len(points))
+        self.assertEqual((today - datetime.timedelta(days=59), 0, 0, 40), points[0])
+        self.assertEqual((today - datetime.timedelta(days=3), 10, 1, 50), points[-4])
+        self.assertEqual((today, 5, 1, 55), points[-1])
+
+        response = self.client.get(reverse('api_funding', args=[self.project.pk]), {'days': 7})
+        self.assertEqual(7, len(response.json()['days']))
+        self.assertEqual(400, self.client.get(reverse('api_funding', args=[self.project.pk]), {'days': 0}).status_code)
+
+
+class SessionTest(TestCase):
+    def setUp(self):
+        from app.models import User
+        from django.core.cache import caches
+        # The LocMemCache of the tests, see isolated_caches
+        caches['shared'].clear()
+        self.user = User.objects.create_user('test@example.com', 'password')
+
+    def auth_queries(self, path):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(200, self.client.get(path).status_code)
+        return [query['sql'] for query in context.captured_queries
+                if '"django_session"' in query['sql'] or query['sql'].startswith('SELECT "app_user"')]
+
+    def test_cached_user(self):
+        from django.core.urlresolvers import reverse
+        self.assertEqual([], self.auth_queries(reverse('discover')))
+
+        self.client.login(email='test@example.com', password='password')
+        self.auth_queries(reverse('index'))
+        self.assertEqual([], self.auth_queries(reverse('index')))
+
+        # Saving the user drops it from the cache
+        self.user.name = 'Test'
+        self.user.save()
+        self.assertEqual(1, len(self.auth_queries(reverse('profile'))))
+        self.assertEqual([], self.auth_queries(reverse('profile')))
+
+        # So a new password logs out the other sessions right away
+        self.user.set_password('new password')
+        self.user.save()
+        self.assertEqual(302, self.client.get(reverse('profile')).status_code)
+
+    def test_write_behind(self):
+        from app import sessions
+        from django.contrib.sessions.models import Session
+        from unittest import mock
+        with mock.patch.object(sessions, 'write_behind', True):
+            self.client.login(email='test@example.com', password='password')
+            key = self.client.session.session_key
+            self.assertIn('_auth_user_id', Session.objects.get(pk=key).get_decoded())
+
+            session = sessions.SessionStore(key)
+            session['theme'] = 'dark'
+            session.save()
+            self.assertEqual('dark', sessions.SessionStore(key)['theme'])
+            self.assertNotIn('theme', Session.objects.get(pk=key).get_decoded())
+            self.assertEqual(1, sessions.write_pending())
+            self.assertEqual('dark', Session.objects.get(pk=key).get_decoded()['theme'])
+
+            # A session the cache evicted before it was written isn't lost
+            session['theme'] = 'light'
+            session.save()
+            session._cache.delete(session.cache_key)
+            with self.assertLogs('app.sessions', 'WARNING'):
+                self.assertEqual(1, sessions.write_pending())
+            self.assertEqual('light', Session.objects.get(pk=key).get_decoded()['theme'])
+
+            # Logging out is written through
+            self.client.logout()
+            self.assertFalse(Session.objects.filter(pk=key).exists())
+
+        # Never with a cache every process has its own copy of
+        with self.settings(SESSION_WRITE_BEHIND_INTERVAL=30, SESSION_CACHE_ALIAS='default'):
+            with self.assertLogs('app.sessions', 'WARNING'):
+                self.assertIsNone(sessions.start_writer())
+        self.assertFalse(sessions.write_behind)
+
+
+class ProfileTest(TestCase):
+    def setUp(self):
+        from app.models import Project, RewardTier, User
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user('test@example.com', 'password')
+        self.creator = User.objects.create(email='creator@example.com')
+        self.projects = []
+        for i in range(3):
+            project = Project(title='Project {}'.format(i), description='Test', goal=100, created_by=self.creator)
+            project.publish()
+            project.save()
+            self.projects.append(project)
+        self.tier = RewardTier.objects.create(project=self.projects[0], description='Sticker', minimum_amount=5)
+
+    def test_totals(self):
+        from app.models import Pledge, User
+        self.user.pledge(10, self.projects[0], reward_tier=self.tier)
+        self.user.pledge(20, self.projects[1])
+        Pledge.objects.get(project=self.projects[1]).delete()
+        self.projects[2].delete()
+
+        # Saving a stale copy mustn't overwrite the totals
+        self.user.name = 'Test'
+        self.user.save()
+        self.assertEqual((10, 1, 0), User.objects.values_list('backed_total', 'backed_count', 'created_count')
+                         .get(pk=self.user.pk))
+        self.assertEqual(2, User.objects.get(pk=self.creator.pk).created_count)
+
+    def test_history(self):
+        from unittest import mock
+        from app import views
+        from django.core.urlresolvers import reverse
+        self.client.login(email='test@example.com', password='password')
+        self.user.pledge(10, self.projects[0], reward_tier=self.tier)
+        for project in self.projects[1:]:
+            self.user.pledge(20, project)
+        response = self.client.get(reverse('profile'))
+        self.assertContains(response, 'Sticker')
+        self.assertContains(response, '<strong>3</strong> projects backed')
+
+        # The totals come with the cached user, the history is a single query per page
+        with mock.patch.object(views, 'HISTORY_PAGE_SIZE', 2), self.assertNumQueries(1):
+            response = self.client.get(reverse('profile'))
+        self.assertEqual(['Project 2', 'Project 1'], [pledge.project.title for pledge in response.context['pledges']])
+        response = self.client.get(reverse('profile') + response.context['next_url'])
+        self.assertEqual(['Project 0'], [pledge.project.title for pledge in response.context['pledges']])
+
+
+class FeedTest(TestCase):
+    def setUp(self):
+        from app.models import Project, User
+        from django.core.cache import cache
+        cache.clear()
+        self.creator = User.objects.create_user('creator@example.com', 'password')
+        self.user = User.objects.create_user('test@example.com', 'password')
+        self.project = Project(title='Test', description='Test Project', goal=100, created_by=self.creator)
+        self.project.publish()
+        self.project.save()
+
+    def test_comments(self):
+        from app.models import Comment
+        from django.core.urlresolvers import reverse
+        Comment.objects.bulk_create(Comment(project=self.project, user=self.user, text='Comment {}'.format(i))
+                                    for i in range(25))
+        url = reverse('project_comments', args=[self.project.pk])
+        response = self.client.get(url)
+        self.assertEqual(20, len(response.context['comments']))
+        self.assertContains(response, 'Comment 24')
+        self.assertContains(response, 'Older comments &rarr;')
+        response = self.client.get(url + response.context['next_url'])
+        self.assertEqual(['Comment 4', 'Comment 3', 'Comment 2', 'Comment 1', 'Comment 0'],
+                         [comment.text for comment in response.context['comments']])
+
+        self.assertRedirects(self.client.post(url, {'text': 'Hi'}), reverse('login') + '?next=' + url,
+                             fetch_redirect_response=False)
+        self.client.login(email='test@example.com', password='password')
+        self.assertRedirects(self.client.post(url, {'text': 'Hi'}), url)
+        self.assertEqual('Hi', Comment.objects.filter(project=self.project).latest('id').text)
+
+    def test_backers_only(self):
+        from app.models import Pledge, Update
+        from django.core.urlresolvers import reverse
+        url = reverse('project_updates', args=[self.project.pk])
+        Update.objects.create(project=self.project, text='Thanks for backing!', backers_only=True)
+        Update.objects.create(project=self.project, text='We launched')
+        self.assertNotContains(self.client.get(url), 'Thanks for backing!')
+
+        self.client.login(email='test@example.com', password='password')
+        self.assertEqual(403, self.client.post(url, {'text': 'Spam'}).status_code)
+        self.client.get(url)
+        # Non-backers are answered from the cached filter
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertNotContains(response, 'Thanks for backing!')
+        self.assertContains(response, 'We launched')
+
+        # The filter catches up on the pledge, deleting it makes it rebuild
+        self.user.pledge(10, self.project)
+        self.assertContains(self.client.get(url), 'Thanks for backing!')
+        Pledge.objects.filter(user=self.user).delete()
+        self.assertNotContains(self.client.get(url), 'Thanks for backing!')
+
+        self.client.login(email='creator@example.com', password='password')
+        self.assertRedirects(self.client.post(url, {'text': 'Shipping soon', 'backers_only': 'on'}), url)
+        self.assertContains(self.client.get(url), 'Thanks for backing!')
+
+    def test_backer_filter(self):
+        from app import membership
+        from app.models import Project, User
+        backers = [User.objects.create(email='backer{}@example.com'.format(i)) for i in range(3)]
+        bloom = membership.backers(self.project)
+        self.assertNotIn(backers[0].pk, bloom)
+
+        # Pledges of this process go straight into the filter
+        pledge = backers[0].pledge(10, self.project)
+        membership.add_backer(self.project, pledge)
+        with self.assertNumQueries(0):
+            bloom = membership.backers(self.project)
+        self.assertIn(backers[0].pk, bloom)
+        self.assertEqual(pledge.pk, bloom.last_id)
+
+        # Others' are read from the last pledge the filter has on
+        later = [backer.pledge(10, self.project) for backer in backers[1:]]
+        project = Project.objects.get(pk=self.project.pk)
+        with self.assertNumQueries(1):
+            bloom = membership.backers(project)
+        self.assertTrue(all(backer.pk in bloom for backer in backers))
+        self.assertEqual(later[-1].pk, bloom.last_id)
+        self.assertEqual(project.version, bloom.version)
+
+    def test_bloom_filter(self):
+        from app.membership import BloomFilter
+        bloom = BloomFilter(1000)
+        for i in range(1000):
+            bloom.add(i)
+        self.assertTrue(all(i in bloom for i in range(1000)))
+        self.assertLess(sum(i in bloom for i in range(1000, 11000)), 300)
+
+
+class OutboxTest(TestCase):
+    def setUp(self):
+        from app.models import Project, User
+        self.creator = User.objects.create_user('creator@example.com', 'password')
+        self.project = Project(title='Test', description='Test Project', goal=100, created_by=self.creator)
+        self.project.publish()
+        self.project.save()
+        self.backers = [User.objects.create(email='backer{}@example.com'.format(i)) for i in range(5)]
+        for backer in self.backers:
+            backer.pledge(10, self.project)
+
+    def test_fan_out(self):
+        import io
+        from app import outbox
+        from app.models import Notification, OutboxEvent
+        from django.core.management import call_command
+        from django.core.urlresolvers import reverse
+
+        self.client.login(email='creator@example.com', password='password')
+        url = reverse('project_updates', args=[self.project.pk])
+        self.client.get(url)
+        # However many backers there are: the project, the update and its event, and a savepoint around them
+        with self.assertNumQueries(5):
+            self.client.post(url, {'text': 'Shipping soon'})
+        event = OutboxEvent.objects.get()
+        self.assertFalse(Notification.objects.exists())
+
+        self.assertEqual((1, 5), outbox.process(batch_size=2))
+        event.refresh_from_db()
+        self.assertEqual((5, self.backers[-1].pk), (event.delivered, event.position))
+        self.assertIsNotNone(event.processed_on)
+        self.assertEqual({backer.pk for backer in self.backers},
+                         set(Notification.objects.values_list('user', flat=True)))
+
+        stdout = io.StringIO()
+        call_command('process_outbox', stdout=stdout)
+        self.assertIn('Processed 0 event(s)', stdout.getvalue())
+        self.assertIn('Backlog: 0 event(s) pending, 0 failed', stdout.getvalue())
+
+    def test_retry(self):
+        from unittest import mock
+        from app import outbox
+        from app.models import Notification, OutboxEvent, Update
+
+        update = Update.objects.create(project=self.project, text='Shipping soon')
+        bulk_create = Notification.objects.bulk_create
+        calls = []
+
+        def failing_bulk_create(notifications):
+            calls.append(1)
+            if len(calls) == 2:
+                raise RuntimeError('Worker died')
+            return bulk_create(notifications)
+
+        with mock.patch.object(Notification.objects, 'bulk_create', failing_bulk_create), \
+                self.assertLogs('app.outbox', 'ERROR'):
+            self.assertEqual((0, 2), outbox.process(batch_size=2))
+        event = OutboxEvent.objects.get()
+        self.assertEqual((1, 2, None), (event.attempts, event.delivered, event.processed_on))
+
+        # The failed batch was rolled back together with its position, so the retry delivers it exactly once
+        self.assertEqual((1, 3), outbox.process(batch_size=2))
+        self.assertEqual(5, update.notifications.count())
+
+
+class DatabaseTest(TransactionTestCase):
+    def setUp(self):
+        from app.models import Project, User
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create(email='test@example.com')
+        self.project = Project(title='Replicated', description='Test Project', goal=100, created_by=self.user)
+        self.project.publish()
+        self.project.save()
+
+    def test_pragmas(self):
+        from app import db
+        from django.db import connection
+        with self.settings(SQLITE_PRAGMAS={'synchronous': 'normal', 'temp_store': 'memory'}):
+            db.apply_pragmas(connection)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(1, cursor.fetchone()[0])
+            cursor.execute('PRAGMA synchronous = full')
+
+    def test_replica(self):
+        from app.models import User
+        from django.core.urlresolvers import reverse
+        from django.db import connection, connections
+        from django.test.utils import CaptureQueriesContext
+
+        with self.settings(READ_REPLICA='replica'):
+            with CaptureQueriesContext(connection) as primary, CaptureQueriesContext(connections['replica']) as replica:
+                self.assertContains(self.client.get(reverse('view_project', args=[self.project.pk])), 'Replicated')
+            self.assertEqual([], primary.captured_queries)
+            self.assertTrue(replica.captured_queries)
+
+            # Everything else, and every write, goes to the primary
+            backer = User.objects.create(email='backer@example.com')
+            with CaptureQueriesContext(connections['replica']) as replica:
+                self.client.get(reverse('api_project', args=[self.project.pk]))
+                backer.pledge(10, self.project)
+            self.assertEqual([], replica.captured_queries)
+
+
+class LiveTest(TransactionTestCase):
+    def setUp(self):
+        from app import live
+        from app.models import Project, User
+        self.user = User.objects.create(email='test@example.com')
+        self.project = Project(title='Test', description='Test Project', goal=100, created_by=self.user)
+        self.project.publish()
+        self.project.save()
+        self.server = live.start(host='127.0.0.1', port=0, poll_interval=0.1)
+
+    def tearDown(self):
+        from app import live
+        live.stop()
+
+    def connect(self, path):
+        import socket
+        client = socket.create_connection(('127.0.0.1', self.server.port), timeout=5)
+        client.sendall('GET {} HTTP/1.1\r\nHost: localhost\r\n\r\n'.format(path).encode('ascii'))
+        return client
+
+    def next_event(self, client, buffer):
+        """Read until the next progress event and return its data, `buffer` holds what's left over."""
+        import json
+        while True:
+            if b'\n\n' in buffer[0]:
+                message, buffer[0] = buffer[0].split(b'\n\n', 1)
+                for line in message.decode('utf-8').splitlines():
+                    if line.startswith('data: '):
+                        return json.loads(line[len('data: '):])
+                continue
+            data = client.recv(4096)
+            self.assertTrue(data, 'Connection closed')
+            buffer[0] += data
+
+    def test_stream(self):
+        from app.models import Project, User
+        client = self.connect('/live/projects/{}'.format(self.project.pk))
+        buffer = [b'']
+        try:
+            data = self.next_event(client, buffer)
+            self.assertEqual((self.project.pk, 0, 0), (data['project'], data['backer_count'], data['pledged_total']))
+
+            # Pledges of this process are pushed...
+            User.objects.create(email='backer@example.com').pledge(10, self.project)
+            self.assertEqual(1, self.next_event(client, buffer)['backer_count'])
+            # ...everything else is picked up by polling
+            Project.objects.filter(pk=self.project.pk).bump_version(pledged_total=50, backer_count=2)
+            data = self.next_event(client, buffer)
+            self.assertEqual((2, 50, True), (data['backer_count'], data['pledged_total'], data['active']))
+        finally:
+            client.close()
+
+    def test_view(self):
+        from django.core.urlresolvers import reverse
+        url = reverse('view_project', args=[self.project.pk])
+        self.assertNotContains(self.client.get(url), 'data-live-url')
+        with self.settings(LIVE_URL='http://live.example.com'):
+            self.assertContains(
+                self.client.get(url), 'data-live-url="http://live.example.com/live/projects/{}"'.format(self.project.pk))
+
+    def test_not_found(self):
+        client = self.connect('/live/projects/{}'.format(self.project.pk + 1))
+        try:
+            self.assertTrue(client.recv(4096).startswith(b'HTTP/1.1 404'))
+        finally:
+            client.close()
+
+
+class AdminTest(TestCase):
+    def setUp(self):
+        from app.models import Project, User
+        self.admin = User.objects.create_superuser('admin@example.com', 'password')
+        self.user = User.objects.create(email='test@example.com')
+        self.projects = []
+        for goal in [10, 100, 1000]:
+            project = Project(title='Test', description='Test Project', goal=goal, created_by=self.user)
+            project.publish()
+            project.save()
+            self.projects.append(project)
+        self.draft = Project.objects.create(title='Draft', description='Test Project', goal=10, created_by=self.user)
+        self.client.force_login(self.admin)
+
+    def test_changelists(self):
+        from app.models import Project, User
+        from django.core.urlresolvers import reverse
+        for project in self.projects:
+            User.objects.create(email='backer{}@example.com'.format(project.pk)).pledge(50, project)
+
+        for name in ['user', 'project', 'pledge', 'rewardtier', 'comment', 'update']:
+            self.assertEqual(200, self.client.get(reverse('admin:app_{}_changelist'.format(name))).status_code)
+        self.assertEqual(200, self.client.get(reverse('admin:app_project_change', args=[self.draft.pk])).status_code)
+        self.assertEqual(200, self.client.get(reverse('admin:app_user_change', args=[self.user.pk])).status_code)
+
+        url = reverse('admin:app_pledge_changelist')
+        self.client.get(url)
+        # The estimate, the exact count of a small table and the page with its users and projects, no query per row
+        with self.assertNumQueries(3):
+            self.assertContains(self.client.get(url), '3 pledges')
+
+        # Drafts are filtered out, the most funded project comes first
+        response = self.client.get(reverse('admin:app_project_changelist'), {
+            'status__exact': Project.STATUS_ACTIVE, 'currency__exact': Project.CURRENCY_USD, 'o': '-7',
+        })
+        cl = response.context['cl']
+        self.assertEqual(['500%', '50%', '5%'], [cl.model_admin.funded(project) for project in cl.result_list])
+
+    def test_estimated_count(self):
+        from app import admin
+        from app.models import Pledge, User
+        from unittest import mock
+        for project in self.projects:
+            User.objects.create(email='backer{}@example.com'.format(project.pk)).pledge(50, project)
+        Pledge.objects.filter(project=self.projects[0]).delete()
+
+        pledges = Pledge.objects.order_by('pk')
+        self.assertEqual(2, admin.EstimatedCountPaginator(pledges, 10).count)
+        with mock.patch.object(admin, 'EXACT_COUNT_LIMIT', 0):
+            # One too many, for the deleted pledge
+            self.assertEqual(3, admin.EstimatedCountPaginator(pledges, 10).count)
+            self.assertEqual(1, admin.EstimatedCountPaginator(pledges.filter(project=self.projects[1]), 10).count)
+
+    def test_actions(self):
+        from app.models import Project, User
+        import datetime
+        from django.core.urlresolvers import reverse
+        User.objects.create(email='backer@example.com').pledge(50, self.projects[0])
+        url = reverse('admin:app_project_changelist')
+
+        def run(action, projects):
+            self.client.post(url, {'action': action, '_selected_action': [project.pk for project in projects]})
+            return [Project.objects.get(pk=project.pk) for project in projects]
+
+        draft, = run('publish', [self.draft])
+        self.assertEqual(Project.STATUS_ACTIVE, draft.status)
+        self.assertEqual(draft.published_on + datetime.timedelta(days=Project.DEFAULT_DURATION), draft.finishes_on)
+        self.assertEqual(self.draft.version + 1, draft.version)
+
+        successful, not_funded = run('expire', self.projects[:2])
+        self.assertEqual(Project.STATUS_SUCCESSFUL, successful.status)
+        self.assertEqual(Project.STATUS_NOT_FUNDED, not_funded.status)
 
-        project = Project.objects.first()
-        self.assertEqual(Project.STATUS_NOT_FUNDED, project.status)
\ No newline at end of file
+        # Only active projects and drafts can be canceled
+        not_funded, active = run('cancel', self.projects[1:])
+        self.assertEqual(Project.STATUS_NOT_FUNDED, not_funded.status)
+        self.assertEqual(Project.STATUS_CANCELED, active.status)
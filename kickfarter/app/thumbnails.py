@@ -0,0 +1,137 @@
+"""
+Resized derivatives of project cover images.
+
+When a cover image is uploaded, generate() is scheduled on a small worker
+pool so the request doesn't wait for Pillow. Derivatives are written next
+to the media files under names that only depend on the original's name
+and the size. They can be regenerated at any time and are never
+generated twice. Until they exist, Project.cover_thumbnails_ready is False
+and templates fall back to the original.
+"""
+import concurrent.futures
+import hashlib
+import io
+import logging
+import os
+import threading
+
+from app.models import Project
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+from django.utils.functional import LazyObject, empty
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# name: (width, height). The card sizes match .project-card__thumbnail
+SIZES = {
+    'card': (360, 235),
+    'card_2x': (720, 470),
+    'detail': (750, 420),
+    'detail_2x': (1500, 840),
+}
+
+
+class ThumbnailStorage(LazyObject):
+    """Set up on first use, like default_storage, so it follows MEDIA_ROOT when the tests change it."""
+
+    def _setup(self):
+        self._wrapped = FileSystemStorage(
+            location=os.path.join(settings.MEDIA_ROOT, 'thumbnails'),
+            base_url=settings.MEDIA_URL + 'thumbnails/',
+        )
+
+
+storage = ThumbnailStorage()
+
+
+@receiver(setting_changed)
+def reset_storage(setting, **kwargs):
+    if setting in ('MEDIA_ROOT', 'MEDIA_URL'):
+        storage._wrapped = empty
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _output_format():
+    Image.init()
+    return ('WEBP', 'webp') if 'WEBP' in Image.SAVE else ('JPEG', 'jpg')
+
+
+FORMAT, EXTENSION = _output_format()
+
+
+def thumbnail_name(name, size):
+    digest = hashlib.sha1(name.encode('utf-8')).hexdigest()
+    return '{}/{}-{}.{}'.format(digest[:2], digest[2:20], size, EXTENSION)
+
+
+def urls(name):
+    """URL of every derivative of the image `name`, by size."""
+    return {size: storage.url(thumbnail_name(name, size)) for size in SIZES}
+
+
+def generate(name):
+    """Write every missing derivative of the image `name` and mark the projects using it as ready."""
+    with default_storage.open(name) as original:
+        image = Image.open(original)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    if FORMAT == 'JPEG' and image.mode == 'RGBA':
+        image = image.convert('RGB')
+
+    for size, dimensions in SIZES.items():
+        path = storage.path(thumbnail_name(name, size))
+        if os.path.exists(path):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        buffer = io.BytesIO()
+        ImageOps.fit(image, dimensions, Image.LANCZOS).save(buffer, FORMAT, quality=80, optimize=True, progressive=True)
+        # Write to a temporary file first so readers never see half an image
+        temporary = '{}.{}.tmp'.format(path, threading.get_ident())
+        with open(temporary, 'wb') as f:
+            f.write(buffer.getvalue())
+        os.replace(temporary, path)
+
+    Project.objects.filter(cover_image=name, cover_thumbnails_ready=False).bump_version(cover_thumbnails_ready=True)
+
+
+def release(name):
+    """Drop a reference to the image `name`, and its derivatives once nothing refers to it anymore."""
+    default_storage.delete(name)
+    if not default_storage.exists(name):
+        for size in SIZES:
+            storage.delete(thumbnail_name(name, size))
+        try:
+            os.rmdir(os.path.dirname(storage.path(thumbnail_name(name, 'card'))))
+        except OSError:
+            pass  # Derivatives of other images share the directory
+
+
+def _run(name):
+    try:
+        generate(name)
+    except Exception:
+        logger.exception('Generating thumbnails of %s failed', name)
+    finally:
+        close_old_connections()
+
+
+def schedule(name):
+    """Generate the derivatives of `name` on the worker pool, or right away if THUMBNAIL_WORKERS is 0."""
+    global _executor
+    if not settings.THUMBNAIL_WORKERS:
+        _run(name)
+        return
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(max_workers=settings.THUMBNAIL_WORKERS)
+    _executor.submit(_run, name)
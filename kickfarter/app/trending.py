@@ -0,0 +1,116 @@
+"""
+Trending score of projects for the "Popular" feed.
+
+Every pledge contributes a weight that grows with the amount (damped so a
+single big backer can't buy the top spot) and halves every HALF_LIFE.
+Lots of recent pledges therefore beat a few old ones.
+
+Pledges add their full weight to Project.trending_score as they come in,
+and deleting one takes its weight off again. recompute() periodically
+rebuilds every score from the pledges of the last WINDOW, which applies
+the decay. The feed itself is just an index range scan over (status,
+trending_score).
+
+The decayed weights are summed up by SQLite, GROUP BY project, with the
+TRENDING_WEIGHT() function that install() registers on every connection.
+Reading them takes no write lock. The scores are then stored in batches,
+one short transaction each, so pledges never wait for the whole rebuild.
+
+Between two runs every score decays by the same factor, which keeps the
+order of the feed. So only projects whose score changed beyond that, by
+pledges leaving the WINDOW or coming in, move modified_on and with it the
+listing ETags. The version isn't bumped at all, cards don't show scores.
+"""
+import datetime
+import math
+
+from app.models import Pledge, Project, Stamp
+from django.db import connection, transaction
+from django.db.models import Case, F, FloatField, Func, Sum, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+HALF_LIFE = datetime.timedelta(hours=24)
+WINDOW = datetime.timedelta(days=7)  # pledges older than this weigh less than 1%
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def pledge_weight(amount):
+    return 1 + math.log1p(max(amount, 0))
+
+
+def decayed_weight(amount, age):
+    return pledge_weight(amount) * 0.5 ** (age / HALF_LIFE)
+
+
+def current_weight(amount, created_on, now):
+    """What a pledge counts for in its project's score as of `now`, the same as in recompute()."""
+    if created_on < now - WINDOW:
+        return 0
+    return decayed_weight(amount, max(now - created_on, datetime.timedelta(0)))
+
+
+def sql_weight(amount, age_seconds):
+    return decayed_weight(amount, datetime.timedelta(seconds=age_seconds))
+
+
+def install(connection):
+    if connection.vendor == 'sqlite':
+        connection.connection.create_function('TRENDING_WEIGHT', 2, sql_weight)
+
+
+def decayed_weights(now):
+    """The sum of the decayed weights of each active project's pledges of the last WINDOW before `now`."""
+    age = RawSQL('(julianday(%s) - julianday("app_pledge"."created_on")) * 86400',
+                 [connection.ops.adapt_datetimefield_value(now)])
+    weight = Func(F('amount'), age, function='TRENDING_WEIGHT', output_field=FloatField())
+    recent = Pledge.objects.filter(
+        created_on__gte=now - WINDOW, created_on__lte=now, project__status=Project.STATUS_ACTIVE)
+    return dict(recent.order_by().values('project').annotate(score=Sum(weight)).values_list('project', 'score'))
+
+
+def without_pledge(pledge, now=None):
+    """Expression for the project's score with a deleted pledge's weight taken off again."""
+    if not now:
+        now = datetime.datetime.now(datetime.timezone.utc)
+    return Greatest(F('trending_score') - decayed_weight(pledge.amount, now - pledge.created_on), Value(0))
+
+
+def recompute(now=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Rebuild the trending score of every project. Returns the number of projects with a score."""
+    if not now:
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+    scores = decayed_weights(now)
+    last_run = Stamp.objects.last(Stamp.TRENDING_RECOMPUTED)
+    decay = 0.5 ** ((now - last_run) / HALF_LIFE) if last_run else 1
+    stale = [pk for pk in Project.objects.filter(trending_score__gt=0).values_list('pk', flat=True).iterator()
+             if pk not in scores]
+
+    project_ids = list(scores) + stale
+    for start in range(0, len(project_ids), batch_size):
+        batch = project_ids[start:start + batch_size]
+        with transaction.atomic():
+            # Pledges that came in since `now` already added their weight, which the UPDATE
+            # below would overwrite. Writing first takes SQLite's write lock, so none can
+            # slip in between counting them and storing the scores.
+            Project.objects.filter(pk__in=batch).update(trending_score=F('trending_score'))
+            new = {pk: scores.get(pk, 0) for pk in batch}
+            latest = Pledge.objects.filter(project__in=batch, created_on__gt=now).values_list('project', 'amount')
+            for project_id, amount in latest:
+                new[project_id] += pledge_weight(amount)
+            stored = dict(Project.objects.filter(pk__in=batch).values_list('pk', 'trending_score'))
+            changed = [pk for pk, score in stored.items()
+                       if not math.isclose(new[pk], score * decay, rel_tol=1e-6, abs_tol=1e-9)]
+
+            Project.objects.filter(pk__in=batch).update(trending_score=Case(
+                *[When(pk=pk, then=Value(new[pk])) for pk in batch],
+                output_field=FloatField()
+            ))
+            if changed:
+                Project.objects.filter(pk__in=changed).update(modified_on=timezone.now())
+
+    Stamp.objects.touch(Stamp.TRENDING_RECOMPUTED, now)
+    return len(scores)
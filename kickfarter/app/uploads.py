@@ -0,0 +1,40 @@
+"""
+Streaming upload handling.
+
+HashingUploadHandler writes every uploaded file to a temporary file in
+chunks, hashing it on the way, so app.storage.ContentAddressedStorage
+can store it with a rename. Files over MAX_UPLOAD_SIZE or of a type not
+in UPLOAD_CONTENT_TYPES are not written at all past that point: the rest
+of their body is read and dropped, and app.forms.CoverImageField rejects
+them with a proper error message.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+        self.received = 0
+        self.rejected = (
+            self.content_type not in settings.UPLOAD_CONTENT_TYPES or
+            (self.content_length or 0) > settings.MAX_UPLOAD_SIZE
+        )
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.MAX_UPLOAD_SIZE:
+            self.rejected = True
+        if not self.rejected:
+            self.digest.update(raw_data)
+            self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        # file_size counts every byte received, so validation sees the real size
+        file = super().file_complete(file_size)
+        if not self.rejected:
+            file.sha256 = self.digest.hexdigest()
+        return file
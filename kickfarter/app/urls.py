@@ -1,3 +1,4 @@
+import app.api
 import app.views
 from django.conf.urls import url
 from django.conf.urls.static import static
@@ -13,6 +14,15 @@ urlpatterns = [
     url(r'^discover$', app.views.discover, name='discover'),
     url(r'^project/(?P<id>\d+)/edit$', app.views.edit_project, name='edit_project'),
     url(r'^project/(?P<id>\d+)$', app.views.view_project, name='view_project'),
+    url(r'^project/(?P<id>\d+)/comments$', app.views.project_comments, name='project_comments'),
+    url(r'^project/(?P<id>\d+)/updates$', app.views.project_updates, name='project_updates'),
+    url(r'^project/(?P<id>\d+)/backers\.csv$', app.views.export_backers, name='export_backers'),
+    url(r'^api/v1/projects$', app.api.projects, name='api_projects'),
+    url(r'^api/v1/projects/(?P<id>\d+)$', app.api.project, name='api_project'),
+    url(r'^api/v1/projects/(?P<id>\d+)/pledges$', app.api.pledge_stats, name='api_pledge_stats'),
+    url(r'^api/v1/projects/(?P<id>\d+)/funding$', app.api.funding, name='api_funding'),
+    url(r'^internal/metrics$', app.views.metrics_view, name='metrics'),
+    url(r'^internal/queries$', app.views.slow_queries, name='slow_queries'),
 ]
 
 if settings.DEBUG:
@@ -1,21 +1,121 @@
-from app.forms import UserCreationForm, LoginForm, ProjectForm
-from app.models import Project, RewardTier
+from app import exports, membership, metrics
+from app.cards import render_cards
+from app.exceptions import InvalidCursorException
+from app.forms import CommentForm, UserCreationForm, LoginForm, ProjectForm, RewardTierForm, UpdateForm
+from app.models import Comment, Pledge, Project, RewardTier, Stamp, Update
+from app.pagination import paginate
+from app.search import search
+from django.conf import settings
 from django.contrib.auth import authenticate, logout, login
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.core.exceptions import PermissionDenied
 from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
 from django.forms import inlineformset_factory
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.views.decorators.http import condition
 
+PAGE_SIZE = 24
+LISTING_ORDERING = ['-published_on', '-id']
+HISTORY_PAGE_SIZE = 50
+HISTORY_ORDERING = ['-created_on', '-id']
+FEED_PAGE_SIZE = 20
+FEED_ORDERING = ['-id']
+SORT_ORDERINGS = {
+    'new': LISTING_ORDERING,
+    'popular': ['-trending_score', '-id'],
+}
 
+
+def active_projects_page(request, ordering=LISTING_ORDERING):
+    try:
+        return paginate(
+            Project.objects.active().for_listing(),
+            ordering,
+            cursor=request.GET.get('cursor'),
+            page_size=PAGE_SIZE,
+        )
+    except InvalidCursorException:
+        raise Http404()
+
+
+def next_page_url(request, page):
+    """The current URL with the cursor of the next page, keeping every other parameter."""
+    if not page.has_next:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = page.next_cursor
+    return '?' + params.urlencode()
+
+
+def listing_stamp(request):
+    """
+    When the listings last changed: the newest of when any project was
+    last changed, when one was last deleted and when the last campaign
+    that's still ACTIVE ended, since active() stops listing it right then.
+    Cards show their creator, so renaming a user changes their projects
+    too (see app.signals.user_renamed). Each is an index lookup. Looked up once per request, it's needed for
+    the ETag and Last-Modified.
+    """
+    if not hasattr(request, '_listing_stamp'):
+        ended = Project.objects.filter(status=Project.STATUS_ACTIVE, finishes_on__lte=timezone.now())
+        changes = [
+            Project.objects.aggregate(modified_on=Max('modified_on'))['modified_on'],
+            Stamp.objects.last(Stamp.PROJECT_DELETED),
+            ended.order_by('-finishes_on').values_list('finishes_on', flat=True).first(),
+        ]
+        request._listing_stamp = max((change for change in changes if change is not None), default=None)
+    return request._listing_stamp
+
+
+def listing_etag(request):
+    stamp = listing_stamp(request)
+    if stamp is None:
+        return None
+    # Pages show who's logged in
+    return 'listing-{:f}-{}'.format(stamp.timestamp(), request.user.pk or 0)
+
+
+def listing_last_modified(request):
+    # Last-Modified can't tell users apart, so only anonymous pages get one
+    if request.user.is_authenticated():
+        return None
+    return listing_stamp(request)
+
+
+@condition(etag_func=listing_etag, last_modified_func=listing_last_modified)
 def index(request):
-    projects = Project.objects.filter(status=Project.STATUS_ACTIVE)
-    return render(request, 'app/index.html', context={'projects': projects})
+    projects = active_projects_page(request)
+    return render(request, 'app/index.html', context={
+        'projects': projects,
+        'cards': render_cards(projects),
+        'next_url': next_page_url(request, projects),
+    })
 
 
+@condition(etag_func=listing_etag, last_modified_func=listing_last_modified)
 def discover(request):
-    projects = Project.objects.filter(status=Project.STATUS_ACTIVE)
-    return render(request, 'app/discover.html', context={'projects': projects})
+    query = request.GET.get('q', '').strip()
+    sort = request.GET.get('sort', 'new')
+    if query:
+        try:
+            projects = search(query, cursor=request.GET.get('cursor'), page_size=PAGE_SIZE)
+        except InvalidCursorException:
+            raise Http404()
+    else:
+        projects = active_projects_page(request, SORT_ORDERINGS.get(sort, LISTING_ORDERING))
+
+    return render(request, 'app/discover.html', context={
+        'query': query,
+        'sort': sort,
+        'projects': projects,
+        'cards': render_cards(projects),
+        'next_url': next_page_url(request, projects),
+    })
 
 
 def signup(request):
@@ -58,14 +158,61 @@ def logout_view(request):
 
 @login_required
 def profile(request):
-    projects_created = request.user.projects_created.all()
-    pledges = request.user.pledges.all()
+    """
+    The user's stored totals, their newest projects and a page of their
+    backing history. Every page of the history is one joined query over the
+    (user, created_on) index, no matter how many pledges the user has.
+    """
+    projects_created = []
+    if request.user.created_count:
+        projects_created = request.user.projects_created.for_listing().order_by('-id')[:PAGE_SIZE]
+    history = Pledge.objects.filter(user=request.user).select_related('project', 'chosen_reward_tier').only(
+        'amount', 'created_on', 'project__title', 'project__status', 'project__currency',
+        'chosen_reward_tier__description', 'chosen_reward_tier__minimum_amount',
+    )
+    try:
+        pledges = paginate(history, HISTORY_ORDERING, cursor=request.GET.get('cursor'), page_size=HISTORY_PAGE_SIZE)
+    except InvalidCursorException:
+        raise Http404()
+
     return render(request, 'app/user/profile.html', context={
-        'projects_created': projects_created,
+        'cards': render_cards(projects_created),
         'pledges': pledges,
+        'next_url': next_page_url(request, pledges),
     })
 
 
+def project_stamp(request, id):
+    """
+    (version, modified_on) of the project, looked up once per request. None
+    if there's no such project or it's a draft the user can't see, so that
+    the view itself answers with its 404 or 403 instead of a 304. Renaming
+    the creator bumps both, see app.signals.user_renamed.
+    """
+    if not hasattr(request, '_project_stamp'):
+        row = Project.objects.filter(pk=id).values_list('version', 'modified_on', 'status', 'created_by').first()
+        if row is not None and row[2] == Project.STATUS_DRAFT and not (
+                request.user.is_authenticated() and (request.user.pk == row[3] or request.user.is_superuser)):
+            row = None
+        request._project_stamp = row and row[:2]
+    return request._project_stamp
+
+
+def project_etag(request, id):
+    stamp = project_stamp(request, id)
+    if stamp is None:
+        return None
+    return 'project-{}-{}-{}'.format(id, stamp[0], request.user.pk or 0)
+
+
+def project_last_modified(request, id):
+    stamp = project_stamp(request, id)
+    if stamp is None or request.user.is_authenticated():
+        return None
+    return stamp[1]
+
+
+@condition(etag_func=project_etag, last_modified_func=project_last_modified)
 def view_project(request, id):
     """ Show the project if
     1. it is not a draft
@@ -73,7 +220,7 @@ def view_project(request, id):
     else 404
     """
     project = get_object_or_404(Project, pk=id)
-    num_backers = len(project.pledges.all())
+    num_backers = project.backer_count
 
     if project.is_draft:
         if request.user.is_authenticated() and (request.user == project.created_by or request.user.is_superuser):
@@ -81,6 +228,7 @@ def view_project(request, id):
                 'project': project,
                 'num_backers': num_backers,
                 'reward_tiers': project.reward_tiers.all(),
+                'live_url': settings.LIVE_URL,
             })
         else:
             raise PermissionDenied()
@@ -89,19 +237,98 @@ def view_project(request, id):
             'project': project,
             'num_backers': num_backers,
             'reward_tiers': project.reward_tiers.all(),
+            'live_url': settings.LIVE_URL,
         })
 
 
+def is_creator(user, project):
+    return user.is_authenticated() and (user.pk == project.created_by_id or user.is_superuser)
+
+
+def visible_project(request, id):
+    """The project, unless it's a draft and the user isn't its creator."""
+    project = get_object_or_404(Project, pk=id)
+    if project.is_draft and not is_creator(request.user, project):
+        raise PermissionDenied()
+    return project
+
+
+def feed_page(request, queryset):
+    """A page of comments or updates, newest first, over the (project, id) index."""
+    try:
+        return paginate(queryset, FEED_ORDERING, cursor=request.GET.get('cursor'), page_size=FEED_PAGE_SIZE)
+    except InvalidCursorException:
+        raise Http404()
+
+
+def project_comments(request, id):
+    """The comments on a project, newest first. Logged in users can add their own."""
+    project = visible_project(request, id)
+    form = CommentForm()
+    if request.method == 'POST':
+        if not request.user.is_authenticated():
+            return redirect_to_login(request.get_full_path())
+        form = CommentForm(request.POST)
+        if form.is_valid():
+            form.instance.project = project
+            form.instance.user = request.user
+            form.save()
+            return redirect(reverse('project_comments', args=[project.pk]))
+
+    comments = feed_page(request, Comment.objects.filter(project=project).select_related('user'))
+    return render(request, 'app/project/comments.html', context={
+        'project': project,
+        'comments': comments,
+        'form': form,
+        'next_url': next_page_url(request, comments),
+    })
+
+
+def project_updates(request, id):
+    """
+    The updates of a project, newest first. Backers-only updates are shown
+    to backers and the creator, who is also the one posting updates.
+    """
+    project = visible_project(request, id)
+    creator = is_creator(request.user, project)
+    form = UpdateForm()
+    if request.method == 'POST':
+        if not creator:
+            raise PermissionDenied()
+        form = UpdateForm(request.POST)
+        if form.is_valid():
+            form.instance.project = project
+            # Together with the outbox event that notifies the backers
+            with transaction.atomic():
+                form.save()
+            return redirect(reverse('project_updates', args=[project.pk]))
+
+    updates = feed_page(request, Update.objects.filter(project=project))
+    # Asked once per page, and only when there's something to hide
+    show_backers_only = (
+        creator or not any(update.backers_only for update in updates) or
+        membership.is_backer(request.user, project)
+    )
+    return render(request, 'app/project/updates.html', context={
+        'project': project,
+        'updates': updates,
+        'show_backers_only': show_backers_only,
+        'form': form if creator else None,
+        'next_url': next_page_url(request, updates),
+    })
+
+
 @login_required
 def start_project(request):
     RewardTierFormSet = inlineformset_factory(
         parent_model=Project,
         model=RewardTier,
-        fields=('minimum_amount', 'description'),
+        form=RewardTierForm,
         extra=1,
     )
     if request.method == 'POST':
         form = ProjectForm(request.POST, request.FILES)
+        reward_tier_formset = RewardTierFormSet(request.POST, request.FILES)
         if form.is_valid():
             form.instance.created_by = request.user
             project = form.save()
@@ -124,7 +351,7 @@ def edit_project(request, id):
         RewardTierFormSet = inlineformset_factory(
             parent_model=Project,
             model=RewardTier,
-            fields=('minimum_amount', 'description'),
+            form=RewardTierForm,
             extra=0,
             can_delete=project.is_draft,
         )
@@ -150,5 +377,31 @@ def edit_project(request, id):
         raise PermissionDenied()
 
 
+@login_required
+def export_backers(request, id):
+    """The backers of a project as CSV, for its creator to fulfil the rewards."""
+    project = get_object_or_404(Project, pk=id)
+    if request.user != project.created_by and not request.user.is_superuser:
+        raise PermissionDenied()
+
+    response = StreamingHttpResponse(exports.backers_csv(project.pk), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="backers-{}.csv"'.format(project.pk)
+    return response
+
+
+def metrics_view(request):
+    """Aggregated request metrics of the worker answering, in the Prometheus text format. Staff only."""
+    if not request.user.is_staff:
+        raise PermissionDenied()
+    return HttpResponse(metrics.registry.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def slow_queries(request):
+    """The slowest and most repeated SQL statements of sampled requests. Staff only."""
+    if not request.user.is_staff:
+        raise PermissionDenied()
+    return JsonResponse(metrics.registry.queries_report())
+
+
 def error(request):
-    return render(request, 'app/error/404.html')
+    return render(request, 'app/error/404.html', status=404)
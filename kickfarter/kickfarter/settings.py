@@ -42,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE_CLASSES = [
+    'app.metrics.RequestMetricsMiddleware',
+    'app.db.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,7 +58,7 @@ ROOT_URLCONF = 'kickfarter.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'app.metrics.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -83,6 +85,84 @@ DATABASES = {
     }
 }
 
+# Only read from when READ_REPLICA says so, a second connection to the same file unless DATABASE_REPLICA is set
+DATABASES['replica'] = dict(
+    DATABASES['default'],
+    NAME=os.getenv('DATABASE_REPLICA', DATABASES['default']['NAME']),
+    TEST={'MIRROR': 'default'},
+)
+
+# Applied to every new SQLite connection by app.db.apply_pragmas()
+SQLITE_PRAGMAS = {}
+
+# Alias the views in REPLICA_VIEWS read from, see app/db.py. None reads everything from the primary.
+READ_REPLICA = None
+REPLICA_VIEWS = ['index', 'discover', 'view_project']
+DATABASE_ROUTERS = ['app.db.ReplicaRouter']
+
+# DATABASE_PROFILE=production: WAL, persistent connections and a replica connection for the read-heavy views.
+if os.getenv('DATABASE_PROFILE') == 'production':
+    for database in DATABASES.values():
+        database.update({
+            'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', 600)),
+            # Seconds a connection waits for another one's write lock
+            'OPTIONS': {'timeout': 20},
+        })
+    READ_REPLICA = 'replica'
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'wal',
+        # A power loss can cost the last commits but, in WAL mode, never the database's consistency
+        'synchronous': 'normal',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,  # KiB
+        'temp_store': 'memory',
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/1.9/topics/cache/
+
+CACHES = {
+    # Local to each process. Only for entries that are never invalidated, like the versioned ones below.
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Shared by every process on the host, so deleting an entry in one worker reaches all of them.
+    # Point it at memcached or redis once there's more than one host. The tests replace it with a
+    # LocMemCache (see app/tests.py), so they never touch the sessions of a running server.
+    'shared': {
+        'BACKEND': os.getenv('SHARED_CACHE_BACKEND', 'app.caching.FileBasedCache'),
+        'LOCATION': os.getenv('SHARED_CACHE_LOCATION', os.path.join(BASE_DIR, '../cache')),
+        'KEY_PREFIX': 'kickfarter',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+}
+
+# Rendered project cards. Keys carry the project version so they never need to be deleted.
+PROJECT_CARD_CACHE = 'default'
+PROJECT_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Backers of each project, to show backers-only updates (see app/membership.py). Filters catch up on new pledges themselves.
+BACKER_CACHE = 'default'
+BACKER_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Logged in users, looked up by app.auth.CachedModelBackend. Entries are deleted whenever a user is saved.
+USER_CACHE = 'shared'
+USER_CACHE_TIMEOUT = 60 * 60
+
+
+# Sessions
+# https://docs.djangoproject.com/en/1.9/topics/http/sessions/
+
+# Read from the cache and written through to the database (see app/sessions.py). Set
+# SESSION_WRITE_BEHIND_INTERVAL to write changes other than logins and logouts every this many
+# seconds instead, from a background thread of the WSGI process.
+SESSION_ENGINE = 'app.sessions'
+SESSION_CACHE_ALIAS = 'shared'
+SESSION_WRITE_BEHIND_INTERVAL = int(os.getenv('SESSION_WRITE_BEHIND_INTERVAL', 0)) or None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.9/ref/settings/#auth-password-validators
@@ -122,9 +202,39 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, '../static')
+# Fingerprinted names and .gz siblings, served by app.assets.PrecompressedStaticFiles (see wsgi.py)
+STATICFILES_STORAGE = 'app.assets.CompressedManifestStaticFilesStorage'
 
 AUTH_USER_MODEL = 'app.User'
+AUTHENTICATION_BACKENDS = ['app.auth.CachedModelBackend']
 LOGIN_URL = '/login'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, '../media')
+
+# Uploads are stored once per distinct content, see app/storage.py
+DEFAULT_FILE_STORAGE = 'app.storage.ContentAddressedStorage'
+FILE_UPLOAD_HANDLERS = ['app.uploads.HashingUploadHandler']
+MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', 10 * 1024 * 1024))
+UPLOAD_CONTENT_TYPES = ['image/jpeg', 'image/png', 'image/gif', 'image/webp']
+
+# Threads resizing uploaded cover images in the background (0 resizes within the request)
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 2))
+
+# Fraction of requests whose queries and timings are recorded by app.metrics.RequestMetricsMiddleware
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', 0.05))
+
+# Finish expired campaigns from a background thread of the WSGI process every this many seconds.
+# Leave unset when `manage.py expire_projects` runs from cron instead.
+EXPIRY_SWEEP_INTERVAL = int(os.getenv('EXPIRY_SWEEP_INTERVAL', 0)) or None
+
+# Same for recomputing the trending scores behind the "Popular" feed (`manage.py update_trending`)
+TRENDING_INTERVAL = int(os.getenv('TRENDING_INTERVAL', 0)) or None
+
+# Live funding progress (app/live.py), served next to the WSGI app on this port. Leave unset to turn it off.
+LIVE_HOST = os.getenv('LIVE_HOST', '127.0.0.1')
+LIVE_PORT = int(os.getenv('LIVE_PORT', 0)) or None
+# Seconds between checks for pledges made by other processes
+LIVE_POLL_INTERVAL = float(os.getenv('LIVE_POLL_INTERVAL', 2))
+# Where browsers reach the live server, e.g. "//live.example.com" or "" behind a proxy that routes /live/ to it
+LIVE_URL = os.getenv('LIVE_URL')
@@ -13,4 +13,19 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "kickfarter.settings")
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+# Serve collectstatic's output in front of Django, see app/assets.py. Imported
+# here because it needs the settings.
+from app.assets import PrecompressedStaticFiles  # noqa: E402
+application = PrecompressedStaticFiles(application)
+
+# Expiry, trending and session write-behind threads, if the settings turn them on
+from app.sweeper import start_periodic_tasks  # noqa: E402
+start_periodic_tasks()
+
+# Live funding progress over Server-Sent Events on its own port, see app/live.py
+from django.conf import settings  # noqa: E402
+if settings.LIVE_PORT:
+    from app import live
+    live.start()